@@ -0,0 +1,78 @@
+"""add ingest job tables
+
+Revision ID: 3b7f0c9d1e52
+Revises: e91f4a6c2d83
+Create Date: 2026-10-19 17:41:08.204316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7f0c9d1e52'
+down_revision: Union[str, Sequence[str], None] = 'e91f4a6c2d83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('total_sources', sa.Integer(), nullable=False),
+        sa.Column('requested_by', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # At most one unfinished job
+    op.create_index(
+        'ux_ingest_jobs_unfinished',
+        'ingest_jobs',
+        [sa.text('(finished_at IS NULL)')],
+        unique=True,
+        postgresql_where=sa.text('finished_at IS NULL'),
+    )
+    op.create_table(
+        'ingest_job_sources',
+        sa.Column('job_id', sa.UUID(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('source_key', sa.String(), nullable=False),
+        sa.Column('source', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('worker', sa.String(), nullable=True),
+        sa.Column('available_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('unchanged', sa.Boolean(), nullable=True),
+        sa.Column('chunks_written', sa.Integer(), nullable=True),
+        sa.Column('chunks_kept', sa.Integer(), nullable=True),
+        sa.Column('chunks_deleted', sa.Integer(), nullable=True),
+        sa.Column('chunks_collapsed', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['ingest_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('job_id', 'position'),
+    )
+    # Workers claim from the open sources only
+    op.create_index(
+        'ix_ingest_job_sources_open',
+        'ingest_job_sources',
+        ['job_id', 'position'],
+        postgresql_where=sa.text("state IN ('pending', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ingest_job_sources_open', table_name='ingest_job_sources')
+    op.drop_table('ingest_job_sources')
+    op.drop_index('ux_ingest_jobs_unfinished', table_name='ingest_jobs')
+    op.drop_table('ingest_jobs')
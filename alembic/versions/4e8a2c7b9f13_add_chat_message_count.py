@@ -0,0 +1,29 @@
+"""add chat message count
+
+Revision ID: 4e8a2c7b9f13
+Revises: 9d4b1e6a3c57
+Create Date: 2026-10-20 09:42:31.815274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8a2c7b9f13'
+down_revision: Union[str, Sequence[str], None] = '9d4b1e6a3c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULL for existing chats: their first delta turn reads the checkpoint once
+    op.add_column('chats', sa.Column('message_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chats', 'message_count')
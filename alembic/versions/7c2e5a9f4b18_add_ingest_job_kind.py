@@ -0,0 +1,50 @@
+"""add ingest job kind
+
+Revision ID: 7c2e5a9f4b18
+Revises: 3b7f0c9d1e52
+Create Date: 2026-10-19 21:12:45.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e5a9f4b18'
+down_revision: Union[str, Sequence[str], None] = '3b7f0c9d1e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing jobs all ran over the manifest
+    op.add_column(
+        'ingest_jobs',
+        sa.Column('kind', sa.String(), nullable=False, server_default='manifest'),
+    )
+    op.alter_column('ingest_jobs', 'kind', server_default=None)
+    # Only manifest jobs are exclusive; upload jobs queue alongside them
+    op.drop_index('ux_ingest_jobs_unfinished', table_name='ingest_jobs')
+    op.create_index(
+        'ux_ingest_jobs_unfinished',
+        'ingest_jobs',
+        [sa.text('(finished_at IS NULL)')],
+        unique=True,
+        postgresql_where=sa.text("finished_at IS NULL AND kind = 'manifest'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_ingest_jobs_unfinished', table_name='ingest_jobs')
+    op.create_index(
+        'ux_ingest_jobs_unfinished',
+        'ingest_jobs',
+        [sa.text('(finished_at IS NULL)')],
+        unique=True,
+        postgresql_where=sa.text('finished_at IS NULL'),
+    )
+    op.drop_column('ingest_jobs', 'kind')
@@ -0,0 +1,42 @@
+"""add chat_messages transcript
+
+Revision ID: 7c3e9a1f5b24
+Revises: 20d6473e1b48
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e9a1f5b24'
+down_revision: Union[str, Sequence[str], None] = '20d6473e1b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing chats are backfilled lazily from their checkpoint on first read
+    op.create_table(
+        'chat_messages',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('chat_id', sa.UUID(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('message_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        # Also serves newest-first pages: WHERE chat_id = ? AND seq < ? ORDER BY seq DESC
+        sa.UniqueConstraint('chat_id', 'seq', name='uq_chat_messages_chat_id_seq'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('chat_messages')
@@ -0,0 +1,34 @@
+"""add ingest deferred indexes
+
+Revision ID: 9d4b1e6a3c57
+Revises: 7c2e5a9f4b18
+Create Date: 2026-10-19 23:05:17.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b1e6a3c57'
+down_revision: Union[str, Sequence[str], None] = '7c2e5a9f4b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingest_deferred_indexes',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('definition', sa.Text(), nullable=False),
+        sa.Column('dropped_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ingest_deferred_indexes')
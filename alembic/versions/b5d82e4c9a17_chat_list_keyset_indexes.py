@@ -0,0 +1,61 @@
+"""chat list keyset indexes
+
+Revision ID: b5d82e4c9a17
+Revises: 7c3e9a1f5b24
+Create Date: 2026-10-19 11:47:05.602931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d82e4c9a17'
+down_revision: Union[str, Sequence[str], None] = '7c3e9a1f5b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so the chats table stays writable during the deploy
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chats_user_id_created_at',
+            'chats',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_include=['title', 'updated_at'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_chats_user_id_updated_at',
+            'chats',
+            ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')],
+            postgresql_include=['title', 'created_at'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # user_id lookups are served by the leading column of the new indexes
+        op.drop_index(
+            'ix_chats_user_id',
+            table_name='chats',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chats_user_id',
+            'chats',
+            ['user_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index('ix_chats_user_id_updated_at', table_name='chats', postgresql_concurrently=True)
+        op.drop_index('ix_chats_user_id_created_at', table_name='chats', postgresql_concurrently=True)
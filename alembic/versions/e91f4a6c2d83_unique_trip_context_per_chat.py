@@ -0,0 +1,47 @@
+"""unique trip context per chat
+
+Revision ID: e91f4a6c2d83
+Revises: b5d82e4c9a17
+Create Date: 2026-10-19 14:03:22.915470
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91f4a6c2d83'
+down_revision: Union[str, Sequence[str], None] = 'b5d82e4c9a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The old select-then-insert path could race and leave duplicates; keep the
+    # most recently updated row per chat
+    op.execute(
+        """
+        DELETE FROM trip_contexts t
+        USING (
+            SELECT id, row_number() OVER (
+                PARTITION BY chat_id ORDER BY updated_at DESC, created_at DESC, id
+            ) AS rn
+            FROM trip_contexts
+        ) ranked
+        WHERE t.id = ranked.id AND ranked.rn > 1
+        """
+    )
+    op.create_index(
+        op.f('ix_trip_contexts_chat_id'),
+        'trip_contexts',
+        ['chat_id'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_trip_contexts_chat_id'), table_name='trip_contexts')
@@ -68,3 +68,15 @@ async def get_authenticated_user(
             detail=NOT_AUTHORIZED,
         )
     return user
+
+
+async def get_admin_user(
+    user: dict = Depends(get_authenticated_user),
+) -> dict:
+    """A signed-in user listed in ADMIN_USER_IDS"""
+    if user["user_id"] not in settings["admin_user_ids"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=NOT_AUTHORIZED,
+        )
+    return user
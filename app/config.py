@@ -1,10 +1,12 @@
-from typing import TypedDict, Optional
+from typing import Literal, TypedDict, Optional, get_args
 from dotenv import load_dotenv
 import os
 
 # loading environment variables
 load_dotenv()
 
+CheckpointSerde = Literal["zstd", "jsonplus"]
+
 
 class Settings(TypedDict):
     openai_apikey: str
@@ -15,8 +17,79 @@ class Settings(TypedDict):
     tavily_apikey: str
     clerk_secretKey: str
     clerk_publishablekey: str
+    # Clerk user ids allowed to upload documents (ADMIN_USER_IDS, comma-separated)
+    admin_user_ids: frozenset[str]
     database_url: str
 
+    # LLM scheduler budgets (see app/lib/scheduler.py)
+    llm_tpm_limit: int
+    llm_rpm_limit: int
+    llm_max_concurrency: int
+    llm_max_queue: int
+    # Retries of a failed chat call or query embedding, each through the scheduler
+    llm_max_retries: int
+
+    # Connections reserved for per-thread run locks (see app/lib/runs.py)
+    run_lock_pool_size: int
+
+    # LangGraph checkpoint durability: "sync" | "async" | "exit" (see app/lib/provider.py)
+    checkpoint_durability: str
+    # Checkpoint blob serializer (see app/lib/checkpoint_serde.py)
+    checkpoint_serde: CheckpointSerde
+
+    # Checkpoint retention (see app/lib/retention.py)
+    retention_keep_checkpoints: int
+    retention_anon_ttl_hours: float
+    retention_interval_seconds: int
+    retention_batch_size: int
+    retention_batch_pause: float
+
+    # In-process trip context cache (see app/lib/trip_context_cache.py)
+    trip_context_cache_size: int
+    trip_context_cache_ttl: float
+
+    # Ingestion embedding batches (see app/lib/rag/vectorstore.py)
+    embed_batch_tokens: int
+    embed_batch_max_items: int
+    embed_concurrency: int
+    embed_max_retries: int
+
+    # Ingestion process pool size, 0 = one per core but one (see app/lib/workers.py)
+    ingest_process_workers: int
+
+    # On-disk ingestion cache, "" to disable (see app/lib/rag/ingestion/cache.py)
+    ingest_cache_dir: str
+    ingest_cache_extracts_mb: int
+    ingest_cache_vectors_mb: int
+    # Seconds a cached page is used without revalidating it with the server
+    ingest_cache_page_ttl: float
+
+    # Word-shingle Jaccard at which a chunk from another source is collapsed into
+    # an existing one, 0 to disable (see app/lib/rag/ingestion/dedup.py)
+    ingest_dedup_jaccard: float
+    # New chunks one source may have; a changed source holds them all until
+    # they are embedded, so this caps its memory. Over it the source fails, 0 = no cap
+    ingest_max_source_chunks: int
+
+    # Source list ingested by default (see app/lib/rag/ingestion/manifest.py)
+    ingest_manifest: str
+
+    # Ingestion job queue (see app/lib/rag/ingestion/jobs.py). Seconds between
+    # polls when idle, 0 = this process runs no ingestion worker
+    ingest_worker_poll_seconds: float
+    # Sources a worker claims and runs through one pipeline at a time
+    ingest_job_batch_size: int
+    # A claim not renewed for this long is taken over by another worker
+    ingest_job_lease_seconds: int
+    ingest_job_max_attempts: int
+
+    # Where documents uploaded through the admin API are kept; ingestion
+    # workers outside the API need it on a shared volume (see
+    # app/lib/rag/ingestion/uploads.py)
+    ingest_upload_dir: str
+    # Largest upload request, all its files together
+    ingest_upload_max_mb: int
+
 
 def get_settings() -> Settings:
 
@@ -26,8 +99,44 @@ def get_settings() -> Settings:
     tavily_apikey = os.getenv("TAVILY_API_KEY")
     clerk_secretKey = os.getenv("CLERK_SECRET_KEY")
     clerk_publishablekey = os.getenv("CLERK_PUBLISHABLE_KEY")
+    admin_user_ids = frozenset(
+        user_id.strip() for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()
+    )
     database_url = os.getenv("DATABASE_URL")
     rapid_apihost = os.getenv("RAPIDAPI_HOST")
+    llm_tpm_limit = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+    llm_rpm_limit = int(os.getenv("LLM_RPM_LIMIT", "500"))
+    llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    llm_max_queue = int(os.getenv("LLM_MAX_QUEUE", "64"))
+    llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    run_lock_pool_size = int(os.getenv("RUN_LOCK_POOL_SIZE", "20"))
+    checkpoint_durability = os.getenv("CHECKPOINT_DURABILITY", "exit")
+    checkpoint_serde = os.getenv("CHECKPOINT_SERDE", "zstd")
+    retention_keep_checkpoints = int(os.getenv("RETENTION_KEEP_CHECKPOINTS", "3"))
+    retention_anon_ttl_hours = float(os.getenv("RETENTION_ANON_TTL_HOURS", "24"))
+    retention_interval_seconds = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    retention_batch_size = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+    retention_batch_pause = float(os.getenv("RETENTION_BATCH_PAUSE", "0.5"))
+    trip_context_cache_size = int(os.getenv("TRIP_CONTEXT_CACHE_SIZE", "10000"))
+    trip_context_cache_ttl = float(os.getenv("TRIP_CONTEXT_CACHE_TTL", "300"))
+    embed_batch_tokens = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+    embed_batch_max_items = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "512"))
+    embed_concurrency = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    embed_max_retries = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+    ingest_process_workers = int(os.getenv("INGEST_PROCESS_WORKERS", "0"))
+    ingest_cache_dir = os.getenv("INGEST_CACHE_DIR", ".cache/ingest")
+    ingest_cache_extracts_mb = int(os.getenv("INGEST_CACHE_EXTRACTS_MB", "256"))
+    ingest_cache_vectors_mb = int(os.getenv("INGEST_CACHE_VECTORS_MB", "1024"))
+    ingest_cache_page_ttl = float(os.getenv("INGEST_CACHE_PAGE_TTL", "86400"))
+    ingest_dedup_jaccard = float(os.getenv("INGEST_DEDUP_JACCARD", "0.8"))
+    ingest_max_source_chunks = int(os.getenv("INGEST_MAX_SOURCE_CHUNKS", "20000"))
+    ingest_manifest = os.getenv("INGEST_MANIFEST", "scripts/sources.jsonl")
+    ingest_worker_poll_seconds = float(os.getenv("INGEST_WORKER_POLL_SECONDS", "5"))
+    ingest_job_batch_size = int(os.getenv("INGEST_JOB_BATCH_SIZE", "8"))
+    ingest_job_lease_seconds = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "600"))
+    ingest_job_max_attempts = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+    ingest_upload_dir = os.getenv("INGEST_UPLOAD_DIR", "data/uploads")
+    ingest_upload_max_mb = int(os.getenv("INGEST_UPLOAD_MAX_MB", "200"))
 
     if not openai_apikey:
         raise ValueError("No openai api key found in environment variables")
@@ -41,6 +150,38 @@ def get_settings() -> Settings:
         raise ValueError("No Clerk publishable key found in environment variables")
     if not database_url:
         raise ValueError("No Database URL found in environment variables")
+    if llm_max_retries < 0:
+        raise ValueError("LLM_MAX_RETRIES must be 0 or more")
+    if checkpoint_durability not in ("sync", "async", "exit"):
+        raise ValueError("CHECKPOINT_DURABILITY must be one of: sync, async, exit")
+    if checkpoint_serde not in get_args(CheckpointSerde):
+        raise ValueError(f"CHECKPOINT_SERDE must be one of: {', '.join(get_args(CheckpointSerde))}")
+    if retention_keep_checkpoints < 1:
+        raise ValueError("RETENTION_KEEP_CHECKPOINTS must be at least 1")
+    # OpenAI caps one embeddings request at 300k tokens and 2048 inputs
+    if not 0 < embed_batch_tokens <= 300000:
+        raise ValueError("EMBED_BATCH_TOKENS must be between 1 and 300000")
+    if not 0 < embed_batch_max_items <= 2048:
+        raise ValueError("EMBED_BATCH_MAX_ITEMS must be between 1 and 2048")
+    if embed_concurrency < 1:
+        raise ValueError("EMBED_CONCURRENCY must be at least 1")
+    if ingest_process_workers < 0:
+        raise ValueError("INGEST_PROCESS_WORKERS must be 0 (auto) or more")
+    if ingest_cache_extracts_mb < 1 or ingest_cache_vectors_mb < 1:
+        raise ValueError("INGEST_CACHE_EXTRACTS_MB and INGEST_CACHE_VECTORS_MB must be at least 1")
+    if not 0 <= ingest_dedup_jaccard <= 1:
+        raise ValueError("INGEST_DEDUP_JACCARD must be between 0 (disabled) and 1")
+    if ingest_max_source_chunks < 0:
+        raise ValueError("INGEST_MAX_SOURCE_CHUNKS must be 0 (no cap) or more")
+    if ingest_worker_poll_seconds < 0:
+        raise ValueError("INGEST_WORKER_POLL_SECONDS must be 0 (no worker) or more")
+    if ingest_job_batch_size < 1 or ingest_job_max_attempts < 1:
+        raise ValueError("INGEST_JOB_BATCH_SIZE and INGEST_JOB_MAX_ATTEMPTS must be at least 1")
+    # The lease is renewed every third of it
+    if ingest_job_lease_seconds < 30:
+        raise ValueError("INGEST_JOB_LEASE_SECONDS must be at least 30")
+    if ingest_upload_max_mb < 1:
+        raise ValueError("INGEST_UPLOAD_MAX_MB must be at least 1")
     # Normalize to plain postgresql:// so each consumer can add its own driver
     for prefix in ("postgresql+psycopg2://", "postgresql+asyncpg://"):
         if database_url.startswith(prefix):
@@ -57,6 +198,40 @@ def get_settings() -> Settings:
         "tavily_apikey": tavily_apikey,
         "clerk_secretKey": clerk_secretKey,
         "clerk_publishablekey": clerk_publishablekey,
+        "admin_user_ids": admin_user_ids,
         "database_url": database_url,
         "rapid_apihost": rapid_apihost,
+        "llm_tpm_limit": llm_tpm_limit,
+        "llm_rpm_limit": llm_rpm_limit,
+        "llm_max_concurrency": llm_max_concurrency,
+        "llm_max_queue": llm_max_queue,
+        "llm_max_retries": llm_max_retries,
+        "run_lock_pool_size": run_lock_pool_size,
+        "checkpoint_durability": checkpoint_durability,
+        "checkpoint_serde": checkpoint_serde,
+        "retention_keep_checkpoints": retention_keep_checkpoints,
+        "retention_anon_ttl_hours": retention_anon_ttl_hours,
+        "retention_interval_seconds": retention_interval_seconds,
+        "retention_batch_size": retention_batch_size,
+        "retention_batch_pause": retention_batch_pause,
+        "trip_context_cache_size": trip_context_cache_size,
+        "trip_context_cache_ttl": trip_context_cache_ttl,
+        "embed_batch_tokens": embed_batch_tokens,
+        "embed_batch_max_items": embed_batch_max_items,
+        "embed_concurrency": embed_concurrency,
+        "embed_max_retries": embed_max_retries,
+        "ingest_process_workers": ingest_process_workers,
+        "ingest_cache_dir": ingest_cache_dir,
+        "ingest_cache_extracts_mb": ingest_cache_extracts_mb,
+        "ingest_cache_vectors_mb": ingest_cache_vectors_mb,
+        "ingest_cache_page_ttl": ingest_cache_page_ttl,
+        "ingest_dedup_jaccard": ingest_dedup_jaccard,
+        "ingest_max_source_chunks": ingest_max_source_chunks,
+        "ingest_manifest": ingest_manifest,
+        "ingest_worker_poll_seconds": ingest_worker_poll_seconds,
+        "ingest_job_batch_size": ingest_job_batch_size,
+        "ingest_job_lease_seconds": ingest_job_lease_seconds,
+        "ingest_job_max_attempts": ingest_job_max_attempts,
+        "ingest_upload_dir": ingest_upload_dir,
+        "ingest_upload_max_mb": ingest_upload_max_mb,
     }
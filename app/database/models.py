@@ -1,7 +1,7 @@
 import enum
 import uuid
-from sqlalchemy import Column, String, DateTime, Enum, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Boolean, Column, String, DateTime, Enum, ForeignKey, Index, Integer, Text, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database.base import Base
@@ -20,7 +20,7 @@ class Chat(Base):
     __tablename__ = "chats"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)
     title = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
     updated_at = Column(
@@ -29,12 +29,63 @@ class Chat(Base):
         default=utcnow,
         onupdate=utcnow,
     )
+    # Messages in the thread's checkpoint after its last completed turn; NULL
+    # while a run is in flight or after one failed (see routers/chat.py)
+    message_count = Column(Integer, nullable=True)
     trip_context = relationship(
         "TripContext",
         back_populates="chat",
         uselist=False,
         cascade="all, delete-orphan",
     )
+    messages = relationship(
+        "ChatMessage",
+        back_populates="chat",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    # Chat list keyset pages, one per sort order. INCLUDE makes them covering, so a
+    # sidebar page is an index-only scan however many chats the user has.
+    __table_args__ = (
+        Index(
+            "ix_chats_user_id_created_at",
+            user_id,
+            created_at.desc(),
+            id.desc(),
+            postgresql_include=["title", "updated_at"],
+        ),
+        Index(
+            "ix_chats_user_id_updated_at",
+            user_id,
+            updated_at.desc(),
+            id.desc(),
+            postgresql_include=["title", "created_at"],
+        ),
+    )
+
+
+class ChatMessage(Base):
+    """Transcript of a chat, mirrored from the checkpoint at the end of each run"""
+
+    __tablename__ = "chat_messages"
+    __table_args__ = (UniqueConstraint("chat_id", "seq", name="uq_chat_messages_chat_id_seq"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    chat_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("chats.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # Position in the thread's message list, starting at 0
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    # LangChain message id, to tell a rewritten position from an unchanged one
+    message_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+
+    chat = relationship("Chat", back_populates="messages")
 
 
 class TripContext(Base):
@@ -45,6 +96,9 @@ class TripContext(Base):
         UUID(as_uuid=True),
         ForeignKey("chats.id", ondelete="CASCADE"),
         nullable=False,
+        # One trip context per chat; also the ON CONFLICT target for upserts
+        unique=True,
+        index=True,
     )
 
     ui_language = Column(Enum(Language), default=Language.EN)
@@ -71,3 +125,95 @@ class TripContext(Base):
     )
 
     chat = relationship("Chat", back_populates="trip_context")
+
+
+class IngestJob(Base):
+    """One ingestion run over a list of sources, worked through by ingestion workers"""
+
+    __tablename__ = "ingest_jobs"
+    __table_args__ = (
+        # At most one unfinished manifest job: replicas share it instead of
+        # ingesting side by side. Upload jobs queue alongside it.
+        Index(
+            "ux_ingest_jobs_unfinished",
+            text("(finished_at IS NULL)"),
+            unique=True,
+            postgresql_where=text("finished_at IS NULL AND kind = 'manifest'"),
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # manifest | upload
+    kind = Column(String, nullable=False, default="manifest")
+    # queued | running | done | failed
+    state = Column(String, nullable=False, default="queued")
+    total_sources = Column(Integer, nullable=False)
+    requested_by = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    sources = relationship(
+        "IngestJobSource",
+        back_populates="job",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+
+class IngestJobSource(Base):
+    """One source of an ingestion job: claim state, attempts, timings and outcome"""
+
+    __tablename__ = "ingest_job_sources"
+    __table_args__ = (
+        # Claims only scan the sources still open, however long the job's history
+        Index(
+            "ix_ingest_job_sources_open",
+            "job_id",
+            "position",
+            postgresql_where=text("state IN ('pending', 'running')"),
+        ),
+    )
+
+    job_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("ingest_jobs.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Order in the job's source list; sources are claimed in this order
+    position = Column(Integer, primary_key=True)
+    source_key = Column(String, nullable=False)
+    # The source definition, as in the manifest (scripts/sources.jsonl)
+    source = Column(JSONB, nullable=False)
+    # pending | running | done | failed
+    state = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String, nullable=True)
+    # When the source can be claimed again: end of the claiming worker's lease,
+    # or of the delay before retrying a failed attempt
+    available_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    unchanged = Column(Boolean, nullable=True)
+    chunks_written = Column(Integer, nullable=True)
+    chunks_kept = Column(Integer, nullable=True)
+    chunks_deleted = Column(Integer, nullable=True)
+    chunks_collapsed = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+    job = relationship("IngestJob", back_populates="sources")
+
+
+class DeferredIndex(Base):
+    """A langchain_pg_embedding index a bulk load dropped, kept until it is rebuilt.
+
+    Rows outlive a load that dies before rebuilding; the next writer or API
+    start recreates the index (see app/lib/rag/ingestion/writer.py).
+    """
+
+    __tablename__ = "ingest_deferred_indexes"
+
+    name = Column(String, primary_key=True)
+    # CREATE INDEX statement, from pg_get_indexdef
+    definition = Column(Text, nullable=False)
+    dropped_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
@@ -0,0 +1,65 @@
+import math
+from typing import Any
+
+import zstandard
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from app.config import CheckpointSerde
+
+# Blob layout for the compressed type: MAGIC + format version byte + zstd frame.
+# Bump the version byte (and branch in _decode) if the layout ever changes.
+_MAGIC = b"AZ"
+_FORMAT_VERSION = 1
+_HEADER = _MAGIC + bytes([_FORMAT_VERSION])
+
+
+class CompressedSerializer(SerializerProtocol):
+    """JsonPlus msgpack encoding with zstd compression on top.
+
+    Blobs written before this serializer existed keep their original type tag
+    ("msgpack", "json", "null", ...) and are decoded by the wrapped serializer,
+    so existing checkpoints stay readable.
+    """
+
+    TYPE = "msgpack+zstd"
+
+    def __init__(self, level: int = 3, min_size: float = 256):
+        self.inner = JsonPlusSerializer()
+        self.level = level
+        # Tiny values (flags, short strings) don't compress; skip the frame overhead
+        self.min_size = min_size
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.inner.dumps_typed(obj)
+        if type_ != "msgpack" or len(data) < self.min_size:
+            return type_, data
+        return self.TYPE, _HEADER + zstandard.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ == self.TYPE:
+            return self.inner.loads_typed(("msgpack", _decode(payload)))
+        return self.inner.loads_typed(data)
+
+
+def _decode(payload: bytes) -> bytes:
+    if payload[:2] != _MAGIC:
+        raise ValueError("Not a compressed checkpoint blob")
+    version = payload[2]
+    if version == 1:
+        return zstandard.decompress(payload[3:])
+    raise ValueError(f"Unsupported checkpoint blob format version: {version}")
+
+
+def get_checkpoint_serde(name: CheckpointSerde) -> SerializerProtocol:
+    """Serializer for the checkpointer: "zstd" (compressed) or "jsonplus" (LangGraph default).
+
+    Both read either format. "jsonplus" writes plain msgpack but still decodes
+    the blobs written under "zstd", so switching back doesn't strand threads.
+    """
+    if name == "zstd":
+        return CompressedSerializer()
+    if name == "jsonplus":
+        return CompressedSerializer(min_size=math.inf)
+    raise ValueError(f"Unknown checkpoint serializer: {name}")
@@ -1,9 +1,12 @@
 import json
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import StreamWriter
 
-from app.lib.llm import chat_model
+from app.lib.llm import ainvoke_chat
+from app.lib.scheduler import Priority
 from app.lib.graph.state import State
+from app.lib.graph.utils import is_authenticated
 
 
 def _build_conversation_context(messages: list, last_n_pairs: int = 3) -> str:
@@ -23,7 +26,7 @@ def _build_conversation_context(messages: list, last_n_pairs: int = 3) -> str:
     return "\n".join(recent) if recent else ""
 
 
-async def classify_query(state: State, writer: StreamWriter):
+async def classify_query(state: State, writer: StreamWriter, config: RunnableConfig):
     """Figure out what kind of question this is"""
 
     retry_count = state.get("retry_count", 0)
@@ -153,7 +156,11 @@ async def classify_query(state: State, writer: StreamWriter):
     IMPORTANT: Output ONLY the JSON object with no markdown formatting.
     """
 
-    response = await chat_model.ainvoke([HumanMessage(content=prompt)])
+    response = await ainvoke_chat(
+        [HumanMessage(content=prompt)],
+        Priority.INTERACTIVE,
+        authenticated=is_authenticated(config),
+    )
 
     raw = response.content
     content = (raw if isinstance(raw, str) else " ".join(str(p) for p in raw)).strip()
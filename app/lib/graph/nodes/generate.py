@@ -1,9 +1,12 @@
 import json
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import StreamWriter
 
-from app.lib.llm import chat_model
+from app.lib.llm import ainvoke_chat, astream_chat
+from app.lib.scheduler import Priority
 from app.lib.graph.state import State
+from app.lib.graph.utils import is_authenticated
 from app.lib.rag import (
     format_rag_sources,
     format_web_sources,
@@ -115,7 +118,7 @@ When referencing specific policies or rules, briefly indicate where the info com
     return messages
 
 
-async def generate_response(state: State, writer: StreamWriter):
+async def generate_response(state: State, writer: StreamWriter, config: RunnableConfig):
     """Generate and stream response token by token directly from OpenAI"""
     retry_count = state.get("retry_count", 0)
     print(
@@ -129,9 +132,10 @@ async def generate_response(state: State, writer: StreamWriter):
     })
 
     messages = build_response_messages(state)
+    authenticated = is_authenticated(config)
 
     full_text = ""
-    async for chunk in chat_model.astream(messages):
+    async for chunk in astream_chat(messages, Priority.INTERACTIVE, authenticated=authenticated):
         token = chunk.content
         if isinstance(token, str) and token:
             writer(token)
@@ -147,8 +151,10 @@ async def generate_response(state: State, writer: StreamWriter):
             "Return ONLY a JSON array of 3 strings with no other text.\n"
             'Example: ["What documents do I need?", "How long does it take?", "Are there any fees?"]'
         )
-        suggestions_response = await chat_model.ainvoke(
-            [HumanMessage(content=suggestions_prompt)]
+        suggestions_response = await ainvoke_chat(
+            [HumanMessage(content=suggestions_prompt)],
+            Priority.BACKGROUND,
+            authenticated=authenticated,
         )
         raw = suggestions_response.content
         raw_text = (raw if isinstance(raw, str) else " ".join(str(p) for p in raw)).strip()
@@ -161,7 +167,7 @@ async def generate_response(state: State, writer: StreamWriter):
         if isinstance(suggestions, list):
             writer({"type": "suggestions", "suggestions": suggestions[:3]})
     except Exception:
-        pass  # suggestions are non-critical, never fail the response
+        pass  # suggestions are non-critical (and shed first under load), never fail the response
 
     ai_msg = AIMessage(content=full_text)
     return {"messages": [ai_msg]}
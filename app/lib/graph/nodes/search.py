@@ -1,6 +1,8 @@
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import StreamWriter
 
-from app.lib.graph.state import State
+from app.lib.graph.state import SourceTask
+from app.lib.graph.utils import is_authenticated
 from app.lib.rag import (
     retrieve_web_results,
     retrieve_rag_results,
@@ -8,7 +10,7 @@ from app.lib.rag import (
 )
 
 
-async def web_search(state: State, writer: StreamWriter):
+async def web_search(state: SourceTask, writer: StreamWriter):
     writer({"type": "thought", "content": "Searching the web...", "phase": "search"})
 
     query = state.get("query")
@@ -30,17 +32,25 @@ async def web_search(state: State, writer: StreamWriter):
     }
 
 
-async def rag_search(state: State, writer: StreamWriter):
+async def rag_search(state: SourceTask, writer: StreamWriter, config: RunnableConfig):
     writer({"type": "thought", "content": "Searching knowledge base...", "phase": "knowledge"})
 
     query = state["query"]
     trip_context = state.get("trip_context")
-    results = await retrieve_rag_results(query, trip_context=trip_context)
+    results = await retrieve_rag_results(
+        query, trip_context=trip_context, authenticated=is_authenticated(config)
+    )
 
     if results:
         writer({"type": "thought", "content": f"Found {len(results)} relevant documents", "phase": "knowledge"})
         return {"sources_used": ["rag"], "rag_results": results}
 
+    if state.get("needs_web_search"):
+        # web_search runs the same query in this step; a second search would only
+        # race it for web_results
+        writer({"type": "thought", "content": "No KB matches, using the web results", "phase": "knowledge"})
+        return {"sources_used": ["rag"], "rag_results": []}
+
     # No KB results — fall back to web search
     writer({"type": "thought", "content": "No KB matches, searching the web...", "phase": "search"})
     trip_context = state.get("trip_context")
@@ -54,7 +64,7 @@ async def rag_search(state: State, writer: StreamWriter):
     }
 
 
-async def visa_search(state: State, writer: StreamWriter):
+async def visa_search(state: SourceTask, writer: StreamWriter):
     writer(
         {"type": "thought", "content": "Checking visa requirements...", "phase": "visa"}
     )
@@ -1,21 +1,28 @@
 from langgraph.types import Send
 
-from app.lib.graph.state import State
+from app.lib.graph.state import State, SourceTask
 
 
 def dispatch_sources(state: State):
     """Route to appropriate search nodes based on classification"""
+    # Branches only get the query and trip context, not the message history
+    task: SourceTask = {
+        "query": state.get("query"),
+        "trip_context": state.get("trip_context"),
+        "needs_web_search": bool(state.get("needs_web_search")),
+    }
+
     tasks = []
     if state.get("needs_visa_api"):
-        tasks.append(Send("visa_search", state))
+        tasks.append(Send("visa_search", task))
 
     if state.get("needs_web_search"):
-        tasks.append(Send("web_search", state))
+        tasks.append(Send("web_search", task))
 
     if state.get("needs_rag"):
-        tasks.append(Send("rag_search", state))
+        tasks.append(Send("rag_search", task))
 
     if not tasks:
-        return Send("generate_response", state)
+        return "generate_response"
 
     return tasks
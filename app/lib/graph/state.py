@@ -1,5 +1,6 @@
 from typing import TypedDict, Annotated, Optional, Dict
 from langchain_core.messages import BaseMessage
+from langgraph.channels.untracked_value import UntrackedValue
 from langgraph.graph.message import add_messages
 
 from app.database.models import TripContext
@@ -32,7 +33,20 @@ class State(TypedDict):
 
     sources_used: Annotated[list[str], merge_sources]
 
-    # results container for each method
-    rag_results: Optional[list[dict]]
-    web_results: Optional[Dict]
-    visa_results: Optional[Dict]
+    # results container for each method. Untracked channels live only for the
+    # run and are never written to checkpoints; nothing reads them after
+    # generate_response. Each has one writer per step (rag_search's web fallback
+    # only runs when web_search wasn't dispatched), so a second write is a bug
+    # and raises rather than silently replacing the first.
+    rag_results: Annotated[Optional[list[dict]], UntrackedValue(list)]
+    web_results: Annotated[Optional[Dict], UntrackedValue(dict)]
+    visa_results: Annotated[Optional[Dict], UntrackedValue(dict)]
+
+
+class SourceTask(TypedDict):
+    """What dispatch_sources hands each search branch: only the fields they read"""
+
+    query: Optional[str]
+    trip_context: Optional[TripContext]
+    # web_search runs alongside: rag_search leaves the web to it
+    needs_web_search: bool
@@ -1,8 +1,16 @@
 from langchain_core.messages import HumanMessage
-from app.lib.llm import chat_model
+from langchain_core.runnables import RunnableConfig
 
+from app.lib.llm import ainvoke_chat
+from app.lib.scheduler import LLMOverloaded, Priority
 
-async def generate_chat_title(message: str) -> str:
+
+def is_authenticated(config: RunnableConfig) -> bool:
+    """Whether the run belongs to a signed-in user (set by the chat router)"""
+    return bool(config.get("configurable", {}).get("authenticated", False))
+
+
+async def generate_chat_title(message: str, authenticated: bool = True) -> str:
     """Generate a concise title from the first user message"""
     prompt = f"""
     Generate a short, descriptive title (max 6 words) for a chat that starts with this message:
@@ -15,6 +23,13 @@ async def generate_chat_title(message: str) -> str:
     - "Help me pack for Paris" → "Paris Packing Guide"
     """
 
-    response = chat_model.invoke([HumanMessage(content=prompt)])
+    try:
+        response = await ainvoke_chat(
+            [HumanMessage(content=prompt)],
+            Priority.BACKGROUND,
+            authenticated=authenticated,
+        )
+    except LLMOverloaded:
+        return "New Chat"
     title = response.content.strip().strip('"').strip("'")
     return title[:60]
@@ -1,5 +1,11 @@
+import asyncio
+import itertools
+from typing import AsyncIterator
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
 from langchain_openai import ChatOpenAI
 from app.config import get_settings
+from app.lib.scheduler import RETRYABLE_ERRORS, Priority, estimate_tokens, retry_delay, scheduler
 
 settings = get_settings()
 
@@ -8,4 +14,66 @@ chat_model = ChatOpenAI(
     api_key=settings["openai_apikey"],
     temperature=0.8,
     model=settings["openai_model"],
+    # Retried below, each attempt through the scheduler
+    max_retries=0,
 )
+
+# Completion allowance reserved up front, corrected from usage metadata afterwards
+_COMPLETION_ESTIMATE = {
+    Priority.INTERACTIVE: 800,
+    Priority.BACKGROUND: 60,
+    Priority.BULK: 0,
+}
+
+
+def _message_texts(messages: list) -> list[str]:
+    texts = []
+    for msg in messages:
+        content = msg.content if isinstance(msg, BaseMessage) else msg.get("content", "")
+        texts.append(content if isinstance(content, str) else str(content))
+    return texts
+
+
+async def ainvoke_chat(
+    messages: list,
+    priority: Priority = Priority.INTERACTIVE,
+    authenticated: bool = True,
+) -> AIMessage:
+    """Run chat_model.ainvoke through the LLM scheduler"""
+    tokens = estimate_tokens(_message_texts(messages), _COMPLETION_ESTIMATE[priority])
+    for attempt in itertools.count():
+        try:
+            async with scheduler.slot(tokens, priority, authenticated) as grant:
+                response = await chat_model.ainvoke(messages)
+                usage = response.usage_metadata
+                grant.record_usage(usage["total_tokens"] if usage else None)
+                return response
+        except RETRYABLE_ERRORS as e:
+            if attempt >= settings["llm_max_retries"]:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
+
+
+async def astream_chat(
+    messages: list,
+    priority: Priority = Priority.INTERACTIVE,
+    authenticated: bool = True,
+) -> AsyncIterator[AIMessageChunk]:
+    """Stream chat_model output through the LLM scheduler, holding one slot for the whole stream"""
+    tokens = estimate_tokens(_message_texts(messages), _COMPLETION_ESTIMATE[priority])
+    for attempt in itertools.count():
+        streamed = False
+        try:
+            async with scheduler.slot(tokens, priority, authenticated) as grant:
+                async for chunk in chat_model.astream(messages):
+                    # The final chunk carries usage when stream_usage is on (default for OpenAI)
+                    if chunk.usage_metadata:
+                        grant.record_usage(chunk.usage_metadata["total_tokens"])
+                    streamed = True
+                    yield chunk
+            return
+        except RETRYABLE_ERRORS as e:
+            # Chunks already handed out can't be taken back
+            if streamed or attempt >= settings["llm_max_retries"]:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
@@ -0,0 +1,58 @@
+"""
+Page-level PDF text extraction, run in the ingestion process pool.
+
+Pages with a text layer are read directly with pypdf; only pages without one
+(scans, text flattened into images) go through unstructured's OCR. Kept out
+of app.lib.rag so pool workers import nothing but pypdf.
+"""
+
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+# A page with fewer extracted characters than this is treated as scanned.
+# Catches blank text layers and stray page numbers/watermarks over an image.
+MIN_TEXT_CHARS = 20
+
+
+def extract_text_layer(file_path: str) -> tuple[list[tuple[int, str]], list[int]]:
+    """Read every page's text layer.
+
+    Returns (page number, text) for the pages that have one, and the numbers
+    of the pages that need OCR. Page numbers start at 1.
+    """
+    reader = PdfReader(file_path)
+    pages, scanned = [], []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            # Broken content stream; OCR renders the page instead of parsing it
+            text = ""
+        if len(text.strip()) < MIN_TEXT_CHARS:
+            scanned.append(number)
+        else:
+            pages.append((number, text))
+    return pages, scanned
+
+
+def ocr_page(file_path: str, number: int) -> str:
+    """OCR one page (1-based) of a PDF with unstructured"""
+    try:
+        from unstructured.partition.pdf import partition_pdf
+    except ImportError as e:
+        raise RuntimeError(
+            "OCR of scanned PDF pages requires the 'ingestion' "
+            "(unstructured[docx,pdf]) to be installed. "
+            "Run: uv sync --group ingestion"
+        ) from e
+
+    # Hand unstructured a one-page PDF so it renders only the page we need
+    writer = PdfWriter()
+    writer.add_page(PdfReader(file_path).pages[number - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+
+    elements = partition_pdf(file=buffer, strategy="ocr_only")
+    return "\n\n".join(str(element) for element in elements if str(element).strip())
@@ -1,8 +1,14 @@
 import asyncio
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
 
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
 from psycopg_pool import AsyncConnectionPool
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.types import Durability
 from app.config import get_settings
+from app.lib.checkpoint_serde import get_checkpoint_serde
 from app.lib.graph import workflow
 
 settings = get_settings()
@@ -19,8 +25,56 @@ CONNECTION_KWARGS = {
     "keepalives_count": 5,
 }
 
+# When checkpoints hit Postgres during a run:
+#   "sync"  - after every step, before the next one starts (5+ blocking round trips per message)
+#   "async" - after every step, in the background while the next step runs
+#   "exit"  - once, with the final state, when the run ends (or is cancelled/fails)
+# Chat only ever reads the final state of a turn, so "exit" is the default.
+#
+# A run superseded by a newer one on its thread (app/lib/runs.py) has its
+# checkpoint writes dropped from then on, by _RunCheckpointer. Under "exit"
+# that is all of them, so it leaves the thread as it found it: its question
+# without an answer is never saved. Under "sync" and "async" the steps it
+# finished before being superseded, its input included, are already saved.
+CHECKPOINT_DURABILITY: Durability = settings["checkpoint_durability"]
+
+# The run (app.lib.runs.Run) whose graph the current task is executing
+active_run: ContextVar[Optional[Any]] = ContextVar("active_run", default=None)
+
+
+def _superseded() -> bool:
+    run = active_run.get()
+    return run is not None and run.superseded
+
+
+class _RunCheckpointer(AsyncPostgresSaver):
+    """Postgres checkpointer that drops the writes of superseded runs"""
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if _superseded():
+            return config
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if _superseded():
+            return
+        await super().aput_writes(config, writes, task_id, task_path)
+
 _graph_instance = None
 _pool_instance = None
+_lock_pool_instance = None
 _ping_task = None
 
 
@@ -28,16 +82,17 @@ async def _keep_pool_alive():
     """Ping the pool every 4 min so Neon never sees a 5-min idle connection."""
     while True:
         await asyncio.sleep(_NEON_IDLE_TIMEOUT)
-        if _pool_instance:
-            try:
-                await _pool_instance.check()
-            except Exception as e:
-                print(f"Pool health check failed: {e}")
+        for pool in (_pool_instance, _lock_pool_instance):
+            if pool:
+                try:
+                    await pool.check()
+                except Exception as e:
+                    print(f"Pool health check failed: {e}")
 
 
 # graph initializer
 async def initialize_graph():
-    global _graph_instance, _pool_instance, _ping_task
+    global _graph_instance, _pool_instance, _lock_pool_instance, _ping_task
 
     db_uri = settings["database_url"]
     print(f"Initializing graph with database...")
@@ -54,9 +109,24 @@ async def initialize_graph():
     await _pool_instance.open()
     print("Pool opened")
 
+    # Separate pool: each signed-in run holds a connection for its advisory lock,
+    # which must never starve the checkpointer
+    _lock_pool_instance = AsyncConnectionPool(
+        conninfo=db_uri,
+        min_size=1,
+        max_size=settings["run_lock_pool_size"],
+        kwargs=CONNECTION_KWARGS,
+        max_idle=_NEON_IDLE_TIMEOUT,
+        reconnect_timeout=10,
+        open=False,
+    )
+    await _lock_pool_instance.open()
+
     _ping_task = asyncio.create_task(_keep_pool_alive())
 
-    checkpointer = AsyncPostgresSaver(_pool_instance)
+    checkpointer = _RunCheckpointer(
+        _pool_instance, serde=get_checkpoint_serde(settings["checkpoint_serde"])
+    )
     print("Setting up checkpointer...")
     await checkpointer.setup()
     print("Checkpointer ready")
@@ -64,14 +134,16 @@ async def initialize_graph():
     _graph_instance = workflow.compile(checkpointer=checkpointer)
     mermaid_code = _graph_instance.get_graph().draw_mermaid()
     print(mermaid_code)
-    print("Graph compiled successfully!")
+    print(f"Graph compiled successfully! (checkpoint durability: {CHECKPOINT_DURABILITY})")
 
 
 # Closing graph
 async def shutdown_graph():
-    global _pool_instance, _ping_task
+    global _pool_instance, _lock_pool_instance, _ping_task
     if _ping_task:
         _ping_task.cancel()
+    if _lock_pool_instance:
+        await _lock_pool_instance.close()
     if _pool_instance:
         await _pool_instance.close()
         print("Connection pool closed")
@@ -81,3 +153,9 @@ def get_graph():
     if _graph_instance is None:
         raise RuntimeError("Graph not initialized. Call initialize_graph() first.")
     return _graph_instance
+
+
+def get_lock_pool():
+    if _lock_pool_instance is None:
+        raise RuntimeError("Graph not initialized. Call initialize_graph() first.")
+    return _lock_pool_instance
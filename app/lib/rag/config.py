@@ -10,6 +10,8 @@ settings = get_settings()
 embeddings = OpenAIEmbeddings(
     model="text-embedding-3-small",
     api_key=SecretStr(settings["openai_apikey"]),
+    # Retried by the callers, through the LLM scheduler (app/lib/scheduler.py)
+    max_retries=0,
 )
 
 # Vector store
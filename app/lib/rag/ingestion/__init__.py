@@ -2,10 +2,12 @@ from .core import (
     ingest_documents_batch,
 )
 from .pdf import ingest_pdf
+from .pipeline import IngestionPipeline
 from .text import ingest_text_file
 from .web import ingest_url
 
 __all__ = [
+    "IngestionPipeline",
     "ingest_documents_batch",
     "ingest_pdf",
     "ingest_url",
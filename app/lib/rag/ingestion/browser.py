@@ -0,0 +1,181 @@
+import asyncio
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
+
+# Tabs open at once across all domains
+MAX_TABS = 8
+# Concurrent crawls against one host; airline sites rate-limit and bot-check bursts
+PER_DOMAIN = 2
+
+# Page is ready once loaded and its text stopped changing for ~0.5s (polled every
+# 100ms by crawl4ai). Replaces the fixed 5s delay and 2s post-scroll sleep.
+_READY_JS = """js:() => {
+    const length = document.body ? document.body.innerText.length : 0;
+    if (document.readyState !== 'complete' || length !== window.__ingestLength) {
+        window.__ingestLength = length;
+        window.__ingestStable = 0;
+        return false;
+    }
+    window.__ingestStable += 1;
+    return length > 0 && window.__ingestStable >= 5;
+}"""
+# Upper bound on the readiness wait; the page is taken as-is after it
+_READY_TIMEOUT_MS = 10000
+
+_PHASES = ("queued", "navigate", "render", "extract")
+
+BROWSER_CONFIG = BrowserConfig(
+    headless=True,
+    verbose=False,
+    headers={"Accept-Language": "en-US,en;q=0.9"},
+)
+
+CRAWLER_CONFIG = CrawlerRunConfig(
+    wait_until="domcontentloaded",
+    page_timeout=30000,
+    # Trigger lazy-loaded content, then let the readiness check wait for it
+    js_code=["window.scrollTo(0, document.body.scrollHeight);"],
+    wait_for=_READY_JS,
+    wait_for_timeout=_READY_TIMEOUT_MS,
+    delay_before_return_html=0,
+    # Dropped while scraping rather than by script, so late-rendered chrome goes too
+    excluded_tags=["header", "footer", "nav", "iframe"],
+    excluded_selector='[class*="cookie"], [class*="modal"], [class*="popup"], [class*="logout"]',
+    verbose=False,
+)
+
+
+class BrowserPool:
+    """One headless Chromium shared by every URL crawl in an ingestion run.
+
+    Pages are crawled in a fixed set of reusable tabs (crawl4ai sessions in one
+    browser context), at most PER_DOMAIN at a time per host. Chromium starts on
+    the first crawl, so runs without URLs never launch it.
+    """
+
+    def __init__(self, max_tabs: int = MAX_TABS, per_domain: int = PER_DOMAIN):
+        self.max_tabs = max_tabs
+        self.per_domain = per_domain
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._start_lock = asyncio.Lock()
+        self._tabs: asyncio.Queue[str] = asyncio.Queue()
+        for i in range(max_tabs):
+            self._tabs.put_nowait(f"ingest-tab-{i}")
+        self._domains: dict[str, asyncio.Semaphore] = {}
+        # Hook timestamps for the crawl running in each tab
+        self._marks: dict[str, dict[str, float]] = {}
+        self._stats = {"crawls": 0, "failures": 0, "browser_start_seconds": 0.0}
+        self._phase_total = dict.fromkeys(_PHASES, 0.0)
+        self._phase_max = dict.fromkeys(_PHASES, 0.0)
+
+    async def __aenter__(self) -> "BrowserPool":
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._crawler is not None:
+            await self._crawler.close()
+            self._crawler = None
+
+    async def crawl(self, url: str) -> tuple[Optional[str], Optional[str]]:
+        """Crawl one page. Returns (markdown, None) or (None, error)."""
+        crawler = await self._ensure_started()
+        started = time.perf_counter()
+        domain = urlparse(url).netloc.lower()
+        semaphore = self._domains.setdefault(domain, asyncio.Semaphore(self.per_domain))
+
+        async with semaphore:
+            tab = await self._tabs.get()
+            try:
+                marks = self._marks[tab] = {"start": time.perf_counter()}
+                try:
+                    result = await crawler.arun(url=url, config=CRAWLER_CONFIG.clone(session_id=tab))
+                except Exception as e:
+                    result, error = None, str(e)
+                else:
+                    error = None if result.success else result.error_message
+                marks["end"] = time.perf_counter()
+                if error is not None:
+                    # Don't hand a page in an unknown state to the next crawl
+                    await self._reset_tab(tab)
+            finally:
+                self._marks.pop(tab, None)
+                self._tabs.put_nowait(tab)
+
+        timings = self._record(started, marks, error is None)
+        print(
+            f"   crawled {url} in {sum(timings.values()):.1f}s "
+            + " ".join(f"{phase}={seconds:.1f}s" for phase, seconds in timings.items())
+        )
+        if error is not None:
+            return None, error
+        raw = result.markdown or result.cleaned_html or result.html
+        if not raw or len(raw.strip()) < 100:
+            return None, "page had no content"
+        return raw, None
+
+    def metrics(self) -> dict:
+        crawls = self._stats["crawls"]
+        return {
+            **self._stats,
+            "avg_seconds": {
+                phase: round(total / crawls, 2) if crawls else 0.0
+                for phase, total in self._phase_total.items()
+            },
+            "max_seconds": {phase: round(value, 2) for phase, value in self._phase_max.items()},
+        }
+
+    async def _ensure_started(self) -> AsyncWebCrawler:
+        async with self._start_lock:
+            if self._crawler is None:
+                started = time.perf_counter()
+                crawler = AsyncWebCrawler(config=BROWSER_CONFIG)
+                await crawler.start()
+                crawler.crawler_strategy.set_hook("after_goto", self._after_goto)
+                crawler.crawler_strategy.set_hook("before_retrieve_html", self._before_retrieve)
+                self._crawler = crawler
+                self._stats["browser_start_seconds"] = round(time.perf_counter() - started, 2)
+            return self._crawler
+
+    async def _reset_tab(self, tab: str):
+        manager = self._crawler.crawler_strategy.browser_manager
+        session = manager.sessions.pop(tab, None)
+        if session is not None:
+            # Close only the page; the context is shared by every tab
+            _, page, _ = session
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    def _mark(self, name: str, page, config):
+        marks = self._marks.get(getattr(config, "session_id", None))
+        if marks is not None:
+            marks[name] = time.perf_counter()
+        return page
+
+    async def _after_goto(self, page, context=None, config=None, **kwargs):
+        return self._mark("navigated", page, config)
+
+    async def _before_retrieve(self, page, context=None, config=None, **kwargs):
+        return self._mark("ready", page, config)
+
+    def _record(self, started: float, marks: dict, ok: bool) -> dict:
+        start, end = marks["start"], marks["end"]
+        navigated = marks.get("navigated", end)
+        ready = max(marks.get("ready", navigated), navigated)
+        timings = {
+            "queued": start - started,
+            "navigate": navigated - start,
+            "render": ready - navigated,
+            "extract": end - ready,
+        }
+        self._stats["crawls"] += 1
+        if not ok:
+            self._stats["failures"] += 1
+        for phase, seconds in timings.items():
+            self._phase_total[phase] += seconds
+            self._phase_max[phase] = max(self._phase_max[phase], seconds)
+        return timings
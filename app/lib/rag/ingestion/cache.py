@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_settings
+
+settings = get_settings()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extracts (
+    source TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_extracts_last_used ON extracts (last_used);
+CREATE TABLE IF NOT EXISTS vectors (
+    model TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, chunk_hash)
+);
+CREATE INDEX IF NOT EXISTS ix_vectors_last_used ON vectors (model, last_used);
+"""
+
+# Slots added to a vector file at a time when it fills up
+_GROW_SLOTS = 4096
+# sqlite caps bound parameters per statement
+_SQL_BATCH = 500
+
+
+class CachedExtract:
+    __slots__ = ("content_hash", "pages", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, content_hash: str, pages: list, etag, last_modified, fetched_at: float):
+        self.content_hash = content_hash
+        # (text, page-level metadata), as the fetch stage produces them
+        self.pages = [(text, meta) for text, meta in pages]
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    @property
+    def validators(self) -> dict:
+        return {"etag": self.etag, "last_modified": self.last_modified}
+
+
+class IngestCache:
+    """On-disk cache of extracted source text and chunk embeddings.
+
+    Extracts are keyed by source (URL or path) and stored once per content
+    hash as JSON; a URL is trusted without revalidation for page_ttl seconds.
+    Embeddings are keyed by model and chunk hash and stored as float32 rows of
+    a memory-mapped file per model, so lookups read only the rows they need.
+    Both parts are bounded in size and evict least recently used entries.
+
+    sqlite holds the index. Methods block; call them off the event loop.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        extracts_mb: int,
+        vectors_mb: int,
+        page_ttl: float,
+    ):
+        self.directory = Path(directory)
+        (self.directory / "extracts").mkdir(parents=True, exist_ok=True)
+        (self.directory / "vectors").mkdir(exist_ok=True)
+        self.extracts_bytes = extracts_mb * 1024 * 1024
+        self.vectors_bytes = vectors_mb * 1024 * 1024
+        self.page_ttl = page_ttl
+        self._db = sqlite3.connect(
+            self.directory / "index.sqlite", check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        # The connection and the memmaps are shared by the pipeline's threads
+        self._lock = threading.Lock()
+        self._maps: dict[str, np.memmap] = {}
+        self.stats = dict.fromkeys(
+            ("extract_hits", "extract_misses", "vector_hits", "vector_misses", "evicted"), 0
+        )
+
+    def close(self):
+        with self._lock:
+            for vectors in self._maps.values():
+                vectors.flush()
+            self._maps.clear()
+            self._db.close()
+
+    # -- extracted text --
+
+    def get_extract(self, source: str) -> Optional[CachedExtract]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, etag, last_modified, fetched_at FROM extracts WHERE source = ?",
+                (source,),
+            ).fetchone()
+            if row is None:
+                self.stats["extract_misses"] += 1
+                return None
+            try:
+                pages = json.loads(self._blob(row[0]).read_text())
+            except (OSError, ValueError):
+                self._db.execute("DELETE FROM extracts WHERE source = ?", (source,))
+                self.stats["extract_misses"] += 1
+                return None
+            self._db.execute("UPDATE extracts SET last_used = ? WHERE source = ?", (time.time(), source))
+            self.stats["extract_hits"] += 1
+            return CachedExtract(row[0], pages, *row[1:])
+
+    def is_fresh(self, extract: CachedExtract) -> bool:
+        """A cached URL young enough to use without asking the server"""
+        return time.time() - extract.fetched_at < self.page_ttl
+
+    def put_extract(self, source: str, content_hash: str, pages: list, validators: Optional[dict] = None):
+        validators = validators or {}
+        data = json.dumps(pages, ensure_ascii=False).encode()
+        now = time.time()
+        with self._lock:
+            blob = self._blob(content_hash)
+            if not blob.exists():
+                blob.parent.mkdir(exist_ok=True)
+                tmp = blob.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_bytes(data)
+                tmp.replace(blob)
+            previous = self._db.execute(
+                "SELECT content_hash FROM extracts WHERE source = ?", (source,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO extracts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, content_hash, len(data), validators.get("etag"),
+                 validators.get("last_modified"), now, now),
+            )
+            if previous and previous[0] != content_hash:
+                self._drop_blob(previous[0])
+            self._evict_extracts()
+
+    def touch_extract(self, source: str, validators: Optional[dict] = None):
+        """The server confirmed the cached copy is current (a 304)"""
+        validators = validators or {}
+        with self._lock:
+            self._db.execute(
+                "UPDATE extracts SET fetched_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE source = ?",
+                (time.time(), validators.get("etag"), validators.get("last_modified"), source),
+            )
+
+    def _blob(self, content_hash: str) -> Path:
+        return self.directory / "extracts" / content_hash[:2] / f"{content_hash}.json"
+
+    def _drop_blob(self, content_hash: str):
+        # Blobs are shared by every source with the same content
+        in_use = self._db.execute(
+            "SELECT 1 FROM extracts WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if not in_use:
+            self._blob(content_hash).unlink(missing_ok=True)
+
+    def _evict_extracts(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extracts").fetchone()[0]
+        while total > self.extracts_bytes:
+            row = self._db.execute(
+                "SELECT source, content_hash, size FROM extracts ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM extracts WHERE source = ?", (row[0],))
+            self._drop_blob(row[1])
+            self.stats["evicted"] += 1
+            total -= row[2]
+
+    # -- embeddings --
+
+    def get_vectors(self, model: str, chunk_hashes: list[str]) -> dict[str, list[float]]:
+        """Cached embeddings of the chunks that have one"""
+        with self._lock:
+            found = self._slots(model, chunk_hashes)
+            if found:
+                vectors = self._vectors(model, slots=max(found.values()) + 1)
+                rows_on_disk = len(vectors) if vectors is not None else 0
+                if max(found.values()) >= rows_on_disk:
+                    # Index rows without their vectors (file deleted by hand); forget them
+                    self._db.execute(
+                        "DELETE FROM vectors WHERE model = ? AND slot >= ?", (model, rows_on_disk)
+                    )
+                    found = {}
+                else:
+                    rows = vectors[list(found.values())]
+                    self._db.executemany(
+                        "UPDATE vectors SET last_used = ? WHERE model = ? AND chunk_hash = ?",
+                        [(time.time(), model, key) for key in found],
+                    )
+                    found = {key: row.tolist() for key, row in zip(found, rows)}
+        self.stats["vector_hits"] += len(found)
+        self.stats["vector_misses"] += len(chunk_hashes) - len(found)
+        return found
+
+    def put_vectors(self, model: str, chunk_hashes: list[str], vectors: list[list[float]]):
+        if not chunk_hashes:
+            return
+        by_key = dict(zip(chunk_hashes, np.asarray(vectors, dtype=np.float32)))
+        dimensions = len(vectors[0])
+        capacity = max(self.vectors_bytes // (dimensions * 4), 1)
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                slots = self._slots(model, list(by_key))
+                # Mark them used first so eviction below can't pick them
+                self._db.executemany(
+                    "UPDATE vectors SET last_used = ? WHERE model = ? AND chunk_hash = ?",
+                    [(now, model, key) for key in slots],
+                )
+                new = [key for key in by_key if key not in slots]
+                high = self._db.execute(
+                    "SELECT COALESCE(MAX(slot) + 1, 0) FROM vectors WHERE model = ?", (model,)
+                ).fetchone()[0]
+                appended = min(len(new), max(capacity - high, 0))
+                for key in new[:appended]:
+                    slots[key] = high
+                    high += 1
+                if len(new) > appended:
+                    # Full: reuse the rows of the least recently used chunks
+                    victims = self._db.execute(
+                        "SELECT chunk_hash, slot FROM vectors WHERE model = ? AND last_used < ? "
+                        "ORDER BY last_used LIMIT ?",
+                        (model, now, len(new) - appended),
+                    ).fetchall()
+                    self._db.executemany(
+                        "DELETE FROM vectors WHERE model = ? AND chunk_hash = ?",
+                        [(model, key) for key, _ in victims],
+                    )
+                    self.stats["evicted"] += len(victims)
+                    for key, (_, slot) in zip(new[appended:], victims):
+                        slots[key] = slot
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)",
+                    [(model, key, slot, now) for key, slot in slots.items()],
+                )
+                target = self._vectors(model, dimensions, high)
+                for key, slot in slots.items():
+                    target[slot] = by_key[key]
+                target.flush()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _slots(self, model: str, chunk_hashes: list[str]) -> dict[str, int]:
+        found = {}
+        for start in range(0, len(chunk_hashes), _SQL_BATCH):
+            batch = chunk_hashes[start:start + _SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            found.update(self._db.execute(
+                f"SELECT chunk_hash, slot FROM vectors WHERE model = ? AND chunk_hash IN ({marks})",
+                (model, *batch),
+            ).fetchall())
+        return found
+
+    def _vectors(self, model: str, dimensions: Optional[int] = None, slots: int = 0) -> Optional[np.memmap]:
+        """The model's vector file, mapped with at least `slots` rows if it has them.
+
+        Writers pass the dimensions, and the file is grown to fit.
+        """
+        vectors = self._maps.get(model)
+        if vectors is not None and slots <= len(vectors):
+            return vectors
+        # Remapped too when another process has grown the file since
+        path = self.directory / "vectors" / f"{hashlib.sha256(model.encode()).hexdigest()[:16]}.f32"
+        meta = path.with_suffix(".json")
+        grow = dimensions is not None
+        if not grow:
+            if not meta.exists():
+                return None
+            dimensions = json.loads(meta.read_text())["dimensions"]
+        elif not meta.exists():
+            meta.write_text(json.dumps({"model": model, "dimensions": dimensions}))
+        row_bytes = dimensions * 4
+        size = path.stat().st_size if path.exists() else 0
+        if grow and slots * row_bytes > size:
+            # Grown in steps, but not past the size bound
+            size = max(slots, min(slots + _GROW_SLOTS, self.vectors_bytes // row_bytes)) * row_bytes
+            with open(path, "ab") as f:
+                f.truncate(size)
+        if size < row_bytes:
+            return None
+        vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(size // row_bytes, dimensions))
+        self._maps[model] = vectors
+        return vectors
+
+
+def open_cache() -> Optional[IngestCache]:
+    """The configured cache, or None when INGEST_CACHE_DIR is empty"""
+    if not settings["ingest_cache_dir"]:
+        return None
+    return IngestCache(
+        settings["ingest_cache_dir"],
+        extracts_mb=settings["ingest_cache_extracts_mb"],
+        vectors_mb=settings["ingest_cache_vectors_mb"],
+        page_ttl=settings["ingest_cache_page_ttl"],
+    )
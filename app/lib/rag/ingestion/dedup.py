@@ -0,0 +1,90 @@
+"""
+Near-duplicate chunks across sources.
+
+The same passage often turns up in several sources: an airline's policy
+quoted by a travel site, a PDF and the page it was exported from. A new chunk
+close enough to a stored chunk of another source is not embedded and stored
+again. Its source is recorded on that chunk as an alias instead, together with
+the fields retrieval filters on:
+
+    "aliases": {source: {"airline_code": ..., "country_code": ...}}
+
+plus flat alias_sources / alias_airline_codes / alias_country_codes lists
+derived from it, which metadata filters can match (retriever._build_rag_filter).
+
+Candidates come from MinHash LSH band keys (text_prep.minhash_bands) and are
+confirmed by word-shingle Jaccard of the two texts.
+"""
+
+from collections import Counter, defaultdict
+
+from app.lib.text_prep import MINHASH_BAND_ROWS, MINHASH_PERMUTATIONS
+
+# Source-level fields an alias keeps, so filtered searches find the chunk for it too
+ALIAS_FIELDS = ("airline_code", "country_code")
+# Derived from aliases; never set by hand
+_DERIVED_FIELDS = ("aliases", "alias_sources", *(f"alias_{field}s" for field in ALIAS_FIELDS))
+# Dedup bookkeeping on a chunk's metadata, left out of search results
+DEDUP_FIELDS = ("minhash", *_DERIVED_FIELDS)
+
+_BANDS = MINHASH_PERMUTATIONS // MINHASH_BAND_ROWS
+# Candidates checked per chunk, most shared bands first
+MAX_CANDIDATES = 5
+
+
+def alias_fields(base: dict) -> dict:
+    return {field: base[field] for field in ALIAS_FIELDS if base.get(field)}
+
+
+def with_aliases(metadata: dict, aliases: dict) -> dict:
+    """metadata with its alias fields rebuilt from aliases, or removed if there are none"""
+    metadata = {k: v for k, v in metadata.items() if k not in _DERIVED_FIELDS}
+    if aliases:
+        metadata["aliases"] = aliases
+        metadata["alias_sources"] = sorted(aliases)
+        for field in ALIAS_FIELDS:
+            metadata[f"alias_{field}s"] = sorted({a[field] for a in aliases.values() if a.get(field)})
+    return metadata
+
+
+def _band_keys(bands: str) -> list[tuple[int, str]]:
+    width = len(bands) // _BANDS
+    return [(i, bands[i * width:(i + 1) * width]) for i in range(_BANDS)]
+
+
+class NearDuplicateIndex:
+    """Chunks by LSH band key, held in memory for one ingestion run"""
+
+    def __init__(self):
+        self._buckets: dict[tuple[int, str], set[str]] = defaultdict(set)
+        # row id -> (source, bands)
+        self._rows: dict[str, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row_id: str, source: str, bands: str):
+        self._rows[row_id] = (source, bands)
+        for key in _band_keys(bands):
+            self._buckets[key].add(row_id)
+
+    def remove(self, row_id: str):
+        entry = self._rows.pop(row_id, None)
+        if entry is None:
+            return
+        for key in _band_keys(entry[1]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(row_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def candidates(self, bands: str, exclude_source: str) -> list[str]:
+        """Rows of other sources sharing a band with bands, most shared first"""
+        shared = Counter(
+            row_id
+            for key in _band_keys(bands)
+            for row_id in self._buckets.get(key, ())
+            if self._rows[row_id][0] != exclude_source
+        )
+        return [row_id for row_id, _ in shared.most_common(MAX_CANDIDATES)]
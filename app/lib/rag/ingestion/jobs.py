@@ -0,0 +1,387 @@
+"""
+Postgres-backed ingestion job queue.
+
+A job is an ingest_jobs row plus one ingest_job_sources row per source.
+Workers, in the API process or on their own (scripts/ingest_worker.py),
+claim a batch of open sources with FOR UPDATE SKIP LOCKED, run it through one
+IngestionPipeline and record each source's outcome as it is written.
+
+Manifest jobs (POST /admin/ingest, scripts.ingest_documents --enqueue) run one
+at a time; jobs of uploaded documents (uploads.py) queue alongside them and
+are claimed first, as they are small and someone is waiting on them.
+
+A claim is a lease, renewed while the batch runs. Sources of a worker that
+dies are taken over once the lease runs out, and failed sources are retried
+after a delay, up to ingest_job_max_attempts. The pipeline skips unchanged
+sources, so a retried or resumed source costs little.
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import suppress
+from typing import Optional
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from app.config import get_settings
+from app.lib.provider import CONNECTION_KWARGS
+
+from .pipeline import IngestionPipeline, source_key
+
+settings = get_settings()
+
+# Seconds before a failed source is retried, times its attempts so far
+_RETRY_DELAY = 60
+_RECONNECT_DELAY = 5.0
+
+_worker_task: Optional[asyncio.Task] = None
+
+_CREATE_JOB_SQL = """
+INSERT INTO ingest_jobs (id, kind, state, total_sources, requested_by, created_at)
+VALUES (%s, %s, 'queued', %s, %s, now())
+ON CONFLICT ((finished_at IS NULL)) WHERE finished_at IS NULL AND kind = 'manifest' DO NOTHING
+RETURNING id
+"""
+
+_INSERT_SOURCE_SQL = """
+INSERT INTO ingest_job_sources (job_id, position, source_key, source, state, attempts)
+VALUES (%s, %s, %s, %s, 'pending', 0)
+"""
+
+# Sources whose worker vanished during their last allowed attempt
+_ABANDONED_SQL = """
+UPDATE ingest_job_sources
+SET state = 'failed', finished_at = now(), available_at = NULL,
+    error = coalesce(error, 'worker lost, no attempts left')
+WHERE state = 'running' AND available_at < now() AND attempts >= %(max_attempts)s
+"""
+
+_CLAIM_SQL = """
+WITH claimable AS (
+    SELECT s.job_id, s.position
+    FROM ingest_job_sources s
+    JOIN ingest_jobs j ON j.id = s.job_id
+    WHERE s.state IN ('pending', 'running')
+      AND (s.available_at IS NULL OR s.available_at < now())
+    ORDER BY j.kind = 'upload' DESC, j.created_at, s.position
+    LIMIT %(limit)s
+    FOR UPDATE OF s SKIP LOCKED
+)
+UPDATE ingest_job_sources s
+SET state = 'running', attempts = s.attempts + 1, worker = %(worker)s,
+    available_at = now() + make_interval(secs => %(lease)s),
+    started_at = now(), finished_at = NULL
+FROM claimable c
+WHERE s.job_id = c.job_id AND s.position = c.position
+RETURNING s.job_id, s.position, s.source
+"""
+
+_RENEW_SQL = """
+UPDATE ingest_job_sources
+SET available_at = now() + make_interval(secs => %s)
+WHERE worker = %s AND state = 'running'
+"""
+
+# Guarded by worker and state: a worker whose lease was taken over must not
+# overwrite the new claim
+_DONE_SQL = """
+UPDATE ingest_job_sources
+SET state = 'done', finished_at = now(), available_at = NULL, error = NULL,
+    unchanged = %(unchanged)s, chunks_written = %(chunks_written)s, chunks_kept = %(chunks_kept)s,
+    chunks_deleted = %(chunks_deleted)s, chunks_collapsed = %(chunks_collapsed)s
+WHERE job_id = %(job_id)s AND position = ANY(%(positions)s) AND worker = %(worker)s AND state = 'running'
+"""
+
+_FAILED_SQL = """
+UPDATE ingest_job_sources
+SET state = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'pending' END,
+    finished_at = CASE WHEN attempts >= %(max_attempts)s THEN now() END,
+    available_at = CASE WHEN attempts < %(max_attempts)s
+                        THEN now() + make_interval(secs => %(retry_delay)s * attempts) END,
+    error = %(error)s
+WHERE job_id = %(job_id)s AND position = ANY(%(positions)s) AND worker = %(worker)s AND state = 'running'
+"""
+
+# Given back on shutdown; the attempt didn't happen
+_RELEASE_SQL = """
+UPDATE ingest_job_sources
+SET state = 'pending', attempts = attempts - 1, available_at = NULL, started_at = NULL
+WHERE worker = %s AND state = 'running'
+"""
+
+_FINISH_JOBS_SQL = """
+UPDATE ingest_jobs j
+SET state = CASE WHEN EXISTS (
+        SELECT 1 FROM ingest_job_sources s WHERE s.job_id = j.id AND s.state = 'failed'
+    ) THEN 'failed' ELSE 'done' END,
+    finished_at = now()
+WHERE j.finished_at IS NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM ingest_job_sources s
+      WHERE s.job_id = j.id AND s.state IN ('pending', 'running')
+  )
+"""
+
+
+async def _connect() -> psycopg.AsyncConnection:
+    return await psycopg.AsyncConnection.connect(settings["database_url"], **CONNECTION_KWARGS)
+
+
+async def enqueue(
+    sources: list[dict],
+    requested_by: Optional[str] = None,
+    kind: str = "manifest",
+) -> tuple[uuid.UUID, bool]:
+    """Create a job for the sources.
+
+    Returns (job id, created). While a manifest job is unfinished no other is
+    created, and that job's id comes back with created False. Upload jobs are
+    always created.
+    """
+    job_id = uuid.uuid4()
+    async with await _connect() as conn:
+        async with conn.transaction():
+            cur = await conn.execute(_CREATE_JOB_SQL, (job_id, kind, len(sources), requested_by))
+            if await cur.fetchone() is None:
+                cur = await conn.execute(
+                    "SELECT id FROM ingest_jobs WHERE finished_at IS NULL AND kind = 'manifest'"
+                )
+                return (await cur.fetchone())[0], False
+            async with conn.cursor() as insert:
+                await insert.executemany(
+                    _INSERT_SOURCE_SQL,
+                    [
+                        (job_id, position, source_key(source), Jsonb(source))
+                        for position, source in enumerate(sources)
+                    ],
+                )
+        # An empty job is finished as soon as it exists
+        await conn.execute(_FINISH_JOBS_SQL)
+    return job_id, True
+
+
+# The latest definition of each uploaded document: a re-upload replaces the file,
+# and may change its metadata
+_UPLOADED_SOURCES_SQL = """
+SELECT DISTINCT ON (s.source_key) s.source
+FROM ingest_job_sources s
+JOIN ingest_jobs j ON j.id = s.job_id
+WHERE j.kind = 'upload'
+ORDER BY s.source_key, j.created_at DESC, s.position DESC
+"""
+
+
+async def uploaded_sources() -> list[dict]:
+    """Source definitions of the documents uploaded through the admin API.
+
+    They are not in the manifest, so a rebuild adds these to keep them; upload
+    jobs are their only record. One whose file can't be read fails in the
+    rebuild, which then keeps its old chunks.
+    """
+    async with await _connect() as conn:
+        cur = await conn.execute(_UPLOADED_SOURCES_SQL)
+        return [source for source, in await cur.fetchall()]
+
+
+async def job_status(job_id: Optional[uuid.UUID] = None) -> Optional[dict]:
+    """A job (the latest by default) with per-source progress and throughput"""
+    async with await _connect() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            if job_id is None:
+                await cur.execute("SELECT * FROM ingest_jobs ORDER BY created_at DESC LIMIT 1")
+            else:
+                await cur.execute("SELECT * FROM ingest_jobs WHERE id = %s", (job_id,))
+            job = await cur.fetchone()
+            if job is None:
+                return None
+            await cur.execute(
+                "SELECT * FROM ingest_job_sources WHERE job_id = %s ORDER BY position",
+                (job["id"],),
+            )
+            rows = await cur.fetchall()
+            await cur.execute("SELECT now() AS now")
+            now = (await cur.fetchone())["now"]
+
+    sources = []
+    states = dict.fromkeys(("pending", "running", "done", "failed"), 0)
+    totals = dict.fromkeys(("chunks_written", "chunks_kept", "chunks_deleted", "chunks_collapsed"), 0)
+    for row in rows:
+        states[row["state"]] = states.get(row["state"], 0) + 1
+        for key in totals:
+            totals[key] += row[key] or 0
+        end = row["finished_at"] or (now if row["state"] == "running" else None)
+        sources.append({
+            "source": row["source_key"],
+            "state": row["state"],
+            "attempts": row["attempts"],
+            "worker": row["worker"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "seconds": round((end - row["started_at"]).total_seconds(), 2) if end and row["started_at"] else None,
+            "unchanged": row["unchanged"],
+            **{key: row[key] for key in totals},
+            "error": row["error"],
+        })
+
+    elapsed = ((job["finished_at"] or now) - job["started_at"]).total_seconds() if job["started_at"] else 0.0
+    finished = states["done"] + states["failed"]
+    return {
+        "job": {
+            "id": job["id"],
+            "kind": job["kind"],
+            "state": job["state"],
+            "requested_by": job["requested_by"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "total_sources": job["total_sources"],
+            "sources": states,
+            **totals,
+            "elapsed_seconds": round(elapsed, 2),
+            "sources_per_minute": round(finished / elapsed * 60, 2) if elapsed else 0.0,
+            "chunks_per_second": round(totals["chunks_written"] / elapsed, 2) if elapsed else 0.0,
+        },
+        "sources": sources,
+    }
+
+
+class IngestWorker:
+    """Claims open job sources in batches and ingests them until stopped (or, with once, drained)"""
+
+    def __init__(self, batch_size: Optional[int] = None, poll_seconds: Optional[float] = None):
+        self.batch_size = batch_size or settings["ingest_job_batch_size"]
+        self.poll_seconds = poll_seconds or settings["ingest_worker_poll_seconds"] or 5.0
+        self.lease = settings["ingest_job_lease_seconds"]
+        self.max_attempts = settings["ingest_job_max_attempts"]
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        # The pipeline's progress callbacks and the lease renewal share the connection
+        self._lock = asyncio.Lock()
+
+    async def run(self, once: bool = False) -> int:
+        """Returns the number of sources processed"""
+        processed = 0
+        self._conn = await _connect()
+        try:
+            while True:
+                claimed = await self._claim()
+                if claimed:
+                    await self._run_batch(claimed)
+                    processed += len(claimed)
+                    continue
+                if once:
+                    return processed
+                await asyncio.sleep(self.poll_seconds)
+        except asyncio.CancelledError:
+            # Stopping: hand the unfinished claims straight back
+            with suppress(Exception):
+                await self._execute(_RELEASE_SQL, (self.name,))
+            raise
+        finally:
+            await self._conn.close()
+            self._conn = None
+
+    async def _execute(self, query: str, params) -> psycopg.AsyncCursor:
+        async with self._lock:
+            return await self._conn.execute(query, params)
+
+    async def _claim(self) -> list[tuple[uuid.UUID, int, dict]]:
+        async with self._lock, self._conn.transaction():
+            await self._conn.execute(_ABANDONED_SQL, {"max_attempts": self.max_attempts})
+            await self._conn.execute(_FINISH_JOBS_SQL)
+            cur = await self._conn.execute(
+                _CLAIM_SQL, {"limit": self.batch_size, "worker": self.name, "lease": self.lease}
+            )
+            claimed = await cur.fetchall()
+            if claimed:
+                await self._conn.execute(
+                    "UPDATE ingest_jobs SET state = 'running', started_at = coalesce(started_at, now()) "
+                    "WHERE id = ANY(%s) AND state = 'queued'",
+                    (list({job_id for job_id, _, _ in claimed}),),
+                )
+        return claimed
+
+    async def _run_batch(self, claimed: list[tuple[uuid.UUID, int, dict]]):
+        # Duplicate definitions, in a job or across jobs, share one pipeline pass
+        positions: dict[str, dict[uuid.UUID, list[int]]] = {}
+        sources = []
+        for job_id, position, source in claimed:
+            key = source_key(source)
+            if key not in positions:
+                positions[key] = {}
+                sources.append(source)
+            positions[key].setdefault(job_id, []).append(position)
+        print(f"Ingestion worker {self.name}: claimed {len(sources)} sources")
+
+        reported = set()
+
+        async def source_done(key: str, outcome: dict):
+            for job_id, at in positions[key].items():
+                await self._execute(_DONE_SQL, {**outcome, "job_id": job_id, "positions": at, "worker": self.name})
+            reported.add(key)
+
+        renewal = asyncio.create_task(self._renew_lease())
+        pipeline = IngestionPipeline(on_source_done=source_done)
+        error = None
+        try:
+            await pipeline.run(sources)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Ingestion worker {self.name}: batch failed: {error}")
+        finally:
+            renewal.cancel()
+            with suppress(asyncio.CancelledError):
+                await renewal
+
+        for key, jobs in positions.items():
+            if key in reported:
+                continue
+            for job_id, at in jobs.items():
+                await self._execute(_FAILED_SQL, {
+                    "job_id": job_id,
+                    "positions": at,
+                    "worker": self.name,
+                    "max_attempts": self.max_attempts,
+                    "retry_delay": _RETRY_DELAY,
+                    "error": pipeline.source_errors.get(key) or error or "no result from the pipeline",
+                })
+        await self._execute(_FINISH_JOBS_SQL, ())
+
+    async def _renew_lease(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self._execute(_RENEW_SQL, (self.lease, self.name))
+            except Exception as e:
+                print(f"Ingestion worker {self.name}: could not renew lease: {e}")
+
+
+async def _worker_loop():
+    while True:
+        try:
+            await IngestWorker().run()
+        except Exception as e:
+            print(f"Ingestion worker failed: {e}")
+            await asyncio.sleep(_RECONNECT_DELAY)
+
+
+def start_ingest_worker():
+    """Run an ingestion worker in this process, unless INGEST_WORKER_POLL_SECONDS=0"""
+    global _worker_task
+    if settings["ingest_worker_poll_seconds"] <= 0:
+        print("Ingestion worker disabled here (INGEST_WORKER_POLL_SECONDS=0)")
+        return
+    _worker_task = asyncio.create_task(_worker_loop())
+
+
+async def stop_ingest_worker():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _worker_task
+        _worker_task = None
@@ -0,0 +1,117 @@
+"""
+Ingestion source manifest: a JSONL file with one source definition per line.
+
+Blank lines and lines starting with # are skipped, so sources can be grouped
+under comments and switched off by commenting them out. A definition has a
+type (url, pdf or text) and its url or path; every other field (airline_code,
+country_code, ...) goes into the metadata of the source's chunks.
+
+scripts/ingest_documents.py narrows a manifest down with select() so it can be
+split across processes or machines.
+"""
+
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from app.config import get_settings
+
+from .pipeline import source_key
+
+settings = get_settings()
+
+# Source type -> the field locating it
+SOURCE_TYPES = {"url": "url", "pdf": "path", "text": "path"}
+# Shorthands accepted by --only
+FIELD_ALIASES = {"country": "country_code", "airline": "airline_code"}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)([mhdw])")
+_DURATION_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def load_manifest(path: Optional[str] = None) -> list[dict]:
+    """The manifest's sources in file order; INGEST_MANIFEST by default"""
+    path = Path(path or settings["ingest_manifest"])
+    sources = []
+    for number, line in enumerate(path.read_text().splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            source = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: invalid JSON: {e}") from None
+        if not isinstance(source, dict):
+            raise ValueError(f"{path}:{number}: expected a JSON object")
+        field = SOURCE_TYPES.get(source.get("type"))
+        if field is None:
+            raise ValueError(f"{path}:{number}: type must be one of {', '.join(SOURCE_TYPES)}")
+        if not source.get(field):
+            raise ValueError(f"{path}:{number}: a {source['type']} source needs a {field}")
+        sources.append(source)
+    return sources
+
+
+def shard_of(source: dict, shards: int) -> int:
+    """A source's shard, from a hash of its URL or path.
+
+    Stable across machines and runs, and a source keeps its shard when others
+    are added to or removed from the manifest.
+    """
+    digest = hashlib.sha256(source_key(source).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """'i/n' -> (i, n), shards numbered from 0"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/n, got {value!r}") from None
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be in 0..{count - 1}, got {index}")
+    return index, count
+
+
+def parse_only(values: list[str]) -> dict[str, set[str]]:
+    """['country=KR,US', 'type=url'] -> {'country_code': {'KR', 'US'}, 'type': {'url'}}"""
+    only: dict[str, set[str]] = {}
+    for value in values:
+        field, sep, allowed = value.partition("=")
+        if not sep or not field or not allowed:
+            raise ValueError(f"--only takes field=value[,value...], got {value!r}")
+        field = FIELD_ALIASES.get(field, field)
+        only.setdefault(field, set()).update(allowed.split(","))
+    return only
+
+
+def parse_since(value: str) -> datetime:
+    """An ISO date/time (UTC unless it says otherwise), or an age like 30m, 6h, 2d, 1w"""
+    match = _DURATION.fullmatch(value)
+    if match:
+        amount, unit = match.groups()
+        return datetime.now(timezone.utc) - timedelta(**{_DURATION_UNITS[unit]: float(amount)})
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"since must be an ISO date/time or an age like 6h or 2d, got {value!r}") from None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def select(
+    sources: list[dict],
+    shard: Optional[tuple[int, int]] = None,
+    only: Optional[dict[str, set[str]]] = None,
+) -> list[dict]:
+    """The sources in the shard whose fields match every --only filter"""
+    selected = []
+    for source in sources:
+        if shard and shard_of(source, shard[1]) != shard[0]:
+            continue
+        if only and any(str(source.get(field)) not in allowed for field, allowed in only.items()):
+            continue
+        selected.append(source)
+    return selected
@@ -1,32 +1,55 @@
-from .core import normalize_text, text_splitter
+import asyncio
 
+from langchain_core.documents import Document
+
+from app.lib.pdf_extract import extract_text_layer, ocr_page
+from app.lib.text_prep import chunk_texts
+from app.lib.workers import run_in_process
+
+
+def _documents(file_path: str, pages: list[tuple[int, str]], ocr: dict[int, str]) -> list[Document]:
+    texts = {**dict(pages), **ocr}
+    return [
+        Document(
+            page_content=texts[number],
+            metadata={
+                "source": file_path,
+                "page": number,
+                "extraction": "ocr" if number in ocr else "text",
+            },
+        )
+        for number in sorted(texts)
+        if texts[number].strip()
+    ]
 
-async def ingest_pdf(file_path: str, extra_metadata: dict | None = None) -> dict:
-    """Ingest a PDF file into chunks"""
-    try:
-        from langchain_community.document_loaders import UnstructuredPDFLoader
-    except ImportError as e:
-        raise RuntimeError(
-            "UnstructuredPDFLoader requires the 'ingestion' "
-            "(unstructured[docx,pdf]) to be installed. "
-            "Run: uv sync --group ingestion"
-        ) from e
 
-    loader = UnstructuredPDFLoader(file_path, strategy="hi_res")
-    documents = loader.load()
+def load_pdf(file_path: str) -> list[Document]:
+    """Extract a PDF's text, one Document per page (blocking; run it off the event loop)"""
+    pages, scanned = extract_text_layer(file_path)
+    ocr = {number: ocr_page(file_path, number) for number in scanned}
+    return _documents(file_path, pages, ocr)
 
-    for doc in documents:
-        doc.page_content = normalize_text(doc.page_content)
 
-    chunks = text_splitter.split_documents(documents)
+async def extract_pdf(file_path: str) -> list[Document]:
+    """load_pdf in the ingestion process pool, OCRing scanned pages in parallel"""
+    pages, scanned = await run_in_process(extract_text_layer, file_path)
+    if scanned:
+        print(f"   {file_path}: OCR for {len(scanned)} of {len(pages) + len(scanned)} pages")
+    texts = await asyncio.gather(*(run_in_process(ocr_page, file_path, number) for number in scanned))
+    return _documents(file_path, pages, dict(zip(scanned, texts)))
+
+
+async def ingest_pdf(file_path: str, extra_metadata: dict | None = None) -> dict:
+    """Ingest a PDF file into chunks"""
+    documents = await extract_pdf(file_path)
+    pieces = await run_in_process(chunk_texts, [doc.page_content for doc in documents])
 
-    texts = [chunk.page_content for chunk in chunks]
     base = {"source": file_path, "type": "pdf"}
     if extra_metadata:
         base.update(extra_metadata)
-    metadatas = [
-        {**base, "page": chunk.metadata.get("page", 0)}
-        for chunk in chunks
-    ]
+    texts, metadatas = [], []
+    for doc, chunks in zip(documents, pieces):
+        texts.extend(chunks)
+        metadatas.extend({**base, "page": doc.metadata["page"]} for _ in chunks)
 
     return {"texts": texts, "metadatas": metadatas}
@@ -0,0 +1,732 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Optional
+
+from app.config import get_settings
+from app.lib.rag.config import embeddings
+from app.lib.rag.vectorstore import count_tokens, embed_batch, embedding_metrics
+from app.lib.text_prep import closest_matches, normalize_texts, split_pages
+from app.lib.workers import run_in_process, worker_count
+
+from .browser import BrowserPool
+from .cache import CachedExtract, IngestCache, open_cache
+from .dedup import NearDuplicateIndex, alias_fields, with_aliases
+from .pdf import extract_pdf
+from .text import load_text_file
+from .web import check_url, fetch_url
+from .writer import EmbeddingWriter
+
+settings = get_settings()
+
+# Documents or batches waiting between two stages; this bounds memory, not the corpus
+QUEUE_SIZE = 4
+# Seconds between embedding progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Cached embeddings are only reused for the same model and size
+_EMBEDDING_KEY = f"{embeddings.model}:{embeddings.dimensions or 'default'}"
+
+_DONE = object()
+
+
+class StageStats:
+    __slots__ = ("name", "items_in", "items_out", "errors", "busy_seconds")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        # Summed across workers, so it can exceed wall time for parallel stages
+        self.busy_seconds = 0.0
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "in": self.items_in,
+            "out": self.items_out,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "items_per_second": round(self.items_in / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def source_key(source: dict) -> str:
+    return source.get("url") or source.get("path", "")
+
+
+def _item_sources(item) -> set[str]:
+    """The sources a stage's input belongs to: a source, a SourceUpdate, or a batch of chunks"""
+    if isinstance(item, dict):
+        return {source_key(item)}
+    if isinstance(item, SourceUpdate):
+        return {item.key}
+    # Chunks carry their SourceUpdate last
+    return {chunk[-1].key for chunk in item}
+
+
+def content_hash(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+class SourceUpdate:
+    """A changed source on its way through the pipeline.
+
+    Carries its pages until split, then the chunk diff against what is
+    stored. Once every new chunk has been embedded the whole diff is applied
+    in one transaction, so readers never see a half-updated source. Until then
+    its rows are held here, which is what INGEST_MAX_SOURCE_CHUNKS bounds.
+    """
+
+    __slots__ = (
+        "key", "base", "pages", "pending", "rows", "delete_ids", "keep", "targets", "incoming", "collapsed",
+        "started", "size", "chunks", "tokens",
+    )
+
+    def __init__(self, key: str, base: dict, pages: list[tuple[str, dict]], started: float, size: int):
+        self.key = key
+        # Source-level metadata shared by every chunk
+        self.base = base
+        # (text, page-level metadata)
+        self.pages = pages
+        self.pending = 0
+        # (id, text, vector, metadata)
+        self.rows: list[tuple[str, str, list[float], dict]] = []
+        self.delete_ids: list[str] = []
+        self.keep: list[tuple[str, dict]] = []
+        # Chunks of other sources this one's near-duplicates collapsed into
+        self.targets: set[str] = set()
+        # Other sources' aliases on this one's new rows: row id -> {source: alias fields}
+        self.incoming: dict[str, dict[str, dict]] = {}
+        self.collapsed = 0
+        # For the per-source report: when its fetch started, bytes fetched,
+        # chunks after the split and tokens sent to embed
+        self.started = started
+        self.size = size
+        self.chunks = 0
+        self.tokens = 0
+
+
+class IngestionPipeline:
+    """fetch -> normalize -> split -> batch -> embed -> write, connected by bounded queues.
+
+    Each stage pulls from its inbox as fast as it can push downstream, so a slow
+    stage back-pressures everything before it and memory stays flat however many
+    sources are queued.
+
+    Sources are refreshed incrementally. An unchanged source (same definition,
+    and a 304 or the same content hash) stops after the fetch. A changed one is
+    diffed chunk by chunk against the store, and only chunks whose hash is new
+    are embedded. Each source's diff commits on its own, so a failure only
+    loses the sources in flight.
+
+    With rebuild, every source is loaded into an empty shadow collection that
+    replaces the live one when the run ends, so searches keep the old
+    knowledge base meanwhile. Sources that failed keep their old chunks. The
+    secondary indexes are rebuilt once at the end instead of maintained row
+    by row.
+
+    Extracted text and embeddings also go through the on-disk IngestCache, so
+    a rebuild or a fresh database re-crawls and re-embeds only what changed.
+
+    A new chunk that near-duplicates a chunk of another source (stored, or
+    written earlier in the run) is not embedded; its source becomes an alias
+    on that chunk instead (see dedup.py). A source all of whose chunks
+    collapsed has no rows of its own, so it is looked at again every run.
+    """
+
+    def __init__(
+        self,
+        fetch_workers: int = 8,
+        cpu_workers: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        batch_tokens: Optional[int] = None,
+        batch_max_items: Optional[int] = None,
+        queue_size: int = QUEUE_SIZE,
+        rebuild: bool = False,
+        on_source_done: Optional[Callable[[str, dict], Awaitable[None]]] = None,
+    ):
+        # Web fetches are further limited per domain and by open tabs (see BrowserPool)
+        self.fetch_workers = fetch_workers
+        # Sources normalized/split at once; the work itself runs in the process pool
+        self.cpu_workers = cpu_workers or worker_count()
+        # Batches in flight to the embeddings API at once
+        self.embed_workers = embed_workers or settings["embed_concurrency"]
+        self.batch_tokens = batch_tokens or settings["embed_batch_tokens"]
+        self.batch_max_items = batch_max_items or settings["embed_batch_max_items"]
+        self.queue_size = queue_size
+        self.rebuild = rebuild
+        # Called with (source key, outcome) as each source is written or found unchanged
+        self.on_source_done = on_source_done
+        self._writer: Optional[EmbeddingWriter] = None
+        self._browser: Optional[BrowserPool] = None
+        self._cache: Optional[IngestCache] = None
+        self.dedup_threshold = settings["ingest_dedup_jaccard"]
+        self.max_source_chunks = settings["ingest_max_source_chunks"]
+        self._index = NearDuplicateIndex()
+        # New rows not written yet, which later sources may collapse into: id -> (owner, text)
+        self._pending_rows: dict[str, tuple[SourceUpdate, str]] = {}
+        self.stats = {
+            name: StageStats(name)
+            for name in ("fetch", "normalize", "split", "embed", "write")
+        }
+        self.chunks_written = 0
+        self.chunks_kept = 0
+        self.chunks_deleted = 0
+        self.chunks_cached = 0
+        self.chunks_collapsed = 0
+        self.sources_unchanged = 0
+        self.failed_sources: set[str] = set()
+        # First error of each failed source
+        self.source_errors: dict[str, str] = {}
+        # Outcome of each source written or found unchanged (see _source_done)
+        self.source_reports: dict[str, dict] = {}
+        # Stored metadata of one chunk per source, loaded when the run starts
+        self._states: dict[str, dict] = {}
+        self.chunks_embedded = 0
+        self.tokens_embedded = 0
+        self._embed_started: Optional[float] = None
+        self._last_progress = 0.0
+
+    async def run(self, sources: list[dict]) -> dict:
+        sources_q = asyncio.Queue(self.queue_size)
+        documents_q = asyncio.Queue(self.queue_size)
+        normalized_q = asyncio.Queue(self.queue_size)
+        chunks_q = asyncio.Queue(self.batch_max_items * 2)
+        batches_q = asyncio.Queue(self.queue_size)
+        embedded_q = asyncio.Queue(self.queue_size)
+
+        started = time.perf_counter()
+        retries_before = embedding_metrics()
+        self._cache = open_cache()
+        try:
+            async with (
+                EmbeddingWriter(defer_indexes=self.rebuild, shadow=self.rebuild) as writer,
+                BrowserPool() as browser,
+            ):
+                self._writer = writer
+                self._browser = browser
+                if not self.rebuild:
+                    self._states = await writer.source_states()
+                    if self.dedup_threshold:
+                        for row_id, key, bands in await writer.fingerprints():
+                            self._index.add(row_id, key, bands)
+                await asyncio.gather(
+                    self._feed(sources, sources_q),
+                    self._stage("fetch", self._fetch, sources_q, documents_q, self.fetch_workers),
+                    self._stage("normalize", self._normalize, documents_q, normalized_q, self.cpu_workers),
+                    self._stage("split", self._split, normalized_q, chunks_q, self.cpu_workers),
+                    self._batch(chunks_q, batches_q),
+                    self._stage("embed", self._embed, batches_q, embedded_q, self.embed_workers),
+                    self._stage("write", self._write, embedded_q, None),
+                )
+                # Anything a stage lost without an error of its own still counts as failed,
+                # so a rebuild keeps its old chunks and the caller sees it
+                self._failed(
+                    {source_key(source) for source in sources} - self.source_reports.keys() - self.failed_sources,
+                    RuntimeError("no result from the pipeline"),
+                )
+                # Rows that never got written (their source failed) take the aliases on them along
+                await writer.invalidate(sorted({
+                    alias
+                    for row_id, (owner, _) in self._pending_rows.items()
+                    for alias in owner.incoming.get(row_id, {})
+                }))
+                if self.rebuild:
+                    replaced = await writer.publish(keep_sources=sorted(self.failed_sources))
+                    print(f"Rebuild: published, replacing {replaced} chunks")
+        finally:
+            cache_stats = self._cache.stats if self._cache else None
+            if self._cache:
+                self._cache.close()
+            self._cache = None
+            self._writer = None
+            self._browser = None
+        elapsed = time.perf_counter() - started
+        retries_after = embedding_metrics()
+
+        report = {
+            "elapsed_seconds": round(elapsed, 2),
+            "chunks_written": self.chunks_written,
+            "chunks_kept": self.chunks_kept,
+            "chunks_deleted": self.chunks_deleted,
+            "chunks_from_cache": self.chunks_cached,
+            "chunks_collapsed": self.chunks_collapsed,
+            "sources_unchanged": self.sources_unchanged,
+            "failed_sources": sorted(self.failed_sources),
+            "sources": {
+                **self.source_reports,
+                **{key: {"error": error} for key, error in self.source_errors.items()},
+            },
+            "embedding": {
+                **self._embed_rates(),
+                **{k: retries_after[k] - retries_before[k] for k in ("retries", "rate_limited")},
+            },
+            "stages": {name: s.as_dict(elapsed) for name, s in self.stats.items()},
+            "browser": browser.metrics(),
+            "cache": cache_stats,
+        }
+        _print_report(report)
+        return report
+
+    async def _feed(self, sources: list[dict], outbox: asyncio.Queue):
+        for source in sources:
+            await outbox.put(source)
+        await outbox.put(_DONE)
+
+    async def _stage(
+        self,
+        name: str,
+        fn: Callable[[object], Awaitable[list]],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        workers: int = 1,
+    ):
+        stats = self.stats[name]
+
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    # Leave it for sibling workers
+                    await inbox.put(_DONE)
+                    return
+                stats.items_in += 1
+                started = time.perf_counter()
+                try:
+                    outputs = await fn(item)
+                except Exception as e:
+                    stats.errors += 1
+                    print(f"   [{name}] {e}")
+                    # Sources of the item that finished before the error stay done
+                    self._failed(_item_sources(item) - self.source_reports.keys(), e)
+                    continue
+                finally:
+                    stats.busy_seconds += time.perf_counter() - started
+                for output in outputs:
+                    stats.items_out += 1
+                    if outbox is not None:
+                        await outbox.put(output)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def _batch(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """Group chunks into embeddings requests by token count (see vectorstore.token_batches)"""
+        batch, tokens = [], 0
+        while True:
+            chunk = await inbox.get()
+            if chunk is _DONE:
+                break
+            count = chunk[2]
+            if batch and (tokens + count > self.batch_tokens or len(batch) >= self.batch_max_items):
+                await outbox.put(batch)
+                batch, tokens = [], 0
+            batch.append(chunk)
+            tokens += count
+        if batch:
+            await outbox.put(batch)
+        await outbox.put(_DONE)
+
+    # -- stages: each takes one item and returns the items it produces --
+
+    async def _fetch(self, source: dict) -> list[SourceUpdate]:
+        key = source_key(source)
+        print(f"Processing {source.get('type')}: {key}")
+        started = time.perf_counter()
+        size = 0
+
+        # Build extra metadata from source definition (airline_code, country_code, etc.)
+        reserved = {"type", "url", "path"}
+        extra = {k: v for k, v in source.items() if k not in reserved}
+        # A changed definition rewrites every chunk's metadata even if the content didn't change
+        definition = content_hash(json.dumps(extra, sort_keys=True, default=str))
+        stored = self._states.get(key, {})
+        if stored.get("source_def") != definition:
+            stored = {}
+
+        validators = {}
+        if source["type"] == "url":
+            content, validators = await self._fetch_page(source["url"], stored)
+            if content is None:
+                return await self._unchanged(key, started, size)
+            size = len(content.encode())
+            digest = content_hash(content)
+            if digest == stored.get("source_hash"):
+                return await self._unchanged(key, started, size, validators)
+            kind, pages = "web", [(content, {})]
+        elif source["type"] in ("pdf", "text"):
+            # Hash the file before parsing it; parsing is the expensive part
+            data = await asyncio.to_thread(Path(source["path"]).read_bytes)
+            size = len(data)
+            digest = content_hash(data)
+            if digest == stored.get("source_hash"):
+                return await self._unchanged(key, started, size)
+            kind = source["type"]
+            cached = await self._cached_extract(key)
+            if cached and cached.content_hash == digest:
+                pages = cached.pages
+            else:
+                if kind == "pdf":
+                    # Text layer and OCR run in the process pool, not the loop's threads
+                    documents = await extract_pdf(source["path"])
+                    pages = [(doc.page_content, {"page": doc.metadata.get("page", 0)}) for doc in documents]
+                else:
+                    documents = await asyncio.to_thread(load_text_file, source["path"])
+                    pages = [(doc.page_content, {}) for doc in documents]
+                await self._cache_extract(key, digest, pages)
+        else:
+            raise ValueError(f"Unknown type: {source['type']}")
+
+        base = {
+            "source": key,
+            "type": kind,
+            **extra,
+            "ingested_at": datetime.now(timezone.utc).isoformat(),
+            "source_hash": digest,
+            "source_def": definition,
+            **{k: v for k, v in validators.items() if v},
+        }
+        return [SourceUpdate(key, base, pages, started, size)]
+
+    async def _fetch_page(self, url: str, stored: dict) -> tuple[Optional[str], dict]:
+        """Page content and validators, from the cache while it is fresh.
+
+        Content is None when the server confirms the stored chunks are current.
+        """
+        cached = await self._cached_extract(url)
+        if cached and self._cache.is_fresh(cached):
+            return cached.pages[0][0], cached.validators
+        # Revalidate what we hold: the cached copy, else the stored chunks
+        held = cached.validators if cached else stored
+        modified, validators = await check_url(url, held.get("etag"), held.get("last_modified"))
+        if not modified:
+            if cached is None:
+                return None, validators
+            await asyncio.to_thread(self._cache.touch_extract, url, validators)
+            return cached.pages[0][0], validators
+        content = await fetch_url(url, self._browser)
+        await self._cache_extract(url, content_hash(content), [(content, {})], validators)
+        return content, validators
+
+    async def _cached_extract(self, key: str) -> Optional[CachedExtract]:
+        if self._cache is None:
+            return None
+        return await asyncio.to_thread(self._cache.get_extract, key)
+
+    async def _cache_extract(self, key: str, digest: str, pages: list, validators: Optional[dict] = None):
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.put_extract, key, digest, pages, validators)
+
+    async def _normalize(self, update: SourceUpdate) -> list[SourceUpdate]:
+        # CPU-bound: runs in the process pool. Only the texts cross over; metadata stays here
+        texts = await run_in_process(normalize_texts, [text for text, _ in update.pages])
+        update.pages = [(text, meta) for text, (_, meta) in zip(texts, update.pages)]
+        return [update]
+
+    async def _split(self, update: SourceUpdate) -> list[tuple[str, str, int, dict, SourceUpdate]]:
+        pieces = await run_in_process(
+            split_pages,
+            [text for text, _ in update.pages],
+            [meta.get("page") for _, meta in update.pages],
+        )
+        # Metadata is joined on here rather than pickled back once per chunk
+        chunks = [
+            (
+                piece,
+                {**update.base, **update.pages[index][1], "chunk_hash": digest,
+                 **({"minhash": bands} if bands else {})},
+            )
+            for piece, index, digest, bands in pieces
+        ]
+        update.pages = []
+        stored = []
+        if update.key in self._states:
+            stored = await self._writer.chunk_hashes(update.key)
+
+        # Stored chunks by hash; duplicates and legacy rows without a hash go
+        stored_ids = {}
+        for row_id, chunk_hash in stored:
+            if chunk_hash and chunk_hash not in stored_ids:
+                stored_ids[chunk_hash] = row_id
+            else:
+                update.delete_ids.append(row_id)
+
+        new, seen = [], set()
+        for text, meta in chunks:
+            chunk_hash = meta["chunk_hash"]
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            if chunk_hash in stored_ids:
+                update.keep.append((stored_ids.pop(chunk_hash), meta))
+            else:
+                new.append((text, meta))
+        # Its new rows are held until all are embedded, so this bounds a source's memory
+        if self.max_source_chunks and len(new) > self.max_source_chunks:
+            raise ValueError(
+                f"{len(new)} new chunks, over INGEST_MAX_SOURCE_CHUNKS ({self.max_source_chunks})"
+            )
+        update.delete_ids.extend(stored_ids.values())
+        update.chunks = len(seen)
+        for row_id in update.delete_ids:
+            self._index.remove(row_id)
+
+        new, collapsed = await self._collapse(update, new)
+        new = [(str(uuid.uuid4()), text, meta) for text, meta in new]
+        for row_id, text, meta in new:
+            if "minhash" in meta:
+                self._index.add(row_id, update.key, meta["minhash"])
+                self._pending_rows[row_id] = (update, text)
+
+        cached = 0
+        if new and self._cache is not None:
+            vectors = await asyncio.to_thread(
+                self._cache.get_vectors, _EMBEDDING_KEY, [meta["chunk_hash"] for _, _, meta in new]
+            )
+            # Embedded before (another run, or a rebuild): straight to the write
+            update.rows.extend(
+                (row_id, text, vectors[meta["chunk_hash"]], meta)
+                for row_id, text, meta in new
+                if meta["chunk_hash"] in vectors
+            )
+            new = [chunk for chunk in new if chunk[2]["chunk_hash"] not in vectors]
+            cached = len(vectors)
+            self.chunks_cached += cached
+        update.pending = len(new)
+        print(
+            f"   {update.key}: {len(new) + cached} new ({cached} cached), {collapsed} near-duplicates, "
+            f"{len(update.keep)} unchanged, {len(update.delete_ids)} removed chunks"
+        )
+
+        if not new:
+            await self._apply(update)
+            return []
+        tokens = await asyncio.to_thread(lambda: [count_tokens(text) for _, text, _ in new])
+        update.tokens = sum(tokens)
+        return [(row_id, text, count, meta, update) for (row_id, text, meta), count in zip(new, tokens)]
+
+    async def _collapse(self, update: SourceUpdate, new: list[tuple[str, dict]]) -> tuple[list, int]:
+        """Drop the new chunks that near-duplicate another source's chunk.
+
+        The chunk they match becomes an alias target of the source. Returns the
+        chunks left and how many were dropped.
+        """
+        if not self.dedup_threshold:
+            return new, 0
+        candidates = [
+            self._index.candidates(meta["minhash"], update.key) if "minhash" in meta else []
+            for _, meta in new
+        ]
+        wanted = {row_id for ids in candidates for row_id in ids}
+        if not wanted:
+            return new, 0
+        texts = {row_id: self._pending_rows[row_id][1] for row_id in wanted if row_id in self._pending_rows}
+        texts.update(await self._writer.documents([row_id for row_id in wanted if row_id not in texts]))
+        candidates = [[row_id for row_id in ids if row_id in texts] for ids in candidates]
+        checked = [i for i, ids in enumerate(candidates) if ids]
+        # Shingling both sides is CPU work: process pool
+        matches = await run_in_process(
+            closest_matches,
+            [new[i][0] for i in checked],
+            [[texts[row_id] for row_id in candidates[i]] for i in checked],
+            self.dedup_threshold,
+        )
+
+        fields = alias_fields(update.base)
+        dropped = set()
+        for i, match in zip(checked, matches):
+            if match is None:
+                continue
+            target = candidates[i][match]
+            dropped.add(i)
+            update.targets.add(target)
+            if target in self._pending_rows:
+                owner, _ = self._pending_rows[target]
+                owner.incoming.setdefault(target, {})[update.key] = fields
+        self.chunks_collapsed += len(dropped)
+        update.collapsed = len(dropped)
+        return [chunk for i, chunk in enumerate(new) if i not in dropped], len(dropped)
+
+    async def _embed(self, batch: list[tuple[str, str, int, dict, SourceUpdate]]) -> list[tuple]:
+        # A source that already failed won't be written: don't pay for the rest of it
+        batch = [chunk for chunk in batch if chunk[4].key not in self.failed_sources]
+        if not batch:
+            return []
+        texts = [text for _, text, _, _, _ in batch]
+        tokens = sum(count for _, _, count, _, _ in batch)
+        if self._embed_started is None:
+            self._embed_started = time.perf_counter()
+        # Retries happen per batch inside embed_batch; a batch that still
+        # fails is dropped, and its sources keep their stored chunks
+        vectors = await embed_batch(texts, tokens)
+        if self._cache is not None:
+            await asyncio.to_thread(
+                self._cache.put_vectors, _EMBEDDING_KEY, [meta["chunk_hash"] for _, _, _, meta, _ in batch], vectors
+            )
+        self.chunks_embedded += len(batch)
+        self.tokens_embedded += tokens
+        self._report_progress()
+        return [
+            [(row_id, text, vector, meta, update) for (row_id, text, _, meta, update), vector in zip(batch, vectors)]
+        ]
+
+    async def _write(self, embedded: list[tuple]) -> list[str]:
+        written, error = [], None
+        for row_id, text, vector, meta, update in embedded:
+            if update.key in self.failed_sources:
+                # Never applied: let its rows go now rather than at the end of the run
+                update.rows = []
+                continue
+            update.rows.append((row_id, text, vector, meta))
+            update.pending -= 1
+            if update.pending == 0:
+                # One source failing to write doesn't take the rest of the batch with it
+                try:
+                    written.extend(await self._apply(update))
+                except Exception as e:
+                    error = error or e
+        if error is not None:
+            raise error
+        return written
+
+    async def _apply(self, update: SourceUpdate) -> list[str]:
+        ids = [row_id for row_id, _, _, _ in update.rows]
+        # From here on, sources that collapse into these rows find them in the store
+        for row_id in ids:
+            self._pending_rows.pop(row_id, None)
+        rows = [
+            (row_id, text, vector, with_aliases(meta, update.incoming[row_id]) if row_id in update.incoming else meta)
+            for row_id, text, vector, meta in update.rows
+        ]
+        try:
+            missing = await self._writer.apply_diff(
+                rows, update.delete_ids, update.keep,
+                source=update.key, alias=alias_fields(update.base), alias_targets=tuple(sorted(update.targets)),
+            )
+        except Exception as e:
+            self._failed([update.key], e)
+            # The aliases waiting on these rows are lost with them
+            await self._writer.invalidate(sorted({alias for aliases in update.incoming.values() for alias in aliases}))
+            raise
+        # A target still pending gets this alias when its owner writes it; one
+        # that is gone (its owner's refresh dropped it) leaves the source incomplete
+        if any(row_id not in self._pending_rows for row_id in missing):
+            await self._writer.invalidate([update.key])
+        self.chunks_written += len(update.rows)
+        self.chunks_kept += len(update.keep)
+        self.chunks_deleted += len(update.delete_ids)
+        await self._source_done(update.key, {
+            "unchanged": False,
+            "bytes": update.size,
+            "chunks": update.chunks,
+            "tokens": update.tokens,
+            "seconds": round(time.perf_counter() - update.started, 2),
+            "chunks_written": len(update.rows),
+            "chunks_kept": len(update.keep),
+            "chunks_deleted": len(update.delete_ids),
+            "chunks_collapsed": update.collapsed,
+        })
+        return ids
+
+    async def _unchanged(self, key: str, started: float, size: int, validators: Optional[dict] = None) -> list:
+        """Nothing to re-embed, but new validators let the next run stop at a 304"""
+        self.sources_unchanged += 1
+        print(f"   {key}: unchanged")
+        fields = {k: v for k, v in (validators or {}).items() if v}
+        stored = self._states.get(key, {})
+        if any(stored.get(k) != v for k, v in fields.items()):
+            await self._writer.patch_source(key, fields)
+        await self._source_done(key, {
+            "unchanged": True,
+            "bytes": size,
+            "chunks": 0,
+            "tokens": 0,
+            "seconds": round(time.perf_counter() - started, 2),
+            "chunks_written": 0,
+            "chunks_kept": 0,
+            "chunks_deleted": 0,
+            "chunks_collapsed": 0,
+        })
+        return []
+
+    async def _source_done(self, key: str, outcome: dict):
+        self.source_reports[key] = outcome
+        if self.on_source_done is None:
+            return
+        try:
+            await self.on_source_done(key, outcome)
+        except Exception as e:
+            # The source itself is written; only its progress report is lost
+            print(f"   {key}: could not report progress: {e}")
+
+    def _failed(self, keys: Iterable[str], error: Exception):
+        for key in keys:
+            self.failed_sources.add(key)
+            self.source_errors.setdefault(key, f"{type(error).__name__}: {error}")
+
+    def _embed_rates(self) -> dict:
+        elapsed = time.perf_counter() - self._embed_started if self._embed_started else 0.0
+        return {
+            "chunks": self.chunks_embedded,
+            "tokens": self.tokens_embedded,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 1) if elapsed else 0.0,
+            "tokens_per_second": round(self.tokens_embedded / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def _report_progress(self):
+        now = time.perf_counter()
+        if now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        rates = self._embed_rates()
+        print(
+            f"Embedded {rates['chunks']} chunks / {rates['tokens']} tokens "
+            f"({rates['chunks_per_second']} chunks/s, {rates['tokens_per_second']} tokens/s)"
+        )
+
+
+def _print_report(report: dict):
+    embedding = report["embedding"]
+    print(f"\nIngestion finished in {report['elapsed_seconds']}s, {report['chunks_written']} chunks written")
+    print(
+        f"Embedding: {embedding['chunks']} chunks, {embedding['tokens']} tokens "
+        f"({embedding['chunks_per_second']} chunks/s, {embedding['tokens_per_second']} tokens/s), "
+        f"{embedding['retries']} retries, {embedding['rate_limited']} rate limited"
+    )
+    print(f"{'stage':<10} {'in':>6} {'out':>6} {'errors':>6} {'busy s':>8} {'items/s':>8}")
+    for name, s in report["stages"].items():
+        print(
+            f"{name:<10} {s['in']:>6} {s['out']:>6} {s['errors']:>6} "
+            f"{s['busy_seconds']:>8} {s['items_per_second']:>8}"
+        )
+    browser = report["browser"]
+    if browser["crawls"]:
+        print(
+            f"Browser: {browser['crawls']} crawls, {browser['failures']} failed, "
+            f"started in {browser['browser_start_seconds']}s, avg "
+            + " ".join(f"{phase}={seconds}s" for phase, seconds in browser["avg_seconds"].items())
+        )
+    cache = report["cache"]
+    if cache:
+        print(
+            f"Cache: {cache['extract_hits']}/{cache['extract_hits'] + cache['extract_misses']} extracts, "
+            f"{cache['vector_hits']}/{cache['vector_hits'] + cache['vector_misses']} embeddings, "
+            f"{cache['evicted']} evicted"
+        )
+    print(
+        f"Sources unchanged: {report['sources_unchanged']}, chunks kept: {report['chunks_kept']}, "
+        f"chunks removed: {report['chunks_deleted']}, embeddings from cache: {report['chunks_from_cache']}, "
+        f"near-duplicates collapsed: {report['chunks_collapsed']}"
+    )
+    if report["failed_sources"]:
+        print(f"Failed sources: {len(report['failed_sources'])}")
+        for key in report["failed_sources"]:
+            print(f"   {key}: {report['sources'][key]['error']}")
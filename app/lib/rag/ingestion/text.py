@@ -1,22 +1,26 @@
+import asyncio
+
 from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
 
-from .core import normalize_text, text_splitter
+from app.lib.text_prep import chunk_texts
+from app.lib.workers import run_in_process
 
 
-async def ingest_text_file(file_path: str, extra_metadata: dict | None = None) -> dict:
-    """Ingest a text file into chunks"""
-    loader = TextLoader(file_path)
-    documents = loader.load()
+def load_text_file(file_path: str) -> list[Document]:
+    """Read a text file as documents (blocking; run it off the event loop)"""
+    return TextLoader(file_path).load()
 
-    for doc in documents:
-        doc.page_content = normalize_text(doc.page_content)
 
-    chunks = text_splitter.split_documents(documents)
+async def ingest_text_file(file_path: str, extra_metadata: dict | None = None) -> dict:
+    """Ingest a text file into chunks"""
+    documents = await asyncio.to_thread(load_text_file, file_path)
+    pieces = await run_in_process(chunk_texts, [doc.page_content for doc in documents])
 
-    texts = [chunk.page_content for chunk in chunks]
+    texts = [text for chunks in pieces for text in chunks]
     base = {"source": file_path, "type": "text"}
     if extra_metadata:
         base.update(extra_metadata)
-    metadatas = [dict(base) for _ in chunks]
+    metadatas = [dict(base) for _ in texts]
 
     return {"texts": texts, "metadatas": metadatas}
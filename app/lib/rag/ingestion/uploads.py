@@ -0,0 +1,77 @@
+"""
+Documents uploaded through the admin API (POST /admin/ingest/upload).
+
+The multipart parser spools each file to a temporary file, holding at most
+1 MB of it in memory; the route stops reading a request that passes
+INGEST_UPLOAD_MAX_MB. save_upload() copies each file in chunks to a temporary
+file in INGEST_UPLOAD_DIR and renames it into place once complete, so a large
+scanned PDF never sits in memory whole and a failed copy leaves no partial
+document.
+The stored file then becomes a pdf or text source of an upload job, ingested
+by the workers like the manifest's sources.
+
+Workers read the file by path: workers outside the API process need
+INGEST_UPLOAD_DIR on a shared volume. Re-uploading a file name replaces the
+document, and only its changed chunks are re-embedded. Uploaded sources are
+not in the manifest; a --rebuild adds them from their upload jobs (see
+jobs.uploaded_sources), so they survive it.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+from typing import BinaryIO
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# File extension -> source type
+UPLOAD_TYPES = {".pdf": "pdf", ".txt": "text", ".md": "text"}
+
+_COPY_CHUNK = 1024 * 1024
+_UNSAFE_CHARS = re.compile(r"[^\w.-]+")
+
+
+def upload_type(filename: str) -> str:
+    """The source type of an uploaded file, by its extension"""
+    kind = UPLOAD_TYPES.get(Path(filename).suffix.lower())
+    if kind is None:
+        raise ValueError(f"{filename}: only {', '.join(UPLOAD_TYPES)} files can be ingested")
+    return kind
+
+
+def upload_path(filename: str) -> Path:
+    """Where an upload is stored: its file name, made safe, in INGEST_UPLOAD_DIR"""
+    name = _UNSAFE_CHARS.sub("_", Path(filename).name).strip("._")
+    if not Path(name).stem:
+        raise ValueError(f"{filename!r} is not a usable file name")
+    return Path(settings["ingest_upload_dir"]) / name
+
+
+def _store(file: BinaryIO, path: Path, kind: str):
+    if kind == "pdf" and file.read(5) != b"%PDF-":
+        raise ValueError(f"{path.name} is not a PDF")
+    file.seek(0)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=path.parent, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(file, out, _COPY_CHUNK)
+        os.replace(temp, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(temp)
+        raise
+
+
+async def save_upload(file: BinaryIO, filename: str) -> dict:
+    """Store an uploaded file and return its source definition (without metadata)"""
+    kind = upload_type(filename)
+    path = upload_path(filename)
+    await asyncio.to_thread(_store, file, path, kind)
+    return {"type": kind, "path": str(path)}
@@ -1,7 +1,12 @@
-from langchain_core.documents import Document
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
+import time
+from typing import Optional
 
-from .core import normalize_text, text_splitter
+import httpx
+
+from app.lib.text_prep import chunk_texts
+from app.lib.workers import run_in_process
+
+from .browser import BrowserPool
 
 
 async def _extract_with_tavily(url: str) -> str:
@@ -18,69 +23,80 @@ async def _extract_with_tavily(url: str) -> str:
     return results[0]["raw_content"]
 
 
-async def ingest_url(url: str, extra_metadata: dict | None = None) -> dict:
-    """Ingest a web URL into chunks. Falls back to Tavily Extract for JS-heavy sites."""
-    browser_config = BrowserConfig(
-        headless=True,
-        verbose=False,
-        headers={"Accept-Language": "en-US,en;q=0.9"},
-    )
-    crawler_config = CrawlerRunConfig(
-        wait_until="domcontentloaded",
-        page_timeout=30000,
-        delay_before_return_html=5.0,
-        js_code=[
-            "window.scrollTo(0, document.body.scrollHeight);",
-            "await new Promise(r => setTimeout(r, 2000));",
-            """
-            const selectorsToRemove = [
-                'header', 'footer', 'nav', 'iframe',
-                '[class*="cookie"]', '[class*="modal"]',
-                '[class*="popup"]', '[class*="logout"]'
-            ];
-            selectorsToRemove.forEach(selector => {
-                document.querySelectorAll(selector).forEach(el => el.remove());
-            });
-            """,
-        ],
-    )
-
-    content = None
-    crawl_error = None
+async def check_url(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> tuple[bool, dict]:
+    """Conditional HEAD against the validators from the last ingest.
 
+    Returns (modified, validators to store). Anything inconclusive counts as
+    modified; the content hash still catches pages that didn't change.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
     try:
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            result = await crawler.arun(url=url, config=crawler_config)
-
-            if result.success:
-                raw = result.markdown or result.cleaned_html or result.html
-                if raw and len(raw.strip()) >= 100:
-                    content = normalize_text(raw)
-            else:
-                crawl_error = result.error_message
-    except Exception as e:
-        crawl_error = str(e)
+        async with httpx.AsyncClient(follow_redirects=True, timeout=10) as client:
+            response = await client.head(url, headers=headers)
+    except httpx.HTTPError:
+        return True, {}
+
+    if response.status_code == 304:
+        return False, {"etag": etag, "last_modified": last_modified}
+    if response.status_code != 200:
+        return True, {}
+    validators = {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+    }
+    # Some servers ignore conditional headers but still send the same validators
+    if etag and validators["etag"] == etag:
+        return False, validators
+    if not etag and last_modified and validators["last_modified"] == last_modified:
+        return False, validators
+    return True, validators
+
+
+async def fetch_url(url: str, browser: Optional[BrowserPool] = None) -> str:
+    """Crawl a web URL to markdown. Falls back to Tavily Extract for JS-heavy sites.
+
+    Pass the run's BrowserPool to share one Chromium across URLs; without one a
+    browser is started for this URL alone.
+    """
+    if browser is None:
+        async with BrowserPool(max_tabs=1) as own_browser:
+            return await fetch_url(url, own_browser)
+
+    content, crawl_error = await browser.crawl(url)
 
     if not content:
         print(f"   crawl4ai failed ({crawl_error}), trying Tavily Extract...")
+        started = time.perf_counter()
         try:
-            raw = await _extract_with_tavily(url)
-            content = normalize_text(raw)
-            print(f"   Tavily Extract succeeded ({len(content)} chars)")
+            content = await _extract_with_tavily(url)
+            print(f"   Tavily Extract succeeded ({len(content)} chars) in {time.perf_counter() - started:.1f}s")
         except Exception as e:
             raise ValueError(
                 f"Both crawl4ai and Tavily Extract failed for {url}. "
                 f"crawl4ai: {crawl_error} | Tavily: {e}"
             )
 
+    return content
+
+
+async def ingest_url(url: str, extra_metadata: dict | None = None) -> dict:
+    """Ingest a web URL into chunks. Falls back to Tavily Extract for JS-heavy sites."""
+    content = await fetch_url(url)
+
     base_metadata = {"source": url, "type": "web"}
     if extra_metadata:
         base_metadata.update(extra_metadata)
 
-    document = Document(page_content=content, metadata=base_metadata)
-    chunks = text_splitter.split_documents([document])
-
-    texts = [chunk.page_content for chunk in chunks]
-    metadatas = [dict(base_metadata) for _ in chunks]
+    # Normalizing and splitting are CPU-bound; keep them off the event loop
+    [texts] = await run_in_process(chunk_texts, [content])
+    metadatas = [dict(base_metadata) for _ in texts]
 
     return {"texts": texts, "metadatas": metadatas}
@@ -0,0 +1,468 @@
+import asyncio
+import re
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from typing import Optional
+
+import psycopg
+from pgvector.psycopg import register_vector_async
+from psycopg.types.json import Jsonb
+
+from app.config import get_settings
+from app.lib.provider import CONNECTION_KWARGS
+from app.lib.rag.config import vector_store
+
+from .dedup import with_aliases
+
+settings = get_settings()
+
+_COPY_SQL = """
+COPY langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+FROM STDIN WITH (FORMAT BINARY)
+"""
+_COPY_TYPES = ["varchar", "uuid", "vector", "varchar", "jsonb"]
+
+# One row's metadata per source: the source-level fields are the same on every chunk
+_SOURCE_STATES_SQL = """
+SELECT DISTINCT ON (cmetadata->>'source') cmetadata->>'source', cmetadata
+FROM langchain_pg_embedding
+WHERE collection_id = %s AND cmetadata ? 'source'
+ORDER BY cmetadata->>'source'
+"""
+
+# ingested_at is ISO 8601 UTC, so the text max is the latest
+_LAST_INGESTED_SQL = """
+SELECT cmetadata->>'source', max(cmetadata->>'ingested_at')
+FROM langchain_pg_embedding
+WHERE collection_id = %s AND cmetadata ? 'source'
+GROUP BY 1
+"""
+
+# Containment keeps this on the cmetadata GIN index
+_SOURCE_CHUNKS_SQL = """
+SELECT id, cmetadata->>'chunk_hash'
+FROM langchain_pg_embedding
+WHERE collection_id = %s AND cmetadata @> %s
+"""
+
+# Kept chunks take the new source-level metadata but keep their ingested_at and
+# the aliases other sources recorded on them (see dedup.py)
+_UPDATE_METADATA_SQL = """
+UPDATE langchain_pg_embedding e
+SET cmetadata = v.meta || jsonb_strip_nulls(jsonb_build_object(
+    'ingested_at', e.cmetadata->'ingested_at',
+    'aliases', e.cmetadata->'aliases',
+    'alias_sources', e.cmetadata->'alias_sources',
+    'alias_airline_codes', e.cmetadata->'alias_airline_codes',
+    'alias_country_codes', e.cmetadata->'alias_country_codes'
+))
+FROM unnest(%s::varchar[], %s::jsonb[]) AS v(id, meta)
+WHERE e.id = v.id
+"""
+
+# Chunks a source is an alias on now, and the ones it is becoming one on
+_ALIAS_ROWS_SQL = """
+SELECT id, cmetadata
+FROM langchain_pg_embedding
+WHERE collection_id = %s AND (cmetadata @> %s OR id = ANY(%s))
+FOR UPDATE
+"""
+
+# Sources that lose a chunk they were an alias on
+_ORPHANED_ALIASES_SQL = """
+SELECT DISTINCT jsonb_array_elements_text(cmetadata->'alias_sources')
+FROM langchain_pg_embedding
+WHERE id = ANY(%s) AND cmetadata ? 'alias_sources'
+"""
+
+# Stored state that lets a source be skipped as unchanged
+_CHANGE_MARKERS = ["source_hash", "etag", "last_modified"]
+
+# Secondary indexes (everything but the primary key) that a rebuild drops and recreates
+_INDEXES_SQL = """
+SELECT i.relname, pg_get_indexdef(i.oid)
+FROM pg_index x
+JOIN pg_class i ON i.oid = x.indexrelid
+WHERE x.indrelid = 'langchain_pg_embedding'::regclass AND NOT x.indisprimary
+"""
+
+# Session advisory lock held while a load has the indexes dropped (runs.py uses 7351)
+_DEFER_LOCK = 7352
+
+_DEFER_INDEX_SQL = """
+INSERT INTO ingest_deferred_indexes (name, definition, dropped_at)
+VALUES (%s, %s, now())
+ON CONFLICT (name) DO NOTHING
+"""
+
+# Whether a saved index exists, and whether it is usable: an interrupted
+# concurrent build leaves an invalid one behind
+_INDEX_VALID_SQL = """
+SELECT x.indisvalid FROM pg_index x WHERE x.indexrelid = to_regclass(quote_ident(%s))
+"""
+
+_restore_task: Optional[asyncio.Task] = None
+
+
+class EmbeddingWriter:
+    """Streams embedded chunks into langchain_pg_embedding with binary COPY.
+
+    Same rows PGVector.add_embeddings writes, without one bound parameter per
+    column per row. Each write() or apply_diff() is its own transaction, so a
+    failed batch leaves the earlier ones in place.
+
+    With defer_indexes the secondary indexes (the cmetadata GIN index) are
+    dropped on enter and rebuilt once on exit. Only worth it when loading a
+    large share of the table, and metadata-filtered searches are slow while
+    they are missing. Their definitions are saved in ingest_deferred_indexes
+    first, so if the process dies before its exit the next writer (or API
+    start) rebuilds them, concurrently so writes go on; see
+    restore_deferred_indexes().
+
+    With shadow, rows go to a new, empty collection (named after the live one
+    with a ":rebuild" suffix) while searches keep reading the live one.
+    publish() swaps it in, in one transaction; a shadow never published (the
+    run failed) is deleted on exit.
+    """
+
+    def __init__(
+        self,
+        collection_name: Optional[str] = None,
+        defer_indexes: bool = False,
+        shadow: bool = False,
+        database_url: Optional[str] = None,
+    ):
+        self.collection_name = collection_name or vector_store.collection_name
+        self.database_url = database_url or settings["database_url"]
+        self.defer_indexes = defer_indexes
+        self.shadow = shadow
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        # The collection written to: the shadow one with shadow, else the live one
+        self._collection_id: Optional[uuid.UUID] = None
+        self._live_id: Optional[uuid.UUID] = None
+        self._published = False
+        # Holding _DEFER_LOCK, with the indexes dropped until exit
+        self._deferring = False
+        # Pipeline stages share the connection; transactions must not interleave
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "EmbeddingWriter":
+        self._conn = await psycopg.AsyncConnection.connect(self.database_url, **CONNECTION_KWARGS)
+        try:
+            await register_vector_async(self._conn)
+            cur = await self._conn.execute(
+                "SELECT uuid FROM langchain_pg_collection WHERE name = %s",
+                (self.collection_name,),
+            )
+            row = await cur.fetchone()
+            if not row:
+                raise ValueError("Collection not found")
+            self._live_id = self._collection_id = row[0]
+            if self.shadow:
+                await self._create_shadow()
+            if self.defer_indexes:
+                await self._drop_indexes()
+            else:
+                await _restore_indexes(self._conn)
+        except BaseException:
+            await self._conn.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            if self.shadow and not self._published:
+                await self._drop_shadow()
+            if self._deferring:
+                await self._rebuild_indexes()
+        finally:
+            await self._conn.close()
+            self._conn = None
+
+    @property
+    def _shadow_name(self) -> str:
+        return f"{self.collection_name}:rebuild"
+
+    async def _create_shadow(self):
+        # Left over by a rebuild that died before its exit; its rows cascade
+        await self._conn.execute(
+            "DELETE FROM langchain_pg_collection WHERE name = %s", (self._shadow_name,)
+        )
+        self._collection_id = uuid.uuid4()
+        await self._conn.execute(
+            "INSERT INTO langchain_pg_collection (uuid, name, cmetadata) "
+            "SELECT %s, %s, cmetadata FROM langchain_pg_collection WHERE uuid = %s",
+            (self._collection_id, self._shadow_name, self._live_id),
+        )
+
+    async def _drop_shadow(self):
+        await self._conn.execute(
+            "DELETE FROM langchain_pg_collection WHERE uuid = %s", (self._collection_id,)
+        )
+        print(f"Discarded the unpublished {self._shadow_name} collection")
+
+    async def publish(self, keep_sources: list[str] = ()) -> int:
+        """Make the shadow collection the live one, in one transaction.
+
+        The live chunks of keep_sources (sources the rebuild failed on) move to
+        it first, so they stay searchable. Returns the number of live chunks
+        replaced.
+        """
+        async with self._lock, self._conn.transaction():
+            # Serializes with a concurrent publish of the same collection
+            await self._conn.execute(
+                "SELECT 1 FROM langchain_pg_collection WHERE uuid = %s FOR UPDATE", (self._live_id,)
+            )
+            if keep_sources:
+                await self._conn.execute(
+                    "UPDATE langchain_pg_embedding SET collection_id = %s "
+                    "WHERE collection_id = %s AND cmetadata->>'source' = ANY(%s)",
+                    (self._collection_id, self._live_id, list(keep_sources)),
+                )
+            cur = await self._conn.execute(
+                "DELETE FROM langchain_pg_embedding WHERE collection_id = %s", (self._live_id,)
+            )
+            replaced = cur.rowcount
+            await self._conn.execute(
+                "DELETE FROM langchain_pg_collection WHERE uuid = %s", (self._live_id,)
+            )
+            await self._conn.execute(
+                "UPDATE langchain_pg_collection SET name = %s WHERE uuid = %s",
+                (self.collection_name, self._collection_id),
+            )
+        self._published = True
+        self._live_id = self._collection_id
+        return replaced
+
+    async def write(
+        self,
+        texts: list[str],
+        vectors: list[list[float]],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        async with self._lock, self._conn.transaction():
+            await self._copy(ids, texts, vectors, metadatas)
+        return ids
+
+    async def apply_diff(
+        self,
+        rows: list[tuple[str, str, list[float], dict]],
+        delete_ids: list[str],
+        keep: list[tuple[str, dict]],
+        source: Optional[str] = None,
+        alias: Optional[dict] = None,
+        alias_targets: tuple[str, ...] = (),
+    ) -> list[str]:
+        """Bring one source up to date atomically.
+
+        Inserts the new (id, text, vector, metadata) rows, deletes the chunks
+        that vanished and rewrites the metadata of the (id, metadata) chunks
+        kept. With source, also moves its aliases (see dedup.py) to exactly the
+        alias_targets chunks, recording the alias fields on them. Sources that
+        were aliases on a deleted chunk are invalidated, so the next run looks
+        at them again.
+
+        Returns the alias targets that do not exist (anymore).
+        """
+        async with self._lock, self._conn.transaction():
+            if rows:
+                await self._copy(
+                    [row_id for row_id, _, _, _ in rows],
+                    [text for _, text, _, _ in rows],
+                    [vector for _, _, vector, _ in rows],
+                    [metadata for _, _, _, metadata in rows],
+                )
+            if delete_ids:
+                cur = await self._conn.execute(_ORPHANED_ALIASES_SQL, (delete_ids,))
+                orphaned = [name for name, in await cur.fetchall() if name != source]
+                await self._conn.execute(
+                    "DELETE FROM langchain_pg_embedding WHERE id = ANY(%s)", (delete_ids,)
+                )
+                await self._invalidate(orphaned)
+            if keep:
+                await self._conn.execute(
+                    _UPDATE_METADATA_SQL,
+                    ([row_id for row_id, _ in keep], [Jsonb(metadata) for _, metadata in keep]),
+                )
+            if source is None:
+                return []
+            return await self._move_alias(source, alias or {}, list(alias_targets))
+
+    async def _move_alias(self, source: str, alias: dict, targets: list[str]) -> list[str]:
+        cur = await self._conn.execute(
+            _ALIAS_ROWS_SQL, (self._collection_id, Jsonb({"alias_sources": [source]}), targets)
+        )
+        found, updates = set(), []
+        for row_id, metadata in await cur.fetchall():
+            found.add(row_id)
+            aliases = dict(metadata.get("aliases") or {})
+            aliases.pop(source, None)
+            if row_id in targets:
+                aliases[source] = alias
+            updates.append((Jsonb(with_aliases(metadata, aliases)), row_id))
+        if updates:
+            async with self._conn.cursor() as update:
+                await update.executemany(
+                    "UPDATE langchain_pg_embedding SET cmetadata = %s WHERE id = %s", updates
+                )
+        return [row_id for row_id in targets if row_id not in found]
+
+    async def invalidate(self, sources: list[str]):
+        """Forget that the sources are up to date, so the next run refreshes them"""
+        if sources:
+            async with self._lock, self._conn.transaction():
+                await self._invalidate(sources)
+
+    async def _invalidate(self, sources: list[str]):
+        for name in sources:
+            await self._conn.execute(
+                "UPDATE langchain_pg_embedding SET cmetadata = cmetadata - %s::text[] "
+                "WHERE collection_id = %s AND cmetadata @> %s",
+                (_CHANGE_MARKERS, self._collection_id, Jsonb({"source": name})),
+            )
+
+    async def source_states(self) -> dict[str, dict]:
+        """Metadata of one stored chunk per source, for change detection"""
+        async with self._lock:
+            cur = await self._conn.execute(_SOURCE_STATES_SQL, (self._collection_id,))
+            return {source: metadata for source, metadata in await cur.fetchall()}
+
+    async def last_ingested(self) -> dict[str, datetime]:
+        """When each source last had chunks written"""
+        async with self._lock:
+            cur = await self._conn.execute(_LAST_INGESTED_SQL, (self._collection_id,))
+            return {source: datetime.fromisoformat(at) for source, at in await cur.fetchall() if at}
+
+    async def chunk_hashes(self, source: str) -> list[tuple[str, Optional[str]]]:
+        """(id, chunk_hash) of every stored chunk of a source"""
+        async with self._lock:
+            cur = await self._conn.execute(
+                _SOURCE_CHUNKS_SQL, (self._collection_id, Jsonb({"source": source}))
+            )
+            return await cur.fetchall()
+
+    async def fingerprints(self) -> list[tuple[str, str, str]]:
+        """(id, source, minhash bands) of every stored chunk that has them"""
+        async with self._lock:
+            cur = await self._conn.execute(
+                "SELECT id, cmetadata->>'source', cmetadata->>'minhash' FROM langchain_pg_embedding "
+                "WHERE collection_id = %s AND cmetadata ? 'minhash'",
+                (self._collection_id,),
+            )
+            return await cur.fetchall()
+
+    async def documents(self, ids: list[str]) -> dict[str, str]:
+        """Text of the stored chunks, by id; missing ids are left out"""
+        if not ids:
+            return {}
+        async with self._lock:
+            cur = await self._conn.execute(
+                "SELECT id, document FROM langchain_pg_embedding WHERE id = ANY(%s)", (ids,)
+            )
+            return dict(await cur.fetchall())
+
+    async def patch_source(self, source: str, fields: dict):
+        """Merge fields into the metadata of every chunk of a source"""
+        async with self._lock:
+            await self._conn.execute(
+                "UPDATE langchain_pg_embedding SET cmetadata = cmetadata || %s "
+                "WHERE collection_id = %s AND cmetadata @> %s",
+                (Jsonb(fields), self._collection_id, Jsonb({"source": source})),
+            )
+
+    async def clear_collection(self) -> int:
+        """Delete every row of the collection, for a rebuild from scratch"""
+        async with self._lock:
+            cur = await self._conn.execute(
+                "DELETE FROM langchain_pg_embedding WHERE collection_id = %s",
+                (self._collection_id,),
+            )
+        return cur.rowcount
+
+    async def _copy(self, ids: list[str], texts: list[str], vectors: list, metadatas: list[dict]):
+        async with self._conn.cursor() as cur:
+            async with cur.copy(_COPY_SQL) as copy:
+                copy.set_types(_COPY_TYPES)
+                for row_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+                    await copy.write_row((row_id, self._collection_id, vector, text, metadata or {}))
+
+    async def _drop_indexes(self):
+        cur = await self._conn.execute("SELECT pg_try_advisory_lock(%s)", (_DEFER_LOCK,))
+        if not (await cur.fetchone())[0]:
+            print("Another load has the indexes deferred; it rebuilds them when it finishes")
+            return
+        self._deferring = True
+        # Saved and dropped together: a crash can't lose a definition. Rows a
+        # dead load left behind stay, and are rebuilt on exit with the rest
+        async with self._conn.transaction():
+            cur = await self._conn.execute(_INDEXES_SQL)
+            for name, definition in await cur.fetchall():
+                await self._conn.execute(_DEFER_INDEX_SQL, (name, definition))
+                await self._conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+                print(f"Deferred index {name} until the load finishes")
+
+    async def _rebuild_indexes(self):
+        try:
+            await _rebuild_deferred(self._conn)
+        finally:
+            self._deferring = False
+            await self._conn.execute("SELECT pg_advisory_unlock(%s)", (_DEFER_LOCK,))
+
+
+async def _rebuild_deferred(conn: psycopg.AsyncConnection, concurrently: bool = False):
+    """Recreate the saved indexes that are missing; the caller holds _DEFER_LOCK.
+
+    concurrently builds without blocking writes to the table, for restores
+    while the app is serving; it needs an autocommit connection.
+    """
+    cur = await conn.execute("SELECT name, definition FROM ingest_deferred_indexes ORDER BY name")
+    for name, definition in await cur.fetchall():
+        cur = await conn.execute(_INDEX_VALID_SQL, (name,))
+        state = await cur.fetchone()
+        if state is None or not state[0]:
+            if state is not None:
+                await conn.execute(f'DROP INDEX {"CONCURRENTLY " if concurrently else ""}IF EXISTS "{name}"')
+            print(f"Rebuilding index {name}{' concurrently' if concurrently else ''}")
+            if concurrently:
+                definition = re.sub(r"^CREATE (UNIQUE )?INDEX ", r"CREATE \1INDEX CONCURRENTLY ", definition)
+            await conn.execute(definition)
+        await conn.execute("DELETE FROM ingest_deferred_indexes WHERE name = %s", (name,))
+
+
+async def _restore_indexes(conn: psycopg.AsyncConnection):
+    # Held: a load is running with the indexes dropped, and rebuilds them itself
+    cur = await conn.execute("SELECT pg_try_advisory_lock(%s)", (_DEFER_LOCK,))
+    if not (await cur.fetchone())[0]:
+        return
+    try:
+        await _rebuild_deferred(conn, concurrently=True)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock(%s)", (_DEFER_LOCK,))
+
+
+async def restore_deferred_indexes():
+    """Rebuild the indexes of a deferring load that died before its exit (best effort)"""
+    try:
+        async with await psycopg.AsyncConnection.connect(settings["database_url"], **CONNECTION_KWARGS) as conn:
+            await _restore_indexes(conn)
+    except Exception as e:
+        print(f"Could not restore deferred indexes: {e}")
+
+
+def start_index_restore():
+    """Run restore_deferred_indexes() in the background, so a large index doesn't hold up startup"""
+    global _restore_task
+    _restore_task = asyncio.create_task(restore_deferred_indexes())
+
+
+async def stop_index_restore():
+    global _restore_task
+    if _restore_task:
+        _restore_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _restore_task
+        _restore_task = None
@@ -35,10 +35,11 @@ def _build_rag_filter(trip_context: Optional[Dict]) -> Optional[dict]:
         return None
     airline = trip_context.get("airline_code")
     country = trip_context.get("destination_country_code")
+    # A chunk also counts for the sources collapsed into it as near-duplicates
     if airline:
-        return {"airline_code": {"$eq": airline}}
+        return {"$or": [{"airline_code": {"$eq": airline}}, {"alias_airline_codes": {"$eq": airline}}]}
     if country:
-        return {"country_code": {"$eq": country}}
+        return {"$or": [{"country_code": {"$eq": country}}, {"alias_country_codes": {"$eq": country}}]}
     return None
 
 
@@ -47,6 +48,7 @@ async def retrieve_rag_results(
     k: int = 5,
     score_threshold: float = 0.5,
     trip_context: Optional[Dict] = None,
+    authenticated: bool = True,
 ) -> List[dict]:
     """Retrieve documents from vector store, optionally filtered by airline/country."""
     print(f"RAG search for: {query}")
@@ -54,12 +56,18 @@ async def retrieve_rag_results(
     # Try filtered search first if we have context; fall back to unfiltered
     filter_meta = _build_rag_filter(trip_context)
     results = await similarity_search(
-        query, k=k, score_threshold=score_threshold, filter_metadata=filter_meta
+        query,
+        k=k,
+        score_threshold=score_threshold,
+        filter_metadata=filter_meta,
+        authenticated=authenticated,
     )
 
     if not results and filter_meta:
         print(f"   No results with filter {filter_meta}, retrying without filter")
-        results = await similarity_search(query, k=k, score_threshold=score_threshold)
+        results = await similarity_search(
+            query, k=k, score_threshold=score_threshold, authenticated=authenticated
+        )
 
     print(f"   Found {len(results)} relevant documents")
     return results
@@ -1,15 +1,122 @@
 import asyncio
+import itertools
+import time
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import openai
+import tiktoken
+
+from app.config import get_settings
+from app.lib.rag.config import embeddings, vector_store
+from app.lib.scheduler import RETRYABLE_ERRORS, Priority, estimate_tokens, retry_delay, scheduler
+from app.lib.text_prep import sanitize_text
+
+settings = get_settings()
+
+# A 429 on one batch holds back every batch until then: the limit is per key
+_rate_limited_until = 0.0
+_embed_stats = {"batches": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.encoding_for_model(embeddings.model)
+    except Exception as e:
+        # The BPE file is downloaded on first use; fall back to the char estimate offline
+        print(f"Token counting falls back to estimates: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens `text` costs the embeddings model"""
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens([text])
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def token_batches(
+    token_counts: list[int],
+    max_tokens: Optional[int] = None,
+    max_items: Optional[int] = None,
+) -> Iterator[tuple[int, int]]:
+    """Split consecutive texts into [start, end) ranges under the per-request limits"""
+    max_tokens = max_tokens or settings["embed_batch_tokens"]
+    max_items = max_items or settings["embed_batch_max_items"]
+    start, tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (tokens + count > max_tokens or i - start >= max_items):
+            yield start, i
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        yield start, len(token_counts)
+
+
+async def embed_query(query: str, authenticated: bool = True) -> list[float]:
+    """Embed a search query through the LLM scheduler"""
+    for attempt in itertools.count():
+        try:
+            async with scheduler.slot(estimate_tokens([query]), Priority.INTERACTIVE, authenticated):
+                return await embeddings.aembed_query(query)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= settings["llm_max_retries"]:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
+
+
+async def embed_batch(
+    texts: list[str],
+    tokens: Optional[int] = None,
+    priority: Priority = Priority.BULK,
+) -> list[list[float]]:
+    """Embed one request-sized batch, retrying rate limits and transient errors.
+
+    Only this batch is retried; callers embedding many batches keep the rest.
+    """
+    global _rate_limited_until
+    tokens = tokens if tokens is not None else sum(count_tokens(t) for t in texts)
+    max_retries = settings["embed_max_retries"]
+    for attempt in range(max_retries + 1):
+        pause = _rate_limited_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        try:
+            async with scheduler.slot(tokens, priority):
+                vectors = await embeddings.aembed_documents(texts)
+            _embed_stats["batches"] += 1
+            return vectors
+        except RETRYABLE_ERRORS as e:
+            # An exhausted quota won't come back by waiting
+            if attempt == max_retries or getattr(e, "code", None) == "insufficient_quota":
+                _embed_stats["failed"] += 1
+                raise
+            delay = retry_delay(e, attempt)
+            if isinstance(e, openai.RateLimitError):
+                _embed_stats["rate_limited"] += 1
+                _rate_limited_until = max(_rate_limited_until, time.monotonic() + delay)
+            _embed_stats["retries"] += 1
+            print(f"Embedding batch of {len(texts)} failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
-from app.lib.rag.config import vector_store
 
+async def embed_documents(texts: list[str], priority: Priority = Priority.BULK) -> list[list[float]]:
+    """Embed document chunks in token-sized batches, a few in flight at once"""
+    counts = [count_tokens(t) for t in texts]
+    semaphore = asyncio.Semaphore(settings["embed_concurrency"])
 
-def sanitize_text(text: str) -> str:
-    """Remove null bytes and control characters"""
-    text = text.replace("\x00", "")
-    text = "".join(
-        char for char in text if char == "\n" or char == "\t" or ord(char) >= 32
-    )
-    return text.strip()
+    async def run(start: int, end: int) -> list[list[float]]:
+        async with semaphore:
+            return await embed_batch(texts[start:end], sum(counts[start:end]), priority)
+
+    results = await asyncio.gather(*(run(start, end) for start, end in token_batches(counts)))
+    return [vector for batch in results for vector in batch]
+
+
+def embedding_metrics() -> dict:
+    return dict(_embed_stats)
 
 
 async def similarity_search(
@@ -17,63 +124,83 @@ async def similarity_search(
     k: int = 5,
     score_threshold: float = 0.0,
     filter_metadata: dict | None = None,
+    authenticated: bool = True,
 ) -> list[dict]:
     """Search vector store for similar documents"""
+    # Imported here: the ingestion package imports this module
+    from app.lib.rag.ingestion.dedup import DEDUP_FIELDS
+
+    query_embedding = await embed_query(query, authenticated=authenticated)
+    relevance_fn = vector_store._select_relevance_score_fn()
+
+    # Near-duplicates are collapsed at ingestion (see ingestion/dedup.py), so the
+    # top k are k distinct passages. Rows stored before that (no minhash, until
+    # a --rebuild) can still repeat one; only then is it worth searching deeper
+    scored = await _search_by_vector(query_embedding, k, filter_metadata)
+    distinct = _distinct(scored)
+    if len(distinct) < len(scored):
+        distinct = _distinct(await _search_by_vector(query_embedding, k * 3, filter_metadata))[:k]
+
+    results = []
+    for doc, distance in distinct:
+        score = relevance_fn(distance)
+        if score < score_threshold:
+            continue
+        source = doc.metadata.get("source", "unknown")
+        results.append(
+            {
+                "content": doc.page_content,
+                "metadata": {key: value for key, value in doc.metadata.items() if key not in DEDUP_FIELDS},
+                "source": source,
+                # Every source the passage appears in
+                "sources": [source, *doc.metadata.get("alias_sources", [])],
+                "score": score,
+            }
+        )
+    return results
+
+
+async def _search_by_vector(embedding: list[float], k: int, filter_metadata: dict | None) -> list[tuple]:
     loop = asyncio.get_running_loop()
-    results = await loop.run_in_executor(
+    return await loop.run_in_executor(
         None,
-        lambda: vector_store.similarity_search_with_relevance_scores(
-            query=query, k=k * 3, filter=filter_metadata
-        ),
+        lambda: vector_store.similarity_search_with_score_by_vector(embedding, k=k, filter=filter_metadata),
     )
 
-    seen_content = set()
-    unique_results = []
-
-    for doc, score in results:
-        if score < score_threshold:
-            continue
 
-        # Use first 200 chars as dedup key
+def _distinct(scored: list[tuple]) -> list[tuple]:
+    """(document, distance) pairs without repeated passages, by their first 200 characters"""
+    seen, distinct = set(), []
+    for doc, distance in scored:
         content_key = doc.page_content[:200]
-
-        if content_key not in seen_content:
-            seen_content.add(content_key)
-            unique_results.append(
-                {
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "source": doc.metadata.get("source", "unknown"),
-                    "score": score,
-                }
-            )
-
-            if len(unique_results) >= k:
-                break
-
-    return unique_results
+        if content_key not in seen:
+            seen.add(content_key)
+            distinct.append((doc, distance))
+    return distinct
 
 
 async def get_ingested_sources() -> set[str]:
     """Return set of source URLs/paths already stored in the vector store"""
-    from app.config import get_settings
-    settings = get_settings()
-    db_url = settings["database_url"]
-    if not db_url.startswith("postgresql+psycopg2://"):
-        db_url = "postgresql+psycopg2://" + db_url[db_url.index("://") + 3:]
-
     def _query():
         import psycopg2
         try:
-            conn = psycopg2.connect(db_url)
+            # libpq takes the plain postgresql:// URL; the +psycopg2 form is SQLAlchemy's
+            conn = psycopg2.connect(settings["database_url"])
             try:
                 with conn.cursor() as cur:
+                    # Sources collapsed into other sources' chunks count as ingested
                     cur.execute("""
-                        SELECT DISTINCT metadata->>'source'
+                        SELECT cmetadata->>'source'
                         FROM langchain_pg_embedding
                         WHERE collection_id = (
                             SELECT uuid FROM langchain_pg_collection WHERE name = 'documents'
                         )
+                        UNION
+                        SELECT jsonb_array_elements_text(cmetadata->'alias_sources')
+                        FROM langchain_pg_embedding
+                        WHERE collection_id = (
+                            SELECT uuid FROM langchain_pg_collection WHERE name = 'documents'
+                        ) AND cmetadata ? 'alias_sources'
                     """)
                     return {row[0] for row in cur.fetchall() if row[0]}
             finally:
@@ -104,9 +231,14 @@ async def add_documents(texts: list[str], metadatas: list[dict] = None):
     valid_texts = [item[0] for item in valid_data]
     valid_metadatas = [item[1] for item in valid_data]
 
+    vectors = await embed_documents(valid_texts)
+
     loop = asyncio.get_running_loop()
     await loop.run_in_executor(
-        None, lambda: vector_store.add_texts(valid_texts, metadatas=valid_metadatas)
+        None,
+        lambda: vector_store.add_embeddings(
+            valid_texts, vectors, metadatas=valid_metadatas
+        ),
     )
 
     print(f"Added {len(valid_texts)} documents to vector store")
@@ -0,0 +1,235 @@
+import asyncio
+from contextlib import suppress
+from typing import Optional
+
+import psycopg
+
+from app.config import get_settings
+from app.lib.provider import CONNECTION_KWARGS
+from app.lib.runs import RUN_LOCK_NAMESPACE
+
+settings = get_settings()
+
+# Session lock held for a whole sweep so only one replica sweeps at a time
+_SWEEP_LOCK = (RUN_LOCK_NAMESPACE + 1, 0)
+# Chat rows are written before a run starts, so a UUID thread without one is left
+# over from a deleted chat. The grace period covers a chat created mid-sweep.
+_ORPHAN_GRACE_SECONDS = 3600
+# First sweep after startup; later sweeps every retention_interval_seconds
+_STARTUP_DELAY = 60
+
+_UUID_PATTERN = "^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+
+_retention_task: Optional[asyncio.Task] = None
+
+# One page of threads, keyed by thread_id, with what the sweep should do to each
+_THREAD_PAGE_SQL = """
+SELECT t.thread_id,
+       t.checkpoints,
+       (t.thread_id LIKE 'anon\\_%%'
+            AND t.last_ts < now() - make_interval(secs => %(anon_ttl)s)) AS expired,
+       (t.thread_id ~* %(uuid_pattern)s AND ch.id IS NULL
+            AND t.last_ts < now() - make_interval(secs => %(orphan_grace)s)) AS orphaned
+FROM (
+    SELECT thread_id,
+           count(*) AS checkpoints,
+           max((checkpoint->>'ts')::timestamptz) AS last_ts
+    FROM checkpoints
+    WHERE thread_id > %(after)s
+    GROUP BY thread_id
+    ORDER BY thread_id
+    LIMIT %(limit)s
+) t
+LEFT JOIN chats ch
+    ON ch.id = CASE WHEN t.thread_id ~* %(uuid_pattern)s THEN t.thread_id::uuid END
+ORDER BY t.thread_id
+"""
+
+# Oldest checkpoints beyond the newest `keep` per namespace, at most `limit` per call
+_PRUNE_SQL = """
+WITH doomed AS (
+    SELECT checkpoint_ns, checkpoint_id
+    FROM (
+        SELECT checkpoint_ns, checkpoint_id,
+               row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+        FROM checkpoints
+        WHERE thread_id = %(thread_id)s
+    ) ranked
+    WHERE rn > %(keep)s
+    ORDER BY checkpoint_id
+    LIMIT %(limit)s
+), writes AS (
+    DELETE FROM checkpoint_writes w
+    USING doomed d
+    WHERE w.thread_id = %(thread_id)s
+      AND w.checkpoint_ns = d.checkpoint_ns
+      AND w.checkpoint_id = d.checkpoint_id
+    RETURNING 1
+), pruned AS (
+    DELETE FROM checkpoints c
+    USING doomed d
+    WHERE c.thread_id = %(thread_id)s
+      AND c.checkpoint_ns = d.checkpoint_ns
+      AND c.checkpoint_id = d.checkpoint_id
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM pruned), (SELECT count(*) FROM writes)
+"""
+
+# Blobs are shared across checkpoints by channel version; keep any version a
+# remaining checkpoint still points at
+_UNREFERENCED_BLOBS_SQL = """
+DELETE FROM checkpoint_blobs b
+WHERE b.thread_id = %(thread_id)s
+  AND NOT EXISTS (
+      SELECT 1 FROM checkpoints c
+      WHERE c.thread_id = b.thread_id
+        AND c.checkpoint_ns = b.checkpoint_ns
+        AND c.checkpoint->'channel_versions'->>b.channel = b.version
+  )
+"""
+
+
+def _empty_stats() -> dict:
+    return {
+        "threads_scanned": 0,
+        "threads_pruned": 0,
+        "threads_expired": 0,
+        "threads_orphaned": 0,
+        "threads_busy": 0,
+        "checkpoints_deleted": 0,
+        "writes_deleted": 0,
+        "blobs_deleted": 0,
+    }
+
+
+async def _try_thread_lock(conn: psycopg.AsyncConnection, thread_id: str) -> bool:
+    """Transaction-scoped lock on the thread's run lock; fails while a run holds it"""
+    cur = await conn.execute(
+        "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))",
+        (RUN_LOCK_NAMESPACE, thread_id),
+    )
+    row = await cur.fetchone()
+    return bool(row and row[0])
+
+
+async def _delete_thread(conn: psycopg.AsyncConnection, thread_id: str, stats: dict) -> bool:
+    async with conn.transaction():
+        if not await _try_thread_lock(conn, thread_id):
+            return False
+        cur = await conn.execute("DELETE FROM checkpoint_writes WHERE thread_id = %s", (thread_id,))
+        stats["writes_deleted"] += cur.rowcount
+        cur = await conn.execute("DELETE FROM checkpoint_blobs WHERE thread_id = %s", (thread_id,))
+        stats["blobs_deleted"] += cur.rowcount
+        cur = await conn.execute("DELETE FROM checkpoints WHERE thread_id = %s", (thread_id,))
+        stats["checkpoints_deleted"] += cur.rowcount
+    return True
+
+
+async def _prune_thread(
+    conn: psycopg.AsyncConnection, thread_id: str, keep: int, batch_size: int, stats: dict
+) -> bool:
+    params = {"thread_id": thread_id, "keep": keep, "limit": batch_size}
+    while True:
+        # One transaction per chunk so a long history never holds the thread for long
+        async with conn.transaction():
+            if not await _try_thread_lock(conn, thread_id):
+                return False
+            cur = await conn.execute(_PRUNE_SQL, params)
+            pruned, writes = await cur.fetchone()
+            cur = await conn.execute(_UNREFERENCED_BLOBS_SQL, params)
+            stats["checkpoints_deleted"] += pruned
+            stats["writes_deleted"] += writes
+            stats["blobs_deleted"] += cur.rowcount
+        if pruned < batch_size:
+            return True
+
+
+async def sweep(
+    keep: Optional[int] = None,
+    anon_ttl_hours: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    batch_pause: Optional[float] = None,
+) -> Optional[dict]:
+    """Prune, expire and delete orphaned checkpoint threads in one pass over the table.
+
+    Returns per-sweep counts, or None if another replica is already sweeping.
+    """
+    keep = keep or settings["retention_keep_checkpoints"]
+    anon_ttl_hours = settings["retention_anon_ttl_hours"] if anon_ttl_hours is None else anon_ttl_hours
+    batch_size = batch_size or settings["retention_batch_size"]
+    batch_pause = settings["retention_batch_pause"] if batch_pause is None else batch_pause
+
+    stats = _empty_stats()
+    async with await psycopg.AsyncConnection.connect(
+        settings["database_url"], **CONNECTION_KWARGS
+    ) as conn:
+        cur = await conn.execute("SELECT pg_try_advisory_lock(%s, %s)", _SWEEP_LOCK)
+        if not (await cur.fetchone())[0]:
+            print("Checkpoint retention: another sweep is running, skipping")
+            return None
+
+        after = ""
+        while True:
+            cur = await conn.execute(
+                _THREAD_PAGE_SQL,
+                {
+                    "after": after,
+                    "limit": batch_size,
+                    "anon_ttl": anon_ttl_hours * 3600,
+                    "orphan_grace": _ORPHAN_GRACE_SECONDS,
+                    "uuid_pattern": _UUID_PATTERN,
+                },
+            )
+            page = await cur.fetchall()
+            if not page:
+                break
+
+            for thread_id, checkpoints, expired, orphaned in page:
+                stats["threads_scanned"] += 1
+                if expired or orphaned:
+                    done = await _delete_thread(conn, thread_id, stats)
+                    key = "threads_expired" if expired else "threads_orphaned"
+                elif checkpoints > keep:
+                    done = await _prune_thread(conn, thread_id, keep, batch_size, stats)
+                    key = "threads_pruned"
+                else:
+                    continue
+                stats[key if done else "threads_busy"] += 1
+
+            after = page[-1][0]
+            if len(page) < batch_size:
+                break
+            # Give live traffic room between pages
+            await asyncio.sleep(batch_pause)
+
+    print(f"Checkpoint retention: {stats}")
+    return stats
+
+
+async def _retention_loop(interval: int):
+    await asyncio.sleep(_STARTUP_DELAY)
+    while True:
+        try:
+            await sweep()
+        except Exception as e:
+            print(f"Checkpoint retention sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_retention():
+    global _retention_task
+    interval = settings["retention_interval_seconds"]
+    if interval <= 0:
+        print("Checkpoint retention disabled (RETENTION_INTERVAL_SECONDS=0)")
+        return
+    _retention_task = asyncio.create_task(_retention_loop(interval))
+
+
+async def stop_retention():
+    global _retention_task
+    if _retention_task:
+        _retention_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _retention_task
+        _retention_task = None
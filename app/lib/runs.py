@@ -0,0 +1,180 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Optional
+
+from psycopg.errors import LockNotAvailable
+
+from app.lib.provider import active_run, get_lock_pool
+
+# First key of the two-key advisory lock; second key is hashtext(thread_id)
+RUN_LOCK_NAMESPACE = 7351
+# How long a new run waits for the previous holder (possibly on another replica) to let go
+_LOCK_WAIT = "15s"
+# How often a lock holder checks whether a newer run is waiting for its thread
+_WAITER_POLL_INTERVAL = 1.0
+# How long a superseding run waits for the stale local run to unwind
+_SUPERSEDE_TIMEOUT = 5.0
+
+_DONE = object()
+
+
+class Run:
+    """One graph run on a thread. Superseding it cancels whatever it is iterating."""
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.superseded = False
+        self._task: Optional[asyncio.Task] = None
+        self._finished = asyncio.Event()
+
+    def supersede(self):
+        self.superseded = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def iterate(self, source: AsyncIterator) -> AsyncIterator:
+        """Drain `source` in a task we own so supersede() can stop it mid-stream.
+
+        Ends quietly when superseded; check `run.superseded` afterwards.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            # Seen by the checkpointer, in this task and those the graph starts from it
+            active_run.set(self)
+            try:
+                async for item in source:
+                    queue.put_nowait((item, None))
+                queue.put_nowait((_DONE, None))
+            except asyncio.CancelledError:
+                queue.put_nowait((_DONE, None))
+                raise
+            except Exception as e:
+                queue.put_nowait((_DONE, e))
+
+        self._task = asyncio.create_task(pump())
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is _DONE:
+                    if error:
+                        raise error
+                    return
+                yield item
+        finally:
+            # Client went away (or we raised): stop the graph instead of streaming into the void
+            if not self._task.done():
+                self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+
+class RunCoordinator:
+    """Allows one live run per thread; a new run supersedes the in-flight one.
+
+    Locally the stale run is cancelled directly. Across replicas every run holds
+    a session advisory lock on its thread and polls pg_locks for a newer waiter,
+    cancelling itself when one shows up.
+    """
+
+    def __init__(self):
+        self._runs: dict[str, Run] = {}
+
+    @asynccontextmanager
+    async def claim(self, thread_id: str) -> AsyncIterator[Run]:
+        run = Run(thread_id)
+        previous = self._runs.get(thread_id)
+        self._runs[thread_id] = run
+
+        if previous:
+            print(f"Superseding in-flight run on thread {thread_id}")
+            previous.supersede()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(previous._finished.wait(), _SUPERSEDE_TIMEOUT)
+
+        try:
+            async with _advisory_lock(run):
+                yield run
+        finally:
+            run._finished.set()
+            if self._runs.get(thread_id) is run:
+                del self._runs[thread_id]
+
+
+@asynccontextmanager
+async def _advisory_lock(run: Run):
+    """Hold the thread's advisory lock for the duration of the run (best effort)."""
+    try:
+        pool = get_lock_pool()
+        conn = await pool.getconn(timeout=2.0)
+    except Exception as e:
+        print(f"Run lock unavailable, coordinating locally only: {e}")
+        yield
+        return
+
+    locked = False
+    stop = asyncio.Event()
+    watcher = None
+    try:
+        try:
+            await conn.execute(f"SET lock_timeout = '{_LOCK_WAIT}'")
+            # Blocks while an older run holds the lock; that run sees us waiting and yields
+            await conn.execute(
+                "SELECT pg_advisory_lock(%s, hashtext(%s))",
+                (RUN_LOCK_NAMESPACE, run.thread_id),
+            )
+            locked = True
+        except LockNotAvailable:
+            print(f"Timed out waiting for run lock on thread {run.thread_id}, proceeding")
+        finally:
+            await conn.execute("RESET lock_timeout")
+
+        if locked:
+            watcher = asyncio.create_task(_watch_for_newer_run(conn, run, stop))
+        yield
+    finally:
+        stop.set()
+        if watcher:
+            await watcher
+        try:
+            # unlock_all rather than unlock: also covers a lock granted after we were
+            # cancelled mid-wait, which would otherwise go back to the pool still held
+            await conn.execute("SELECT pg_advisory_unlock_all()")
+        except Exception as e:
+            print(f"Run lock release failed: {e}")
+        finally:
+            await pool.putconn(conn)
+
+
+async def _watch_for_newer_run(conn, run: Run, stop: asyncio.Event):
+    # Only ever stopped through `stop` so the shared connection is never cancelled mid-query
+    while not run.superseded:
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), _WAITER_POLL_INTERVAL)
+        if stop.is_set():
+            return
+        try:
+            cur = await conn.execute(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_locks
+                    WHERE locktype = 'advisory'
+                      AND classid = %s::oid
+                      AND objid = (hashtext(%s)::bigint & 4294967295)::oid
+                      AND objsubid = 2
+                      AND NOT granted
+                )
+                """,
+                (RUN_LOCK_NAMESPACE, run.thread_id),
+            )
+            row = await cur.fetchone()
+        except Exception as e:
+            print(f"Run lock watcher stopped: {e}")
+            return
+        if row and row[0]:
+            print(f"Newer run waiting on thread {run.thread_id}, superseding this one")
+            run.supersede()
+            return
+
+
+run_coordinator = RunCoordinator()
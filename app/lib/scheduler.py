@@ -0,0 +1,315 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import openai
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Rolling window the OpenAI TPM/RPM limits are measured over
+_WINDOW_SECONDS = 60.0
+
+
+class Priority(enum.IntEnum):
+    """Scheduling classes. Lower value is served first."""
+
+    INTERACTIVE = 0  # classify, answer generation, query embeddings
+    BACKGROUND = 1  # chat titles, follow-up suggestions
+    BULK = 2  # ingestion embeddings
+
+
+# Only background work is dropped under pressure. Interactive calls are always
+# admitted and bulk calls just wait, ingestion can afford to be slow.
+_SHEDDABLE = {Priority.BACKGROUND}
+
+# How long a sheddable call may sit in the queue before it's given up on
+_MAX_SHEDDABLE_WAIT = 10.0
+
+# Transient failures worth retrying. The OpenAI clients are built with
+# max_retries=0 and callers retry these themselves, taking a new slot per
+# attempt, so every request the API sees is admitted and counted here.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 60.0
+
+
+class LLMOverloaded(Exception):
+    """Raised when a low-priority call is shed instead of queued."""
+
+
+class _Ticket:
+    __slots__ = ("rank", "tokens", "priority", "authenticated", "future", "enqueued_at")
+
+    def __init__(self, rank, tokens, priority, authenticated, future, enqueued_at):
+        self.rank = rank
+        self.tokens = tokens
+        self.priority = priority
+        self.authenticated = authenticated
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return self.rank < other.rank
+
+
+class _Grant:
+    """Handle for an admitted call; report real usage through `record_usage`."""
+
+    __slots__ = ("scheduler", "entry")
+
+    def __init__(self, scheduler: "LLMScheduler", entry: list):
+        self.scheduler = scheduler
+        self.entry = entry
+
+    def record_usage(self, total_tokens: Optional[int]):
+        """Replace the admission estimate with the provider-reported token count."""
+        if total_tokens is not None:
+            self.scheduler._correct(self.entry, total_tokens)
+
+
+class LLMScheduler:
+    """Process-wide admission control for OpenAI calls.
+
+    Calls wait in a priority queue until there is room under the requests-per-
+    minute and tokens-per-minute budgets and the concurrency cap. Ordering is
+    (priority, anonymous, arrival), so signed-in users go first within a class.
+    """
+
+    def __init__(
+        self,
+        tpm_limit: int,
+        rpm_limit: int,
+        max_concurrency: int,
+        max_queue: int,
+    ):
+        self.tpm_limit = tpm_limit
+        self.rpm_limit = rpm_limit
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+
+        self._queue: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        # [granted_at, tokens] per admitted call inside the rolling window
+        self._window: deque[list] = deque()
+        self._window_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self._stats = {
+            p.name.lower(): {"admitted": 0, "shed": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for p in Priority
+        }
+
+    # ---- budget bookkeeping ----
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] >= _WINDOW_SECONDS:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _has_capacity(self, tokens: int, now: float) -> bool:
+        self._prune(now)
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if len(self._window) >= self.rpm_limit:
+            return False
+        # An oversized call is let through on an empty window rather than starving forever
+        if self._window and self._window_tokens + tokens > self.tpm_limit:
+            return False
+        return True
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._queue:
+            ticket = self._queue[0]
+            if ticket.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if not self._has_capacity(ticket.tokens, now):
+                break
+            heapq.heappop(self._queue)
+            ticket.future.set_result(self._admit(ticket, now))
+
+        # Budget-limited (not concurrency-limited): wake up when the oldest entry ages out
+        if self._queue and self._timer is None and self._in_flight < self.max_concurrency and self._window:
+            delay = max(self._window[0][0] + _WINDOW_SECONDS - now, 0.01)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _admit(self, ticket: _Ticket, now: float) -> _Grant:
+        entry = [now, ticket.tokens]
+        self._window.append(entry)
+        self._window_tokens += ticket.tokens
+        self._in_flight += 1
+
+        waited = now - ticket.enqueued_at
+        stats = self._stats[ticket.priority.name.lower()]
+        stats["admitted"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+        return _Grant(self, entry)
+
+    def _correct(self, entry: list, tokens: int):
+        # Pruned first, so an entry old enough to leave the window has left it with the
+        # tokens it was counted with; only entries still in the window are corrected
+        now = time.monotonic()
+        self._prune(now)
+        if now - entry[0] < _WINDOW_SECONDS:
+            self._window_tokens += tokens - entry[1]
+            entry[1] = tokens
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _abandon(self, ticket: _Ticket):
+        """Give up on a queued ticket, returning its slot if it was admitted meanwhile."""
+        future = ticket.future
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled() and future.exception() is None:
+            self._release()
+
+    def _shed(self, priority: Priority):
+        self._stats[priority.name.lower()]["shed"] += 1
+        return LLMOverloaded(f"LLM queue saturated, dropped {priority.name.lower()} call")
+
+    def _depth(self) -> int:
+        return sum(1 for t in self._queue if not t.future.done())
+
+    def _evict_sheddable(self):
+        """Drop the lowest-ranked sheddable waiter to make room for a more important call."""
+        candidates = [t for t in self._queue if t.priority in _SHEDDABLE and not t.future.done()]
+        if candidates:
+            victim = max(candidates)
+            victim.future.set_exception(self._shed(victim.priority))
+
+    # ---- public API ----
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        tokens: int,
+        priority: Priority = Priority.INTERACTIVE,
+        authenticated: bool = True,
+    ) -> AsyncIterator[_Grant]:
+        """Wait for admission, hold a concurrency slot for the duration of the block."""
+        now = time.monotonic()
+        sheddable = priority in _SHEDDABLE
+        depth = self._depth()
+
+        # Under pressure titles and suggestions give way before they queue;
+        # interactive and bulk calls are never refused, they displace sheddable waiters
+        if sheddable and depth >= self.max_queue // 2:
+            raise self._shed(priority)
+        if depth >= self.max_queue:
+            self._evict_sheddable()
+
+        ticket = _Ticket(
+            rank=(int(priority), 0 if authenticated else 1, next(self._seq)),
+            tokens=tokens,
+            priority=priority,
+            authenticated=authenticated,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=now,
+        )
+        heapq.heappush(self._queue, ticket)
+        self._dispatch()
+
+        try:
+            await asyncio.wait(
+                {ticket.future},
+                timeout=_MAX_SHEDDABLE_WAIT if sheddable else None,
+            )
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+        if not ticket.future.done():
+            self._abandon(ticket)
+            raise self._shed(priority)
+        grant = ticket.future.result()  # raises LLMOverloaded if we were evicted
+
+        try:
+            yield grant
+        finally:
+            self._release()
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        self._prune(now)
+        depth = {p.name.lower(): 0 for p in Priority}
+        oldest_wait = 0.0
+        for ticket in self._queue:
+            if ticket.future.done():
+                continue
+            depth[ticket.priority.name.lower()] += 1
+            oldest_wait = max(oldest_wait, now - ticket.enqueued_at)
+
+        by_priority = {}
+        for name, s in self._stats.items():
+            by_priority[name] = {
+                "admitted": s["admitted"],
+                "shed": s["shed"],
+                "queued": depth[name],
+                "avg_wait_ms": round(1000 * s["wait_total"] / s["admitted"], 1) if s["admitted"] else 0.0,
+                "max_wait_ms": round(1000 * s["wait_max"], 1),
+            }
+
+        return {
+            "queue_depth": sum(depth.values()),
+            "oldest_wait_ms": round(1000 * oldest_wait, 1),
+            "in_flight": self._in_flight,
+            "requests_last_minute": len(self._window),
+            "tokens_last_minute": self._window_tokens,
+            "limits": {
+                "tpm": self.tpm_limit,
+                "rpm": self.rpm_limit,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+            },
+            "by_priority": by_priority,
+        }
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying after error: the server's Retry-After, else jittered backoff"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    # Full jitter so parallel calls don't retry in lockstep
+    return random.uniform(0, min(_BACKOFF_BASE * 2 ** attempt, _BACKOFF_MAX))
+
+
+def estimate_tokens(texts: list[str], completion_tokens: int = 0) -> int:
+    """Cheap token estimate (~4 chars per token) used for admission before the real count is known."""
+    return sum(len(t) for t in texts) // 4 + completion_tokens + 1
+
+
+scheduler = LLMScheduler(
+    tpm_limit=settings["llm_tpm_limit"],
+    rpm_limit=settings["llm_rpm_limit"],
+    max_concurrency=settings["llm_max_concurrency"],
+    max_queue=settings["llm_max_queue"],
+)
@@ -0,0 +1,137 @@
+"""
+CPU-bound text preparation for ingestion: normalize, split, sanitize, hash,
+and the near-duplicate comparisons.
+
+Run in the ingestion process pool (app/lib/workers.py), so this module
+imports nothing from app.lib.rag. Functions take and return plain strings
+and tuples; metadata stays in the parent and is joined back on there.
+
+Cleaning is one precompiled regex pass per text. Output matches the
+cleantext call and per-character filter these replaced (checked by
+scripts/bench_text_cleaning.py).
+"""
+
+import hashlib
+import re
+from typing import Optional
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Runs of plain spaces; tabs, newlines and other whitespace are left alone
+_SPACE_RUNS = re.compile(" {2,}")
+# C0 control characters but tab and newline, \x00 and \r included. A regex class
+# rather than str.translate, which is slower than the old filter on non-ASCII text
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b-\x1f]")
+_WORDS = re.compile(r"\w+")
+
+# Near-duplicate detection compares sets of word n-grams of this length
+SHINGLE_WORDS = 3
+# Chunks with fewer shingles (headings, short lists) are never collapsed
+MIN_SHINGLES = 10
+# MinHash signature of 64 values read as 16 LSH bands of 4. Pairs at Jaccard
+# 0.8 share a band with probability ~0.9998, unrelated ones rarely.
+MINHASH_PERMUTATIONS = 64
+MINHASH_BAND_ROWS = 4
+_MERSENNE_61 = np.uint64((1 << 61) - 1)
+# Derived from fixed seeds so band keys stay comparable across runs and versions
+_MINHASH_A, _MINHASH_B = (
+    np.array(
+        [int.from_bytes(hashlib.blake2b(f"{name}{i}".encode(), digest_size=4).digest(), "little") | 1
+         for i in range(MINHASH_PERMUTATIONS)],
+        dtype=np.uint64,
+    )
+    for name in ("a", "b")
+)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of spaces and trim the ends"""
+    if not text:
+        raise ValueError("No text is provided to clean")
+    return _SPACE_RUNS.sub(" ", text).strip()
+
+
+def sanitize_text(text: str) -> str:
+    """Remove null bytes and control characters"""
+    return _CONTROL_CHARS.sub("", text).strip()
+
+
+# Shared text splitter
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    length_function=len,
+    separators=["\n\n", "\n", ".", " ", ""],
+)
+
+
+def chunk_hash(page, text: str) -> str:
+    """Identity of a chunk across runs; the page is part of it, as it ends up in its metadata"""
+    return hashlib.sha256(f"{page if page is not None else ''}\x00{text}".encode()).hexdigest()
+
+
+def shingles(text: str) -> set[str]:
+    """The chunk's word n-grams, lowercased"""
+    words = _WORDS.findall(text.lower())
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def minhash_bands(text: str) -> Optional[str]:
+    """LSH band keys of the chunk's MinHash signature, 8 hex digits per band.
+
+    Chunks sharing any band key are candidate near-duplicates, to be confirmed
+    with jaccard(). None for chunks too short to compare reliably.
+    """
+    grams = shingles(text)
+    if len(grams) < MIN_SHINGLES:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little") for g in grams],
+        dtype=np.uint64,
+    )
+    # (a * x + b) mod p per hash function; a, b and x < 2**32 so nothing overflows
+    signature = ((np.outer(_MINHASH_A, hashes) + _MINHASH_B[:, None]) % _MERSENNE_61).min(axis=1)
+    return "".join(
+        hashlib.blake2b(band.tobytes(), digest_size=4).hexdigest()
+        for band in signature.reshape(-1, MINHASH_BAND_ROWS)
+    )
+
+
+def closest_matches(texts: list[str], candidates: list[list[str]], threshold: float) -> list[Optional[int]]:
+    """For each text, the index of its most similar candidate, if at least threshold Jaccard"""
+    matches = []
+    for text, options in zip(texts, candidates):
+        grams = shingles(text)
+        scores = [jaccard(grams, shingles(option)) for option in options]
+        best = max(range(len(scores)), key=scores.__getitem__, default=None)
+        matches.append(best if best is not None and scores[best] >= threshold else None)
+    return matches
+
+
+def normalize_texts(texts: list[str]) -> list[str]:
+    return [normalize_text(text) for text in texts]
+
+
+def split_pages(texts: list[str], pages: list) -> list[tuple[str, int, str, Optional[str]]]:
+    """Split each page's text into sanitized chunks.
+
+    Returns (chunk, index of its page in texts, chunk_hash, minhash_bands);
+    pages[i] is the page number of texts[i] (or None) that goes into the hash.
+    """
+    chunks = []
+    for index, (text, page) in enumerate(zip(texts, pages)):
+        for piece in text_splitter.split_text(text):
+            piece = sanitize_text(piece)
+            if piece:
+                chunks.append((piece, index, chunk_hash(page, piece), minhash_bands(piece)))
+    return chunks
+
+
+def chunk_texts(texts: list[str]) -> list[list[str]]:
+    """Normalize and split each text, for the one-shot ingest_* helpers"""
+    return [text_splitter.split_text(normalize_text(text)) for text in texts]
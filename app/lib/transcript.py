@@ -0,0 +1,85 @@
+import uuid
+from typing import Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import ChatMessage
+
+
+def _row(chat_id: uuid.UUID, seq: int, msg: BaseMessage) -> dict:
+    return {
+        "chat_id": chat_id,
+        "seq": seq,
+        "role": "user" if isinstance(msg, HumanMessage) else "assistant",
+        "content": msg.content if isinstance(msg.content, str) else str(msg.content),
+        "message_id": msg.id,
+    }
+
+
+async def record_transcript(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    messages: list[BaseMessage],
+    start: Optional[int] = None,
+):
+    """Mirror the thread's final message list into chat_messages.
+
+    Only positions from `start` on are written; by default that is the turn
+    just taken plus anything missing below it (legacy chats, a failed write).
+    Rows past the end of `messages` are dropped.
+    """
+    if start is None:
+        head = await transcript_head(db, chat_id)
+        start = min(head, max(len(messages) - 2, 0))
+
+    rows = [_row(chat_id, seq, msg) for seq, msg in enumerate(messages) if seq >= start]
+    if rows:
+        stmt = insert(ChatMessage).values(
+            [{"id": uuid.uuid4(), "created_at": func.now(), **row} for row in rows]
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                constraint="uq_chat_messages_chat_id_seq",
+                set_={
+                    "role": stmt.excluded.role,
+                    "content": stmt.excluded.content,
+                    "message_id": stmt.excluded.message_id,
+                    "created_at": stmt.excluded.created_at,
+                },
+                where=or_(
+                    ChatMessage.message_id.is_distinct_from(stmt.excluded.message_id),
+                    ChatMessage.content != stmt.excluded.content,
+                ),
+            )
+        )
+    await db.execute(
+        delete(ChatMessage).where(ChatMessage.chat_id == chat_id, ChatMessage.seq >= len(messages))
+    )
+
+
+async def transcript_head(db: AsyncSession, chat_id: uuid.UUID) -> int:
+    """Number of messages in the transcript (next seq to write)"""
+    result = await db.execute(
+        select(func.coalesce(func.max(ChatMessage.seq) + 1, 0)).where(ChatMessage.chat_id == chat_id)
+    )
+    return result.scalar_one()
+
+
+async def read_transcript(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    limit: Optional[int] = None,
+    before: Optional[int] = None,
+) -> list[ChatMessage]:
+    """Messages newest-first, optionally only those with seq < before, at most `limit`"""
+    query = select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+    if before is not None:
+        query = query.where(ChatMessage.seq < before)
+    query = query.order_by(ChatMessage.seq.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return list(result.scalars().all())
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import datetime
+from typing import Optional
+
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.lib.provider import CONNECTION_KWARGS
+
+settings = get_settings()
+
+# NOTIFY channel every replica LISTENs on; payload is one chat id
+INVALIDATION_CHANNEL = "trip_context_invalidate"
+# Identifies our own notifications, which are already applied locally
+_REPLICA_ID = uuid.uuid4().hex
+_RECONNECT_DELAY = 5.0
+# Ping the LISTEN connection when quiet, well inside Neon's idle timeout
+_LISTEN_PING_INTERVAL = 60.0
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+class _Entry:
+    __slots__ = ("value", "updated_at", "stored_at")
+
+    def __init__(self, value: Optional[dict], updated_at: Optional[datetime]):
+        # value is None for a chat that has no trip context (also worth caching)
+        self.value = value
+        self.updated_at = updated_at
+        self.stored_at = time.monotonic()
+
+
+class TripContextCache:
+    """LRU of serialized trip contexts keyed by chat id.
+
+    Only serves reads while the invalidation listener is connected, so a replica
+    that might be missing notifications falls back to the database. The TTL
+    bounds staleness if a notification is ever lost anyway.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = False
+        self._entries: OrderedDict[uuid.UUID, _Entry] = OrderedDict()
+        # Bumped by every invalidation; fills that started earlier are dropped
+        self._generation = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "remote_invalidations": 0,
+            "stale_fills_dropped": 0,
+        }
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+
+    def get(self, chat_id: uuid.UUID) -> Optional[_Entry]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl:
+            del self._entries[chat_id]
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(chat_id)
+        self._stats["hits"] += 1
+        return entry
+
+    def fill_token(self) -> int:
+        """Take before reading the database; hand back to put()"""
+        return self._generation
+
+    def put(
+        self,
+        chat_id: uuid.UUID,
+        value: Optional[dict],
+        updated_at: Optional[datetime],
+        token: int,
+    ):
+        if not self.enabled:
+            return
+        if token != self._generation:
+            # Something was invalidated while we were reading; our copy may predate it
+            self._stats["stale_fills_dropped"] += 1
+            return
+        self._entries[chat_id] = _Entry(value, updated_at)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, chat_id: uuid.UUID):
+        self._generation += 1
+        self._entries.pop(chat_id, None)
+        self._stats["invalidations"] += 1
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def record_remote(self, chat_id: uuid.UUID, sent_at: float):
+        self.invalidate(chat_id)
+        self._stats["remote_invalidations"] += 1
+        lag = max(time.time() - sent_at, 0.0)
+        self._lag_total += lag
+        self._lag_max = max(self._lag_max, lag)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        lookups = self._stats["hits"] + self._stats["misses"]
+        remote = self._stats["remote_invalidations"]
+        oldest = max((now - e.stored_at for e in self._entries.values()), default=0.0)
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self._stats,
+            # How long other replicas' writes take to reach us; the staleness window
+            "avg_invalidation_lag_ms": round(1000 * self._lag_total / remote, 1) if remote else 0.0,
+            "max_invalidation_lag_ms": round(1000 * self._lag_max, 1),
+            "oldest_entry_age_seconds": round(oldest, 1),
+        }
+
+
+trip_context_cache = TripContextCache(
+    max_size=settings["trip_context_cache_size"],
+    ttl=settings["trip_context_cache_ttl"],
+)
+
+
+def invalidation_payload(chat_id: uuid.UUID) -> str:
+    return json.dumps({"chat_id": str(chat_id), "origin": _REPLICA_ID, "sent_at": time.time()})
+
+
+async def publish_invalidation(db: AsyncSession, chat_id: uuid.UUID):
+    """Queue a NOTIFY that other replicas receive on commit.
+
+    Invalidate the local copy after the commit, so a concurrent fill that read
+    the old row cannot land after it.
+    """
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": INVALIDATION_CHANNEL, "payload": invalidation_payload(chat_id)},
+    )
+
+
+def _apply_notification(payload: str):
+    try:
+        message = json.loads(payload)
+        chat_id = uuid.UUID(message["chat_id"])
+    except (ValueError, KeyError, TypeError):
+        print(f"Ignoring malformed trip context invalidation: {payload!r}")
+        return
+    if message.get("origin") == _REPLICA_ID:
+        return
+    trip_context_cache.record_remote(chat_id, float(message.get("sent_at", time.time())))
+
+
+async def _listen():
+    # LISTEN needs a session-level connection: behind a transaction-mode pooler
+    # notifications are not delivered and entries only age out through the TTL
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                settings["database_url"], **CONNECTION_KWARGS
+            ) as conn:
+                await conn.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                # Anything cached before this point may have missed a notification
+                trip_context_cache.clear()
+                trip_context_cache.enabled = True
+                print("Trip context cache listening for invalidations")
+                while True:
+                    async for notify in conn.notifies(timeout=_LISTEN_PING_INTERVAL):
+                        _apply_notification(notify.payload)
+                    await conn.execute("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Trip context invalidation listener lost: {e}")
+        finally:
+            trip_context_cache.enabled = False
+        await asyncio.sleep(_RECONNECT_DELAY)
+
+
+def start_invalidation_listener():
+    global _listener_task
+    _listener_task = asyncio.create_task(_listen())
+
+
+async def stop_invalidation_listener():
+    global _listener_task
+    if _listener_task:
+        _listener_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _listener_task
+        _listener_task = None
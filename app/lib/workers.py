@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+
+from app.config import get_settings
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def worker_count() -> int:
+    """Size of the process pool"""
+    configured = settings["ingest_process_workers"]
+    if configured:
+        return configured
+    # Leave a core for the event loop
+    return max((os.cpu_count() or 1) - 1, 1)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound ingestion work, started on first use.
+
+    Workers are spawned rather than forked: the parent holds DB pools, an event
+    loop and threads that must not be copied. Functions sent to the pool must
+    live in modules that import cheaply (app.lib.pdf_extract, app.lib.text_prep),
+    not under app.lib.rag, whose package import builds the vector store.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=worker_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def run_in_process(fn: Callable[..., T], *args) -> T:
+    """Run fn(*args) in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(fn, *args))
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -3,6 +3,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.lib.provider import initialize_graph, shutdown_graph
+from app.lib.rag.ingestion.jobs import start_ingest_worker, stop_ingest_worker
+from app.lib.rag.ingestion.writer import start_index_restore, stop_index_restore
+from app.lib.retention import start_retention, stop_retention
+from app.lib.trip_context_cache import start_invalidation_listener, stop_invalidation_listener
+from app.lib.workers import shutdown_executor
 from app.routers import api_router
 
 
@@ -10,11 +15,20 @@ from app.routers import api_router
 async def lifespan(_app: FastAPI):
     print("Application startup")
     await initialize_graph()
+    start_retention()
+    start_invalidation_listener()
+    start_ingest_worker()
+    start_index_restore()
 
     yield
 
     print("Application shutdown")
+    await stop_index_restore()
+    await stop_ingest_worker()
+    await stop_invalidation_listener()
+    await stop_retention()
     await shutdown_graph()
+    shutdown_executor()
 
 
 app = FastAPI(title="Airmini API", version="1.0.0", lifespan=lifespan)
@@ -30,6 +44,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read our custom response headers
+    expose_headers=["X-Chat-Id", "X-Next-Cursor"],
 )
 # Binding all routers
 app.include_router(api_router)
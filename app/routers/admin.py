@@ -1,41 +1,113 @@
-from fastapi import APIRouter, BackgroundTasks
+import uuid
+from typing import Optional
 
-from app.lib.rag.ingestion.core import ingest_documents_batch
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.datastructures import UploadFile
+
+from app.auth.clerk import get_admin_user
+from app.config import get_settings
+from app.lib.rag.ingestion.jobs import enqueue, job_status
+from app.lib.rag.ingestion.manifest import load_manifest
+from app.lib.rag.ingestion.uploads import save_upload, upload_path, upload_type
 from app.lib.rag.vectorstore import get_ingested_sources
+from app.lib.scheduler import scheduler
+from app.lib.trip_context_cache import trip_context_cache
+
+settings = get_settings()
 
 router = APIRouter()
 
-_status = {"running": False, "last": None}
 
+@router.post("/ingest")
+async def trigger_ingestion():
+    """Queue an ingestion job over the manifest's sources for the ingestion workers"""
+    sources = load_manifest()
+    job_id, created = await enqueue(sources, requested_by="admin")
+    if not created:
+        return {"status": "already_running", "job_id": job_id}
+    return {"status": "queued", "job_id": job_id, "sources_count": len(sources)}
 
-async def _run_ingestion(sources: list[dict]):
-    global _status
-    _status["running"] = True
-    try:
-        await ingest_documents_batch(sources)
-        _status["last"] = "success"
-    except Exception as e:
-        _status["last"] = f"error: {e}"
-    finally:
-        _status["running"] = False
 
+def _upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Uploads are limited to {settings['ingest_upload_max_mb']} MB per request",
+    )
 
-@router.post("/ingest")
-async def trigger_ingestion(background_tasks: BackgroundTasks):
-    """Start document ingestion in the background using the default source list"""
-    from scripts.ingest_documents import SOURCES
 
-    if _status["running"]:
-        return {"status": "already_running"}
+def _limit_body(request: Request, limit: int) -> Request:
+    """The request, failing with 413 as soon as more than limit bytes of body arrive.
+
+    Checked as the body streams in, so an oversized upload is never spooled
+    whole, with or without a Content-Length.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise _upload_too_large()
+        return message
+
+    return Request(request.scope, receive)
+
 
-    background_tasks.add_task(_run_ingestion, SOURCES)
-    return {"status": "started", "sources_count": len(SOURCES)}
+@router.post("/ingest/upload")
+async def upload_documents(request: Request, admin: dict = Depends(get_admin_user)):
+    """Store uploaded PDF or text files and queue them for ingestion with the given metadata.
+
+    A multipart form of one or more files, with optional airline_code and
+    country_code fields. Only for signed-in users in ADMIN_USER_IDS: the
+    documents become knowledge base sources the assistant cites. Poll
+    GET /ingest/status?job_id=... for the result.
+    """
+    # Read here rather than as File/Form parameters, which FastAPI would parse
+    # before checking the caller or the size
+    limit = settings["ingest_upload_max_mb"] * 1024 * 1024
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise _upload_too_large()
+    async with _limit_body(request, limit).form() as form:
+        files = form.getlist("files")
+        if not files or not all(isinstance(file, UploadFile) for file in files):
+            raise HTTPException(status_code=422, detail="Send the documents as files in the files field")
+        # Check every file before storing any
+        for file in files:
+            try:
+                upload_type(file.filename or "")
+                upload_path(file.filename or "")
+            except ValueError as e:
+                raise HTTPException(status_code=415, detail=str(e))
+
+        metadata = {
+            field: value.strip().upper()
+            for field in ("airline_code", "country_code")
+            if isinstance(value := form.get(field), str) and value.strip()
+        }
+        sources = []
+        for file in files:
+            try:
+                source = await save_upload(file.file, file.filename)
+            except ValueError as e:
+                raise HTTPException(status_code=415, detail=str(e))
+            sources.append({**source, **metadata})
+
+    job_id, _ = await enqueue(sources, requested_by=f"admin upload by {admin['user_id']}", kind="upload")
+    return {"status": "queued", "job_id": job_id, "sources": [source["path"] for source in sources]}
 
 
 @router.get("/ingest/status")
-async def ingestion_status():
-    """Check ingestion progress"""
-    return _status
+async def ingestion_status(job_id: Optional[uuid.UUID] = None):
+    """Progress of an ingestion job (the latest by default), per source"""
+    status = await job_status(job_id)
+    if status is None:
+        if job_id is not None:
+            raise HTTPException(status_code=404, detail="Ingestion job not found")
+        return {"job": None, "sources": []}
+    return status
 
 
 @router.get("/ingest/sources")
@@ -43,3 +115,15 @@ async def ingested_sources():
     """List all sources currently in the vector store"""
     sources = await get_ingested_sources()
     return {"count": len(sources), "sources": sorted(sources)}
+
+
+@router.get("/llm/metrics")
+async def llm_metrics():
+    """LLM scheduler queue depth, wait times and rolling token/request usage"""
+    return scheduler.metrics()
+
+
+@router.get("/cache/metrics")
+async def cache_metrics():
+    """Trip context cache hit rate, size and cross-replica invalidation lag"""
+    return {"trip_context": trip_context_cache.metrics()}
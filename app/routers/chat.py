@@ -1,19 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.types import RunnableConfig
+from sqlalchemy import exists, func, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 from typing import AsyncGenerator, Optional
+from contextlib import nullcontext
 import uuid
 import json
 
-from app.database.db import get_db
+from app.database.db import AsyncSessionLocal, get_db
 from app.database.models import Chat as ChatORM, Language, TripContext as TripContextORM
 from app.lib.graph import generate_chat_title
 from app.schemas.chat import ChatRequest, TripContext
 from app.auth.clerk import get_optional_user
-from app.lib.provider import get_graph
+from app.lib.provider import CHECKPOINT_DURABILITY, get_graph
+from app.lib.runs import Run, run_coordinator
+from app.lib.transcript import record_transcript, transcript_head
+from app.lib.trip_context_cache import INVALIDATION_CHANNEL, invalidation_payload, trip_context_cache
+from app.routers.trip_context import serialize_trip_context
 
 router = APIRouter()
 
@@ -25,12 +31,35 @@ def resolve_user_id(current_user: Optional[dict]) -> str:
     return f"anon_{uuid.uuid4()}"
 
 
-async def get_or_create_chat(
+_TRIP_CONTEXT_FIELDS = (
+    "ui_language",
+    "answer_language",
+    "nationality_country_code",
+    "origin_country_code",
+    "origin_city_or_airport",
+    "destination_country_code",
+    "destination_city_or_airport",
+    "trip_type",
+    "departure_date",
+    "return_date",
+    "airline_code",
+    "cabin",
+    "purpose",
+)
+
+
+async def upsert_chat(
     db: AsyncSession,
     user_id: str,
     chat_id: Optional[str],
     first_message: Optional[str] = None,
-) -> ChatORM:
+    trip_context_request: Optional[TripContext] = None,
+) -> tuple[uuid.UUID, str, Optional[dict]]:
+    """Create the chat if needed and upsert its trip context in one statement.
+
+    Returns (chat id, title, trip context dict or None). A chat_id owned by
+    another user is rejected with 401.
+    """
     if chat_id:
         try:
             chat_uuid = uuid.UUID(chat_id)
@@ -39,92 +68,109 @@ async def get_or_create_chat(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid chat_id",
             )
-
-        result = await db.execute(
-            select(ChatORM).where(
-                ChatORM.id == chat_uuid,
-                ChatORM.user_id == user_id,
-            )
-        )
-        chat = result.scalar_one_or_none()
-
-        if chat:
-            return chat
-
+        # Almost always an existing chat: only title it once we know it was new
+        title = None
+    else:
+        chat_uuid = uuid.uuid4()
         title = await generate_chat_title(first_message) if first_message else "New Chat"
-        chat = ChatORM(id=chat_uuid, user_id=user_id, title=title)
-        db.add(chat)
-        await db.flush()
-        await db.refresh(chat)
-        return chat
-
-    title = await generate_chat_title(first_message) if first_message else "New Chat"
-    chat = ChatORM(user_id=user_id, title=title)
-    db.add(chat)
-    await db.flush()
-    await db.refresh(chat)
-    return chat
 
-
-async def upsert_trip_context(
-    db: AsyncSession,
-    chat_id,
-    trip_context_request: Optional[TripContext],
-) -> Optional[dict]:
-    """Create or update trip context for a chat"""
-    result = await db.execute(
-        select(TripContextORM).where(TripContextORM.chat_id == chat_id)
+    chats = ChatORM.__table__
+    trip_contexts = TripContextORM.__table__
+
+    inserted = (
+        insert(chats)
+        .values(
+            id=chat_uuid,
+            user_id=user_id,
+            title=title or "New Chat",
+            created_at=func.now(),
+            updated_at=func.now(),
+        )
+        .on_conflict_do_nothing(index_elements=[chats.c.id])
+        .returning(chats.c.id, chats.c.title, literal(True).label("created"))
+        .cte("inserted")
     )
-    trip_context_orm = result.scalar_one_or_none()
+    # Either the row we just inserted or the caller's existing chat; empty if
+    # the id exists but belongs to someone else
+    chat = union_all(
+        select(inserted.c.id, inserted.c.title, inserted.c.created),
+        select(chats.c.id, chats.c.title, literal(False)).where(
+            chats.c.id == chat_uuid,
+            chats.c.user_id == user_id,
+            ~exists(select(inserted.c.id)),
+        ),
+    ).cte("chat")
+
+    columns = [chat.c.id, chat.c.title, chat.c.created]
+    trip_context = None
+    cached = None
 
     if trip_context_request:
-        fields = {
-            "ui_language": Language[trip_context_request.ui_language],
-            "answer_language": Language[trip_context_request.answer_language],
-            "nationality_country_code": trip_context_request.nationality_country_code,
-            "origin_country_code": trip_context_request.origin_country_code,
-            "origin_city_or_airport": trip_context_request.origin_city_or_airport,
-            "destination_country_code": trip_context_request.destination_country_code,
-            "destination_city_or_airport": trip_context_request.destination_city_or_airport,
-            "trip_type": trip_context_request.trip_type,
-            "departure_date": trip_context_request.departure_date,
-            "return_date": trip_context_request.return_date,
-            "airline_code": trip_context_request.airline_code,
-            "cabin": trip_context_request.cabin,
-            "purpose": trip_context_request.purpose,
-        }
-        if trip_context_orm:
-            for k, v in fields.items():
-                setattr(trip_context_orm, k, v)
-        else:
-            trip_context_orm = TripContextORM(chat_id=chat_id, **fields)
-            db.add(trip_context_orm)
+        values = trip_context_request.model_dump(include=set(_TRIP_CONTEXT_FIELDS))
+        values["ui_language"] = Language[values["ui_language"]]
+        values["answer_language"] = Language[values["answer_language"]]
+        upsert = insert(trip_contexts).from_select(
+            ["id", "chat_id", *values, "created_at", "updated_at"],
+            select(
+                literal(uuid.uuid4()),
+                chat.c.id,
+                *(literal(v, type_=trip_contexts.c[k].type) for k, v in values.items()),
+                func.now(),
+                func.now(),
+            ),
+        )
+        trip_context = (
+            upsert.on_conflict_do_update(
+                index_elements=[trip_contexts.c.chat_id],
+                set_={**{k: upsert.excluded[k] for k in values}, "updated_at": func.now()},
+            )
+            .returning(*trip_contexts.c)
+            .cte("trip_context")
+        )
+        # Other replicas drop their copy when this commits
+        columns.append(func.pg_notify(INVALIDATION_CHANNEL, invalidation_payload(chat_uuid)))
+    else:
+        cached = trip_context_cache.get(chat_uuid)
+        if cached is None:
+            trip_context = (
+                select(trip_contexts).where(trip_contexts.c.chat_id == chat_uuid).subquery("trip_context")
+            )
 
-        await db.flush()
+    query = select(*columns)
+    if trip_context is not None:
+        query = query.add_columns(
+            trip_context.c.chat_id.label("trip_context_chat_id"),
+            trip_context.c.updated_at.label("trip_context_updated_at"),
+            *(trip_context.c[k] for k in _TRIP_CONTEXT_FIELDS),
+        ).select_from(chat.outerjoin(trip_context, trip_context.c.chat_id == chat.c.id))
+
+    token = trip_context_cache.fill_token()
+    result = await db.execute(query)
+    row = result.one_or_none()
+    await db.commit()
 
-    if not trip_context_orm:
-        return None
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Access denied",
+        )
 
-    def get_lang(lang_field):
-        if lang_field is None:
-            return "EN"
-        return lang_field.value if hasattr(lang_field, "value") else lang_field
+    title = row.title
+    if row.created and chat_id and first_message:
+        title = await generate_chat_title(first_message)
+        await db.execute(update(chats).where(chats.c.id == row.id).values(title=title))
+        await db.commit()
 
-    return {
-        "ui_language": get_lang(trip_context_orm.ui_language),
-        "answer_language": get_lang(trip_context_orm.answer_language),
-        "nationality_country_code": trip_context_orm.nationality_country_code,
-        "origin_country_code": trip_context_orm.origin_country_code,
-        "origin_city_or_airport": trip_context_orm.origin_city_or_airport,
-        "destination_country_code": trip_context_orm.destination_country_code,
-        "destination_city_or_airport": trip_context_orm.destination_city_or_airport,
-        "trip_type": trip_context_orm.trip_type,
-        "departure_date": trip_context_orm.departure_date,
-        "return_date": trip_context_orm.return_date,
-        "airline_code": trip_context_orm.airline_code,
-        "cabin": trip_context_orm.cabin,
-        "purpose": trip_context_orm.purpose,
-    }
+    if cached is not None:
+        return row.id, title, cached.value
+
+    if trip_context_request:
+        # After commit, so a concurrent fill that read the old row can't land after ours
+        trip_context_cache.invalidate(row.id)
+        token = trip_context_cache.fill_token()
+    trip_context_dict = serialize_trip_context(row) if row.trip_context_chat_id else None
+    trip_context_cache.put(row.id, trip_context_dict, row.trip_context_updated_at, token)
+    return row.id, title, trip_context_dict
 
 
 def _build_lc_messages(history, current_message: str) -> list:
@@ -152,13 +198,66 @@ def build_initial_graph_state(
         "needs_visa_api": False,
         "needs_web_search": False,
         "needs_rag": False,
-        "rag_results": None,
-        "web_results": None,
-        "visa_results": None,
+        # rag/web/visa results are untracked per-run channels, nothing to reset
         "sources_used": [],
     }
 
 
+def _replace_thread_messages(history, current_message: str) -> list:
+    """Full-history mode for a checkpointed thread: the client's history replaces
+    the stored one instead of being appended to it."""
+    return [RemoveMessage(id=REMOVE_ALL_MESSAGES), *_build_lc_messages(history, current_message)]
+
+
+async def checkpoint_messages(graph, thread_id: str) -> Optional[list]:
+    """Messages of the thread's latest checkpoint, or None if it can't be read"""
+    try:
+        snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+    except Exception as e:
+        print(f"Checkpoint read failed for chat {thread_id}: {e}")
+        return None
+    return snapshot.values.get("messages", [])
+
+
+async def take_message_count(db: AsyncSession, chat_id: uuid.UUID) -> Optional[int]:
+    """The chat's recorded message count, cleared until this run records its own.
+
+    None when unknown: another run is in flight, the last one failed after
+    checkpointing its input, or the chat predates the count.
+    """
+    chats = ChatORM.__table__
+    old = select(chats.c.id, chats.c.message_count).where(chats.c.id == chat_id).with_for_update().cte("old")
+    result = await db.execute(
+        update(chats).where(chats.c.id == old.c.id).values(message_count=None).returning(old.c.message_count)
+    )
+    await db.commit()
+    return result.scalar_one_or_none()
+
+
+async def record_turn(
+    thread_id: str,
+    final_state: Optional[dict],
+    transcript_start: Optional[int] = None,
+):
+    """Mirror the run's final messages into the chat transcript, record their count and mark the chat active (best effort)"""
+    if not final_state or not final_state.get("messages"):
+        return
+    chat_id = uuid.UUID(thread_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            await record_transcript(db, chat_id, final_state["messages"], start=transcript_start)
+            # updated_at drives the "recent activity" (sort=updated) chat list
+            await db.execute(
+                update(ChatORM)
+                .where(ChatORM.id == chat_id)
+                .values(updated_at=func.now(), message_count=len(final_state["messages"]))
+            )
+            await db.commit()
+    except Exception as e:
+        # The next run backfills whatever this one missed
+        print(f"Transcript write failed for chat {thread_id}: {e}")
+
+
 def sse_event(data: dict) -> str:
     """Format data as SSE event"""
     return f"data: {json.dumps(data)}\n\n"
@@ -169,54 +268,97 @@ async def graph_token_stream(
     graph_state: dict,
     thread_id: str,
     metadata: Optional[dict] = None,
+    authenticated: bool = False,
+    transcript_start: Optional[int] = None,
 ) -> AsyncGenerator[str, None]:
-    """Stream graph output as SSE events. Pass metadata dict to emit a data-metadata event."""
+    """Stream graph output as SSE events. Pass metadata dict to emit a data-metadata event.
+
+    Signed-in runs also update the transcript (rewriting it from transcript_start
+    when the thread's history was replaced) and emit a data-version event with
+    the thread's new message count, the client's base_version for its next turn.
+    That is the count in the checkpoint, which the run has written by the time
+    its stream ends, whether or not the (best effort) transcript write worked.
+    It is also recorded on the chat, so the next turn's check needn't read the
+    checkpoint.
+    A superseded run does neither and ends with an abort event.
+    """
     message_id = f"msg_{thread_id}"
     text_id = f"text_{thread_id}"
     text_started = False
+    final_state = None
 
     yield sse_event({"type": "start", "messageId": message_id})
     if metadata:
         yield sse_event({"type": "data-metadata", "data": metadata, "transient": True})
 
+    # Signed-in threads are shared across requests: a newer run supersedes this one.
+    # Anonymous thread ids are fresh per request, so there is nothing to coordinate.
+    run_ctx = run_coordinator.claim(thread_id) if authenticated else nullcontext(Run(thread_id))
+
     try:
-        async for chunk in graph.astream(
-            graph_state,
-            config={"configurable": {"thread_id": thread_id}},
-            stream_mode=["custom"],
-        ):
-            kind, data = chunk
-            if kind != "custom":
-                continue
-
-            if isinstance(data, dict) and data.get("type") == "thought":
-                yield sse_event(
-                    {
-                        "type": "data-thought",
-                        "data": {
-                            "content": data.get("content", ""),
-                            "phase": data.get("phase", "other"),
-                            "status": "pending",
-                        },
-                    }
-                )
-            elif isinstance(data, dict) and data.get("type") == "suggestions":
-                yield sse_event(
-                    {
-                        "type": "data-suggestions",
-                        "data": {"suggestions": data.get("suggestions", [])},
-                    }
+        async with run_ctx as run:
+            async for chunk in run.iterate(
+                graph.astream(
+                    graph_state,
+                    config={"configurable": {"thread_id": thread_id, "authenticated": authenticated}},
+                    stream_mode=["custom", "values"],
+                    durability=CHECKPOINT_DURABILITY,
                 )
-            elif isinstance(data, str):
-                if not text_started:
-                    yield sse_event({"type": "text-start", "id": text_id})
-                    text_started = True
-                yield sse_event({"type": "text-delta", "id": text_id, "delta": data})
-
-        if text_started:
-            yield sse_event({"type": "text-end", "id": text_id})
-
-        yield sse_event({"type": "finish", "finishReason": "stop"})
+            ):
+                kind, data = chunk
+                if kind == "values":
+                    # Last one is the state the run leaves in the checkpoint
+                    final_state = data
+                    continue
+                if kind != "custom":
+                    continue
+
+                if isinstance(data, dict) and data.get("type") == "thought":
+                    yield sse_event(
+                        {
+                            "type": "data-thought",
+                            "data": {
+                                "content": data.get("content", ""),
+                                "phase": data.get("phase", "other"),
+                                "status": "pending",
+                            },
+                        }
+                    )
+                elif isinstance(data, dict) and data.get("type") == "suggestions":
+                    yield sse_event(
+                        {
+                            "type": "data-suggestions",
+                            "data": {"suggestions": data.get("suggestions", [])},
+                        }
+                    )
+                elif isinstance(data, str):
+                    if not text_started:
+                        yield sse_event({"type": "text-start", "id": text_id})
+                        text_started = True
+                    yield sse_event({"type": "text-delta", "id": text_id, "delta": data})
+
+            if text_started:
+                yield sse_event({"type": "text-end", "id": text_id})
+
+            # A superseded run's state is partial (its question without the answer):
+            # it leaves the transcript and the client's version to the newer run
+            if run.superseded:
+                yield sse_event({"type": "abort"})
+                return
+
+            # Still inside the run, so a superseding run writes after this one
+            if authenticated:
+                await record_turn(thread_id, final_state, transcript_start)
+                if final_state and final_state.get("messages"):
+                    yield sse_event(
+                        {
+                            "type": "data-version",
+                            "data": {"version": len(final_state["messages"])},
+                            "transient": True,
+                        }
+                    )
+
+            yield sse_event({"type": "finish", "finishReason": "stop"})
 
     except Exception as e:
         print(f"Stream error: {e}")
@@ -249,32 +391,55 @@ async def create_chat_message_stream(
             },
         )
 
-    chat = await get_or_create_chat(
-        db=db,
+    chat_id, title, trip_context_dict = await upsert_chat(
+        db,
         user_id=user_id,
         chat_id=request.chat_id,
         first_message=request.message,
-    )
-
-    trip_context_dict = await upsert_trip_context(
-        db,
-        chat_id=chat.id,
         trip_context_request=request.trip_context,
     )
 
-    await db.commit()
-
     graph = get_graph()
-    config: RunnableConfig = {"configurable": {"thread_id": str(chat.id)}}
-    state = await graph.aget_state(config)
-
-    if request.history is not None:
+    transcript_start = None
+    # Every signed-in run changes the checkpoint, so the count is stale until it records one
+    message_count = await take_message_count(db, chat_id)
+
+    if request.base_version is not None:
+        # Versions count the checkpoint's messages, which the run appends to. The
+        # chat's recorded count spares reading the checkpoint on a plain next turn;
+        # anything else needs the checkpoint: the count is unknown, or the client
+        # regenerates and the removals need the message ids
+        messages = None
+        head = message_count
+        if head != request.base_version:
+            messages = await checkpoint_messages(graph, str(chat_id))
+            # The transcript trails the checkpoint after a failed write and only stands in for it here
+            head = len(messages) if messages is not None else await transcript_head(db, chat_id)
+        if request.base_version == head:
+            # Delta mode: add_messages appends to the checkpointed thread
+            lc_messages = [HumanMessage(content=request.message)]
+        elif request.base_version < head and messages is not None:
+            # Regeneration/edit: drop what the client no longer has, then append.
+            # Ids come from the checkpoint: add_messages rejects ids it doesn't hold
+            lc_messages = [RemoveMessage(id=message.id) for message in messages[request.base_version:]]
+            lc_messages.append(HumanMessage(content=request.message))
+            transcript_start = request.base_version
+        elif request.history is not None:
+            # Client is ahead of us, or the checkpoint couldn't be read: trust its history
+            lc_messages = _replace_thread_messages(request.history, request.message)
+            transcript_start = 0
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Chat is at version {head}; resend with base_version={head} or full history",
+            )
+    elif request.history is not None:
         # Frontend history is authoritative — handles regeneration correctly
-        lc_messages = _build_lc_messages(request.history, request.message)
-    elif state and state.values.get("messages"):
-        lc_messages = list(state.values["messages"])
-        lc_messages.append(HumanMessage(content=request.message))
+        lc_messages = _replace_thread_messages(request.history, request.message)
+        transcript_start = 0
     else:
+        # add_messages appends to the checkpointed thread, so there is no need
+        # to load it first
         lc_messages = [HumanMessage(content=request.message)]
 
     graph_state = build_initial_graph_state(lc_messages, trip_context_dict)
@@ -283,14 +448,16 @@ async def create_chat_message_stream(
         graph_token_stream(
             graph,
             graph_state,
-            thread_id=str(chat.id),
-            metadata={"chatId": str(chat.id), "title": str(chat.title)},
+            thread_id=str(chat_id),
+            metadata={"chatId": str(chat_id), "title": str(title)},
+            authenticated=True,
+            transcript_start=transcript_start,
         ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Chat-Id": str(chat.id),
+            "X-Chat-Id": str(chat_id),
             "x-vercel-ai-ui-message-stream": "v1",
         },
     )
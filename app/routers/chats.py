@@ -1,16 +1,25 @@
 import logging
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from langchain_core.messages import HumanMessage
+from sqlalchemy import func, select, tuple_
 
 from app.database.db import get_db
 from app.database.models import Chat as ChatORM
 from app.auth.clerk import get_authenticated_user
 from app.lib.provider import get_graph
-from app.routers.modules import is_chat_valid, is_user_authenticated
+from app.lib.transcript import read_transcript, record_transcript
+from app.lib.trip_context_cache import publish_invalidation, trip_context_cache
+from app.routers.modules import (
+    decode_cursor,
+    encode_cursor,
+    is_chat_valid,
+    is_user_authenticated,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
 from app.schemas.chat import ChatSummary, ChatUpdate
 
 router = APIRouter()
@@ -19,55 +28,127 @@ logger = logging.getLogger(__name__)
 
 @router.get("", response_model=List[ChatSummary])
 async def list_chats(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: Literal["created", "updated"] = "created",
     db: AsyncSession = Depends(get_db),
     current_user: Optional[dict] = Depends(get_authenticated_user),
 ):
-    """List all chats for the authenticated user"""
-    user_id = is_user_authenticated(current_user)
+    """List chats for the authenticated user, newest first.
 
-    result = await db.execute(
-        select(ChatORM)
-        .where(ChatORM.user_id == user_id)
-        .order_by(ChatORM.created_at.desc())
+    `sort=updated` orders by recent activity instead of creation. With `limit`,
+    returns one page and sets X-Next-Cursor; pass it back as `cursor` for the next.
+    """
+    user_id = is_user_authenticated(current_user)
+    sort_column = ChatORM.created_at if sort == "created" else ChatORM.updated_at
+
+    # Version check answered from the index alone: any create, delete, rename or
+    # new message changes at least one of these
+    version = await db.execute(
+        select(func.count(), func.max(ChatORM.created_at), func.max(ChatORM.updated_at)).where(
+            ChatORM.user_id == user_id
+        )
     )
-    return result.scalars().all()
+    etag = make_etag(*version.one(), limit, cursor, sort)
+    if unchanged := not_modified(request, etag):
+        return unchanged
+    set_cache_headers(response, etag)
+
+    # Matches ix_chats_user_id_{created,updated}_at column for column
+    query = select(ChatORM).where(ChatORM.user_id == user_id)
+    if cursor:
+        sort_value, chat_id = decode_cursor(cursor)
+        query = query.where(tuple_(sort_column, ChatORM.id) < tuple_(sort_value, chat_id))
+    query = query.order_by(sort_column.desc(), ChatORM.id.desc())
+    if limit:
+        # One extra row tells us whether there is a next page
+        query = query.limit(limit + 1)
+
+    result = await db.execute(query)
+    chats = list(result.scalars().all())
+
+    if limit and len(chats) > limit:
+        chats = chats[:limit]
+        last = chats[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            last.created_at if sort == "created" else last.updated_at, last.id
+        )
+    return chats
 
 
 @router.get("/{chat_id}/messages")
 async def get_chat_messages(
     chat_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=0),
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_authenticated_user),
 ):
-    """Get messages from checkpointer"""
-    user_id = is_user_authenticated(current_user)
-    await is_chat_valid(chat_id, user_id, db)
+    """Get messages from the chat transcript.
 
-    graph = get_graph()
-    config = {"configurable": {"thread_id": chat_id}}
-    state = await graph.aget_state(config)
+    Without `limit`, returns the whole chat oldest-first. With `limit`, returns
+    one page newest-first; pass the X-Next-Cursor header back as `before` to
+    get the next (older) page.
+    """
+    user_id = is_user_authenticated(current_user)
+    chat = await is_chat_valid(chat_id, user_id, db)
 
-    if not state or not state.values.get("messages"):
-        return []
+    # Every run bumps chats.updated_at with its transcript write
+    etag = make_etag(chat.id, chat.updated_at.isoformat(), limit, before)
+    if unchanged := not_modified(request, etag, chat.updated_at):
+        return unchanged
+    set_cache_headers(response, etag, chat.updated_at)
+
+    # Fetch one extra row to know whether an older page exists
+    rows = await read_transcript(db, chat.id, limit + 1 if limit else None, before)
+
+    if not rows and before is None:
+        # Chats from before the transcript existed: backfill once from the checkpoint
+        graph = get_graph()
+        state = await graph.aget_state({"configurable": {"thread_id": chat_id}})
+        if not state or not state.values.get("messages"):
+            return []
+        await record_transcript(db, chat.id, state.values["messages"], start=0)
+        await db.commit()
+        rows = await read_transcript(db, chat.id, limit + 1 if limit else None)
+
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].seq)
+    if not limit:
+        rows.reverse()
 
     return [
         {
-            "role": "user" if isinstance(msg, HumanMessage) else "assistant",
-            "content": msg.content,
+            "id": row.message_id,
+            "seq": row.seq,
+            "role": row.role,
+            "content": row.content,
         }
-        for msg in state.values["messages"]
+        for row in rows
     ]
 
 
 @router.get("/{chat_id}", response_model=ChatSummary)
 async def get_chat(
     chat_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[dict] = Depends(get_authenticated_user),
 ):
     """Get a specific chat by ID"""
     user_id = is_user_authenticated(current_user)
     chat = await is_chat_valid(chat_id, user_id, db)
+
+    etag = make_etag(chat.id, chat.updated_at.isoformat())
+    if unchanged := not_modified(request, etag, chat.updated_at):
+        return unchanged
+    set_cache_headers(response, etag, chat.updated_at)
     return chat
 
 
@@ -96,9 +177,17 @@ async def delete_chat(
     db: AsyncSession = Depends(get_db),
     current_user: Optional[dict] = Depends(get_authenticated_user),
 ):
-    """Delete a chat and all related messages/trip context (CASCADE)"""
+    """Delete a chat and all related messages/trip context (CASCADE), then its checkpoints"""
     user_id = is_user_authenticated(current_user)
     chat = await is_chat_valid(chat_id, user_id, db)
 
     await db.delete(chat)
+    await publish_invalidation(db, chat.id)
     await db.commit()
+    trip_context_cache.invalidate(chat.id)
+
+    try:
+        await get_graph().checkpointer.adelete_thread(chat_id)
+    except Exception as e:
+        # The retention sweep removes orphaned threads later
+        print(f"Failed to delete checkpoints for chat {chat_id}: {e}")
@@ -1,5 +1,10 @@
+import base64
+import hashlib
 import uuid
-from fastapi import HTTPException, status
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
@@ -46,3 +51,72 @@ async def is_chat_valid(
         )
 
     return chat
+
+
+def encode_cursor(sort_value: datetime, row_id: uuid.UUID) -> str:
+    """Opaque keyset cursor for the row a page ended on"""
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor. Raises HTTPException on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        sort_value, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(sort_value), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over whatever identifies the representation's version"""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def not_modified(
+    request: Request,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+) -> Optional[Response]:
+    """Return a 304 response if the client's cached copy is current, else None.
+
+    If-None-Match wins over If-Modified-Since when both are sent (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: ignore W/ prefixes on either side
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        fresh = "*" in candidates or etag.removeprefix("W/") in candidates
+    elif last_modified is not None and request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return None
+        fresh = last_modified.replace(microsecond=0) <= since
+    else:
+        return None
+
+    if not fresh:
+        return None
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag, last_modified)
+    return response
+
+
+def set_cache_headers(
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+):
+    """Validators for conditional GET; clients must revalidate before reuse"""
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(timezone.utc), usegmt=True
+        )
+    response.headers["Cache-Control"] = "private, no-cache"
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import uuid
@@ -7,6 +7,8 @@ from app.database.db import get_db
 from app.database.models import TripContext as TripContextORM, Language
 from app.schemas.chat import TripContext
 from app.auth.clerk import get_authenticated_user
+from app.lib.trip_context_cache import publish_invalidation, trip_context_cache
+from app.routers.modules import make_etag, not_modified, set_cache_headers
 
 router = APIRouter()
 
@@ -37,6 +39,8 @@ def serialize_trip_context(tc: TripContextORM) -> dict:
 @router.get("/{chat_id}")
 async def get_trip_context(
     chat_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_authenticated_user),
 ):
@@ -45,15 +49,37 @@ async def get_trip_context(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid chat_id")
 
+    cached = trip_context_cache.get(chat_uuid)
+    if cached is not None:
+        updated_at = cached.updated_at
+    else:
+        # Cheap version check before loading the row
+        token = trip_context_cache.fill_token()
+        result = await db.execute(
+            select(TripContextORM.updated_at).where(TripContextORM.chat_id == chat_uuid)
+        )
+        updated_at = result.scalar_one_or_none()
+
+    etag = make_etag(chat_uuid, updated_at.isoformat() if updated_at else "none")
+    if unchanged := not_modified(request, etag, updated_at):
+        return unchanged
+    set_cache_headers(response, etag, updated_at)
+
+    if cached is not None:
+        return {"trip_context": cached.value}
+
     result = await db.execute(
         select(TripContextORM).where(TripContextORM.chat_id == chat_uuid)
     )
     trip_context = result.scalar_one_or_none()
 
     if not trip_context:
+        trip_context_cache.put(chat_uuid, None, None, token)
         return {"trip_context": None}
 
-    return {"trip_context": serialize_trip_context(trip_context)}
+    serialized = serialize_trip_context(trip_context)
+    trip_context_cache.put(chat_uuid, serialized, trip_context.updated_at, token)
+    return {"trip_context": serialized}
 
 
 @router.put("/{chat_id}")
@@ -116,7 +142,9 @@ async def update_trip_context(
         )
         db.add(trip_context)
 
+    await publish_invalidation(db, chat_uuid)
     await db.commit()
+    trip_context_cache.invalidate(chat_uuid)
 
     return {"trip_context": serialize_trip_context(trip_context)}
 
@@ -141,6 +169,8 @@ async def delete_trip_context(
         raise HTTPException(status_code=404, detail="Trip context not found")
 
     await db.delete(trip_context)
+    await publish_invalidation(db, chat_uuid)
     await db.commit()
+    trip_context_cache.invalidate(chat_uuid)
 
     return {"success": True}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal, Optional, List, Dict
 from datetime import datetime
 from uuid import UUID
@@ -36,6 +36,10 @@ class ChatRequest(BaseModel):
     chat_id: Optional[str] = None
     trip_context: Optional[TripContext] = None
     history: Optional[List[MessageHistory]] = None  # for anonymous / stateless clients
+    # Signed-in delta mode: number of messages the client already has for this
+    # chat (from the data-version event or the last message's seq + 1). Lower than
+    # the server's count means regenerate from there; history is then unnecessary.
+    base_version: Optional[int] = Field(default=None, ge=0)
     stream: bool = False
 
 
@@ -51,6 +55,7 @@ class ChatSummary(BaseModel):
     id: UUID
     title: Optional[str] = None
     created_at: datetime
+    updated_at: datetime
 
     class Config:
         from_attributes: True
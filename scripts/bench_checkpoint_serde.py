@@ -0,0 +1,146 @@
+"""
+Compare checkpoint serializers on realistic chat threads.
+
+    uv run python -m scripts.bench_checkpoint_serde [--turns 5 20 50] [--repeat 200]
+
+For each thread length, encodes the channel values a chat checkpoint stores
+(messages, trip_context, classification flags) with LangGraph's default
+JsonPlusSerializer and with our CompressedSerializer, and reports bytes per
+checkpoint plus encode/decode time.
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.lib.checkpoint_serde import CompressedSerializer, get_checkpoint_serde
+
+RECORDED_STREAM = Path(__file__).resolve().parent.parent / "output.jsonl"
+
+QUESTIONS = [
+    "Can I bring a power bank in my carry-on on Korean Air?",
+    "Do I need a visa to visit Japan with a US passport?",
+    "What are the TSA rules for liquids in hand luggage?",
+    "How early should I arrive at Incheon for an international flight?",
+    "What happens if my checked bag is delayed on Delta?",
+    "Can I bring kimchi back to Canada?",
+]
+
+FALLBACK_ANSWER = (
+    "According to TSA guidelines, liquids in carry-on bags must be in containers of "
+    "3.4 ounces (100 milliliters) or less, placed in a single quart-sized bag. Larger "
+    "containers must go in checked baggage. Medications and baby formula are exempt "
+    "but should be declared at the checkpoint. Policies may change - verify with "
+    "official sources before travel. "
+) * 4
+
+
+def _recorded_answer() -> str:
+    """Reassemble the streamed answer recorded in output.jsonl, if present."""
+    if not RECORDED_STREAM.exists():
+        return FALLBACK_ANSWER
+    parts = []
+    with RECORDED_STREAM.open() as f:
+        for line in f:
+            event = json.loads(line)
+            if event.get("type") == "content":
+                parts.append(event["content"])
+    return "".join(parts) or FALLBACK_ANSWER
+
+
+def _varied_answer(answer: str, rng: random.Random) -> str:
+    """Same vocabulary and length as the recorded answer, but no verbatim repeats
+    across turns, so compression numbers aren't flattered by identical messages."""
+    sentences = re.split(r"(?<=[.!?])\s+", answer)
+    picked = [rng.choice(sentences) for _ in sentences]
+    shuffled = []
+    for sentence in picked:
+        words = sentence.split()
+        rng.shuffle(words)
+        shuffled.append(" ".join(words))
+    return " ".join(shuffled)
+
+
+def build_checkpoint_values(turns: int, answer: str) -> dict:
+    rng = random.Random(turns)
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=QUESTIONS[i % len(QUESTIONS)]))
+        messages.append(AIMessage(content=_varied_answer(answer, rng)))
+    return {
+        "messages": messages,
+        "trip_context": {
+            "ui_language": "EN",
+            "answer_language": "EN",
+            "nationality_country_code": "US",
+            "origin_country_code": "US",
+            "origin_city_or_airport": "JFK",
+            "destination_country_code": "KR",
+            "destination_city_or_airport": "ICN",
+            "trip_type": "round_trip",
+            "departure_date": "2026-03-15",
+            "return_date": "2026-03-29",
+            "airline_code": "KE",
+            "cabin": "economy",
+            "purpose": "tourism",
+        },
+        "query": QUESTIONS[(turns - 1) % len(QUESTIONS)],
+        "query_type": "baggage",
+        "needs_visa_api": False,
+        "needs_web_search": False,
+        "needs_rag": True,
+        "sources_used": ["rag"],
+    }
+
+
+def bench(serde, values: dict, repeat: int) -> tuple[int, float, float]:
+    encoded = {k: serde.dumps_typed(v) for k, v in values.items()}
+    size = sum(len(blob) for _, blob in encoded.values())
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for v in values.values():
+            serde.dumps_typed(v)
+    encode_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for typed in encoded.values():
+            serde.loads_typed(typed)
+    decode_us = (time.perf_counter() - start) / repeat * 1e6
+
+    return size, encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    answer = _recorded_answer()
+    baseline = get_checkpoint_serde("jsonplus")
+    compressed = CompressedSerializer()
+
+    print(f"{'turns':>5} {'serde':>9} {'bytes':>9} {'ratio':>6} {'encode µs':>10} {'decode µs':>10}")
+    for turns in args.turns:
+        values = build_checkpoint_values(turns, answer)
+
+        # Round-trip sanity check before timing anything
+        for k, v in values.items():
+            assert compressed.loads_typed(compressed.dumps_typed(v)) == v, k
+            assert compressed.loads_typed(baseline.dumps_typed(v)) == v, k
+
+        base_size, base_enc, base_dec = bench(baseline, values, args.repeat)
+        size, enc, dec = bench(compressed, values, args.repeat)
+        print(f"{turns:>5} {'jsonplus':>9} {base_size:>9} {1.0:>6.2f} {base_enc:>10.1f} {base_dec:>10.1f}")
+        print(f"{turns:>5} {'zstd':>9} {size:>9} {base_size / size:>6.2f} {enc:>10.1f} {dec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
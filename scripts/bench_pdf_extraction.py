@@ -0,0 +1,101 @@
+"""
+Measure PDF extraction throughput on the documents we ingest.
+
+    uv run python -m scripts.bench_pdf_extraction [--dir data/documents] [--baseline] [--skip-ocr]
+
+For every PDF under --dir, reports pages/sec for the page-routed extraction
+(text layer read directly, OCR only for pages without one) both inline and
+through the ingestion process pool. --baseline also times the previous path,
+UnstructuredPDFLoader with strategy="hi_res" on every page (needs the
+'ingestion' extra). --skip-ocr times the text layer alone and only counts the
+pages that would be OCRed, for machines without unstructured or tesseract.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from app.lib.pdf_extract import extract_text_layer, ocr_page
+from app.lib.workers import run_in_process, shutdown_executor
+
+
+def routed(path: str, ocr: bool) -> tuple[int, int]:
+    pages, scanned = extract_text_layer(path)
+    if ocr:
+        for number in scanned:
+            ocr_page(path, number)
+    return len(pages) + len(scanned), len(scanned)
+
+
+async def routed_in_pool(path: str, ocr: bool):
+    _, scanned = await run_in_process(extract_text_layer, path)
+    if ocr:
+        await asyncio.gather(*(run_in_process(ocr_page, path, number) for number in scanned))
+
+
+def hi_res(path: str):
+    from langchain_community.document_loaders import UnstructuredPDFLoader
+
+    UnstructuredPDFLoader(path, strategy="hi_res").load()
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="data/documents")
+    parser.add_argument("--baseline", action="store_true", help="also time the hi_res loader")
+    parser.add_argument("--skip-ocr", action="store_true", help="don't OCR pages without a text layer")
+    args = parser.parse_args()
+
+    paths = sorted(str(path) for path in Path(args.dir).rglob("*.pdf"))
+    if not paths:
+        parser.error(f"no PDFs under {args.dir}")
+
+    # Start the workers up front so spawn cost isn't charged to the first file
+    await asyncio.gather(*(run_in_process(len, "") for _ in range(os.cpu_count() or 1)))
+
+    print(f"{'pdf':<48} {'pages':>5} {'ocr':>4} {'routed/s':>9} {'pool/s':>8} {'hi_res/s':>9}")
+    totals = {"pages": 0, "routed": 0.0, "pool": 0.0, "hi_res": 0.0}
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            page_count, ocr_count = routed(path, not args.skip_ocr)
+            routed_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            await routed_in_pool(path, not args.skip_ocr)
+            pool_seconds = time.perf_counter() - start
+
+            hi_res_rate = "-"
+            if args.baseline:
+                hi_res_seconds = await asyncio.to_thread(timed, hi_res, path)
+                totals["hi_res"] += hi_res_seconds
+                hi_res_rate = f"{page_count / hi_res_seconds:.1f}"
+
+            totals["pages"] += page_count
+            totals["routed"] += routed_seconds
+            totals["pool"] += pool_seconds
+            print(
+                f"{path[-48:]:<48} {page_count:>5} {ocr_count:>4} "
+                f"{page_count / routed_seconds:>9.1f} {page_count / pool_seconds:>8.1f} {hi_res_rate:>9}"
+            )
+    finally:
+        shutdown_executor()
+
+    pages = totals["pages"]
+    hi_res_total = f"{pages / totals['hi_res']:.1f}" if args.baseline else "-"
+    print(
+        f"{'total':<48} {pages:>5} {'':>4} "
+        f"{pages / totals['routed']:>9.1f} {pages / totals['pool']:>8.1f} {hi_res_total:>9}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
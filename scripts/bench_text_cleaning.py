@@ -0,0 +1,136 @@
+"""
+Check and time ingestion text cleaning against the implementation it replaced.
+
+    uv run --extra dev python -m scripts.bench_text_cleaning [--dir data/documents] [--repeat 20]
+
+Builds a corpus from the PDF text layers and .txt/.md files under --dir plus
+edge cases (control characters, CRLF, runs of spaces, unicode whitespace).
+Every text must normalize exactly as cleantext.clean(extra_spaces=True) did,
+and every text and chunk must sanitize exactly as the old per-character
+filter did; any difference exits non-zero. Then reports MB/s and speedup for
+both. Needs cleantext, which is in the 'dev' extra.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from app.lib.pdf_extract import extract_text_layer
+from app.lib.text_prep import normalize_text, sanitize_text, text_splitter
+
+EDGE_CASES = [
+    "  leading and trailing  ",
+    "one  two   three    four",
+    "tabs\t\tand  spaces \t mixed",
+    "windows\r\nline\r\n\r\nendings  here",
+    "null\x00byte and \x0bvertical\x0ctab\x1b[0m escape",
+    "paragraph one\n\n\n   indented  line\n \n",
+    "no break em　ideographic  spaces",
+    "​zero width﻿ bom",
+    "한국어  텍스트   좌석 가격",
+    " ",
+    "\n\t \r",
+    "x",
+]
+
+
+def legacy_normalize(text: str) -> str:
+    from cleantext import clean
+
+    return clean(
+        text,
+        clean_all=False,
+        extra_spaces=True,
+        stemming=False,
+        stopwords=False,
+        lowercase=False,
+        numbers=False,
+        punct=False,
+        reg="",
+        reg_replace="",
+        stp_lang="english",
+    )
+
+
+def legacy_sanitize(text: str) -> str:
+    text = text.replace("\x00", "")
+    text = "".join(
+        char for char in text if char == "\n" or char == "\t" or ord(char) >= 32
+    )
+    return text.strip()
+
+
+def load_corpus(directory: str) -> list[str]:
+    texts = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.suffix == ".pdf":
+            pages, _ = extract_text_layer(str(path))
+            texts.extend(text for _, text in pages)
+        elif path.suffix in (".txt", ".md"):
+            texts.append(path.read_text(errors="replace"))
+    return texts + EDGE_CASES
+
+
+def mismatches(new, old, texts: list[str]) -> list[str]:
+    return [text for text in texts if new(text) != old(text)]
+
+
+def timed(fn, texts: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="data/documents")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        import cleantext  # noqa: F401
+    except ImportError:
+        parser.error("cleantext is not installed; run with: uv run --extra dev ...")
+
+    texts = load_corpus(args.dir)
+    chunks = [
+        chunk
+        for text in texts
+        if text.strip()
+        for chunk in text_splitter.split_text(normalize_text(text))
+    ]
+
+    failed = False
+    for name, new, old, sample in (
+        ("normalize", normalize_text, legacy_normalize, [text for text in texts if text]),
+        ("sanitize", sanitize_text, legacy_sanitize, texts + chunks),
+    ):
+        different = mismatches(new, old, sample)
+        print(f"{name}: {len(sample) - len(different)}/{len(sample)} identical")
+        for text in different[:5]:
+            print(f"   differs on {text[:60]!r}")
+        failed = failed or bool(different)
+    if failed:
+        sys.exit(1)
+
+    megabytes = sum(len(text.encode()) for text in texts) * args.repeat / 1e6
+    print(f"\n{len(texts)} texts, {len(chunks)} chunks, {megabytes:.1f} MB per function")
+    print(f"{'function':>10} {'old MB/s':>9} {'new MB/s':>9} {'speedup':>8}")
+    for name, new, old in (
+        ("normalize", normalize_text, legacy_normalize),
+        ("sanitize", sanitize_text, legacy_sanitize),
+    ):
+        sample = [text for text in texts if text]
+        old_seconds = timed(old, sample, args.repeat)
+        new_seconds = timed(new, sample, args.repeat)
+        print(
+            f"{name:>10} {megabytes / old_seconds:>9.1f} {megabytes / new_seconds:>9.1f} "
+            f"{old_seconds / new_seconds:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
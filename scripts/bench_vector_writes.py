@@ -0,0 +1,134 @@
+"""
+Compare vector store write paths on a scratch collection.
+
+    uv run python -m scripts.bench_vector_writes --database-url postgresql://localhost/bench
+                                                 [--rows 5000] [--batch 200]
+
+Writes the same synthetic chunks (1536-dim vectors, ~1 KB documents, ingestion
+style metadata) through PGVector.add_embeddings and through the binary COPY
+EmbeddingWriter, with and without deferred indexes, and reports rows/sec for
+each. The scratch collection is dropped afterwards.
+
+The deferred run drops every secondary index of langchain_pg_embedding, which
+all collections share, so run it against a scratch database with the app's
+migrations (DATABASE_URL=... alembic upgrade head), not the live one. It
+refuses to run if the table holds rows of any other collection.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import psycopg
+from langchain_postgres import PGVector
+
+from app.lib.rag.config import embeddings
+from app.lib.rag.ingestion.writer import EmbeddingWriter
+
+BENCH_COLLECTION = "bench_vector_writes"
+DIMENSIONS = 1536
+
+
+def build_rows(count: int) -> tuple[list[str], list[list[float]], list[dict]]:
+    rng = random.Random(count)
+    words = "passengers may carry one power bank under 100Wh in carry-on baggage only".split()
+    texts = [" ".join(rng.choice(words) for _ in range(180)) for _ in range(count)]
+    vectors = [[rng.uniform(-1, 1) for _ in range(DIMENSIONS)] for _ in range(count)]
+    metadatas = [
+        {
+            "source": f"https://example.com/page/{i // 20}",
+            "type": "web",
+            "airline_code": rng.choice(["KE", "DL", "OZ"]),
+            "country_code": rng.choice(["KR", "US"]),
+            "ingested_at": "2026-01-01T00:00:00+00:00",
+        }
+        for i in range(count)
+    ]
+    return texts, vectors, metadatas
+
+
+def batches(rows: tuple, size: int):
+    texts, vectors, metadatas = rows
+    for start in range(0, len(texts), size):
+        end = start + size
+        yield texts[start:end], vectors[start:end], metadatas[start:end]
+
+
+def bench_add_embeddings(store: PGVector, rows: tuple, batch: int) -> float:
+    start = time.perf_counter()
+    for texts, vectors, metadatas in batches(rows, batch):
+        store.add_embeddings(texts, vectors, metadatas=metadatas)
+    return time.perf_counter() - start
+
+
+async def check_scratch_database(database_url: str):
+    """Exit unless the database is migrated and has no vectors but the benchmark's"""
+    async with await psycopg.AsyncConnection.connect(database_url) as conn:
+        cur = await conn.execute(
+            "SELECT to_regclass('ingest_deferred_indexes'), to_regclass('langchain_pg_embedding')"
+        )
+        migrated, embeddings_table = await cur.fetchone()
+        if migrated is None:
+            raise SystemExit(f"Run DATABASE_URL={database_url} alembic upgrade head first")
+        if embeddings_table is None:
+            return
+        cur = await conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM langchain_pg_embedding e "
+            "JOIN langchain_pg_collection c ON c.uuid = e.collection_id WHERE c.name <> %s)",
+            (BENCH_COLLECTION,),
+        )
+        if (await cur.fetchone())[0]:
+            raise SystemExit(
+                "langchain_pg_embedding has rows of other collections; the deferred run would drop "
+                "their indexes. Use a scratch database."
+            )
+
+
+async def bench_copy(database_url: str, rows: tuple, batch: int, defer_indexes: bool) -> float:
+    start = time.perf_counter()
+    async with EmbeddingWriter(BENCH_COLLECTION, defer_indexes=defer_indexes, database_url=database_url) as writer:
+        for texts, vectors, metadatas in batches(rows, batch):
+            await writer.write(texts, vectors, metadatas)
+    # Includes the index rebuild when deferred
+    return time.perf_counter() - start
+
+
+async def clear(database_url: str):
+    async with EmbeddingWriter(BENCH_COLLECTION, database_url=database_url) as writer:
+        await writer.clear_collection()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="scratch database, never the live one")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    await check_scratch_database(args.database_url)
+    rows = build_rows(args.rows)
+    store = PGVector(
+        embeddings=embeddings,
+        collection_name=BENCH_COLLECTION,
+        connection=args.database_url,
+        use_jsonb=True,
+    )
+    try:
+        results = [("add_embeddings", await asyncio.to_thread(bench_add_embeddings, store, rows, args.batch))]
+        await clear(args.database_url)
+        results.append(("copy", await bench_copy(args.database_url, rows, args.batch, defer_indexes=False)))
+        await clear(args.database_url)
+        results.append(("copy+deferred", await bench_copy(args.database_url, rows, args.batch, defer_indexes=True)))
+    finally:
+        store.delete_collection()
+
+    print(f"{args.rows} rows in batches of {args.batch}")
+    print(f"{'writer':>14} {'seconds':>8} {'rows/s':>9} {'speedup':>8}")
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:>14} {seconds:>8.2f} {args.rows / seconds:>9.0f} {baseline / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,290 +1,162 @@
+"""
+Ingest the sources of a manifest into the vector store.
+
+    uv run python -m scripts.ingest_documents [--manifest scripts/sources.jsonl]
+                                              [--shard i/n] [--only field=value[,value...]]
+                                              [--since 6h|2026-10-01] [--concurrency 8]
+                                              [--dry-run] [--report report.json]
+                                              [--rebuild | --enqueue]
+
+By default sources are refreshed in place and only changed chunks are
+re-embedded. --rebuild reloads every source, plus the documents uploaded
+through the admin API, into a new collection that replaces the live one once
+complete; searches keep the old one until then, and sources that fail keep
+their old chunks. The metadata index is built once
+at the end, so filtered searches are slower while it runs.
+
+Selecting sources, so a run can be split across processes or machines:
+  --shard i/n   only shard i of n (from 0). Each source is in exactly one
+                shard, by a hash of its URL or path.
+  --only        only sources whose field has one of the values; country and
+                airline stand for country_code and airline_code. Repeat to
+                combine filters.
+  --since       skip sources that had chunks written since then (an ISO date
+                or time, or an age like 6h or 2d), e.g. to resume a run.
+
+--concurrency is how many sources are fetched at once. --dry-run lists the
+selected sources and stops. A run ends with a per-source summary (bytes,
+chunks, tokens embedded, seconds), also written as JSON with --report. It
+exits with status 1 if any source failed.
+
+--enqueue queues the selection as an ingestion job instead, for the ingestion
+workers (the API's, or scripts.ingest_worker) to share; progress is at
+GET /admin/ingest/status.
+"""
+
+import argparse
 import asyncio
+import json
+
+
+def _print_summary(sources: list[dict], reports: dict):
+    from app.lib.rag.ingestion.pipeline import source_key
+
+    print(f"\n{'source':<64} {'status':>9} {'bytes':>10} {'chunks':>7} {'tokens':>8} {'seconds':>8}")
+    totals = dict.fromkeys(("bytes", "chunks", "tokens", "seconds"), 0)
+    for source in sources:
+        key = source_key(source)
+        report = reports.get(key)
+        if report is None or "error" in report:
+            status = "failed"
+        else:
+            status = "unchanged" if report["unchanged"] else "written"
+            for field in totals:
+                totals[field] += report[field]
+        report = report or {}
+        name = key if len(key) <= 64 else "..." + key[-61:]
+        print(
+            f"{name:<64} {status:>9} {report.get('bytes', '-'):>10} {report.get('chunks', '-'):>7} "
+            f"{report.get('tokens', '-'):>8} {report.get('seconds', '-'):>8}"
+        )
+    print(
+        f"{'total':<64} {'':>9} {totals['bytes']:>10} {totals['chunks']:>7} "
+        f"{totals['tokens']:>8} {round(totals['seconds'], 2):>8}"
+    )
 
-from app.lib.rag.ingestion.core import ingest_documents_batch
 
-SOURCES = [
-    # ============================================
-    # USA - TSA & FAA
-    # ============================================
-    {"type": "url", "url": "https://www.tsa.gov/travel/security-screening", "country_code": "US"},
-    {
-        "type": "url",
-        "url": "https://www.tsa.gov/sites/default/files/tsa-travel-checklist.pdf",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.tsa.gov/travel/security-screening/whatcanibring/all",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.tsa.gov/travel/security-screening/whatcanibring/all-list",
-        "country_code": "US",
-    },
-    {"type": "url", "url": "https://www.faa.gov/hazmat/what_is_hazmat", "country_code": "US"},
-    # ============================================
-    # USA - Airlines
-    # ============================================
-    # Delta
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/overview",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/overview",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/additional-baggage-information/baggage-faqs",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/additional-baggage-information/general-conditions-and-rules",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/delayed-lost-damaged-baggage",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/ammunition-explosives-firearms",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/battery-or-fuel-powered",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/food-alcohol-transportation",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/personal-care-medical-items",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/robotic-machine-other",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/sporting-leisure-goods",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/tobacco-ecig-marijuana",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.delta.com/kr/en/baggage/prohibited-or-restricted-items/other-items",
-        "airline_code": "DL",
-        "country_code": "US",
-    },
-    # American Airlines
-    # {
-    #     "type": "url",
-    #     "url": "https://www.aa.com/i18n/travel-info/baggage/checked-baggage-policy.jsp",
-    #     "airline_code": "AA",
-    #     "country_code": "US",
-    # },
-    # {
-    #     "type": "url",
-    #     "url": "https://www.aa.com/i18n/travel-info/baggage/carry-on-baggage.jsp",
-    #     "airline_code": "AA",
-    #     "country_code": "US",
-    # },
-    # {
-    #     "type": "url",
-    #     "url": "https://www.aa.com/i18n/travel-info/baggage/delayed-or-damaged-baggage.jsp",
-    #     "airline_code": "AA",
-    #     "country_code": "US",
-    # },
-    # {
-    #     "type": "url",
-    #     "url": "https://www.aa.com/i18n/travel-info/baggage/restricted-items.jsp",
-    #     "airline_code": "AA",
-    #     "country_code": "US",
-    # },
-    # United Airlines
-    {
-        "type": "url",
-        "url": "https://www.united.com/en/us/fly/baggage.html",
-        "airline_code": "UA",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.united.com/en/us/fly/baggage/carry-on-bags.html",
-        "airline_code": "UA",
-        "country_code": "US",
-    },
-    {
-        "type": "url",
-        "url": "https://www.united.com/en/us/fly/help/lost-and-found.html",
-        "airline_code": "UA",
-        "country_code": "US",
-    },
-    # ============================================
-    # CANADA - CATSA
-    # ============================================
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/what-can-bring/carry-or-checked",
-        "country_code": "CA",
-    },
-    {"type": "url", "url": "https://www.catsa-acsta.gc.ca/en/locked-baggage", "country_code": "CA"},
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/what-can-bring/liquids-non-solid-food-personal-items",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/travelling-solid-food-items",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/what-can-bring/item/solid-foods",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/duty-free-purchases",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.catsa-acsta.gc.ca/en/what-can-bring/medication-and-medical-items",
-        "country_code": "CA",
-    },
-    # ============================================
-    # CANADA - Airlines
-    # ============================================
-    # Air Canada
-    {
-        "type": "url",
-        "url": "https://www.aircanada.com/in/en/aco/home/plan/baggage/restricted-and-prohibited-items.html#/",
-        "airline_code": "AC",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.aircanada.com/ca/en/aco/home/plan/baggage/carry-on.html#/",
-        "airline_code": "AC",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.aircanada.com/ca/en/aco/home/plan/baggage/checked.html#/",
-        "airline_code": "AC",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.aircanada.com/ca/en/aco/home/plan/baggage/special-items.html#/",
-        "airline_code": "AC",
-        "country_code": "CA",
-    },
-    {
-        "type": "url",
-        "url": "https://www.aircanada.com/ca/en/aco/home/plan/baggage/delayed-damaged-baggage.html",
-        "airline_code": "AC",
-        "country_code": "CA",
-    },
-    # ============================================
-    # SOUTH KOREA - Airport Authority
-    # ============================================
-    {"type": "url", "url": "https://www.airport.kr/ap_en/1433/subview.do", "country_code": "KR"},
-    {"type": "url", "url": "https://www.airport.kr/ap_en/1434/subview.do", "country_code": "KR"},
-    {
-        "type": "url",
-        "url": "http://german.visitkorea.or.kr/svc/contents/infoHtmlView.do?vcontsId=140628",
-        "country_code": "KR",
-    },
-    # ============================================
-    # SOUTH KOREA - Airlines
-    # ============================================
-    # Korean Air
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/free-baggage",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/restricted-item",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/carry-on-baggage",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/delayed-damaged-lost/delayed-baggage",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/delayed-damaged-lost/damaged-baggage",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    {
-        "type": "url",
-        "url": "https://www.koreanair.com/contents/plan-your-travel/baggage/delayed-damaged-lost/lost-item",
-        "airline_code": "KE",
-        "country_code": "KR",
-    },
-    # ============================================
-    # PDFs
-    # ============================================
-    {
-        "type": "pdf",
-        "path": "./data/documents/south_korea/seat-prices-table-by-route-en.pdf",
-        "country_code": "KR",
-    },
-    {"type": "pdf", "path": "./data/documents/usa/tsa-travel-checklist.pdf", "country_code": "US"},
-]
+async def main(args: argparse.Namespace):
+    # Imported here: ingestion's process pool workers re-import this module on
+    # spawn, and must not build the vector store
+    from app.lib.rag.ingestion import manifest
+    from app.lib.rag.ingestion.core import ingest_documents_batch
+    from app.lib.rag.ingestion.pipeline import source_key
+    from app.lib.rag.ingestion.writer import EmbeddingWriter
 
+    sources = manifest.load_manifest(args.manifest)
+    total = len(sources)
+    sources = manifest.select(sources, shard=args.shard, only=args.only)
+    if args.rebuild:
+        from app.lib.rag.ingestion.jobs import uploaded_sources
+
+        # Not in the manifest, but part of the collection the rebuild replaces
+        listed = {source_key(source) for source in sources}
+        uploads = [source for source in await uploaded_sources() if source_key(source) not in listed]
+        sources += uploads
+        total += len(uploads)
+    last_ingested = {}
+    if args.since or args.dry_run:
+        async with EmbeddingWriter() as writer:
+            last_ingested = await writer.last_ingested()
+    if args.since:
+        sources = [
+            source for source in sources
+            if not (at := last_ingested.get(source_key(source))) or at < args.since
+        ]
+    print(f" {len(sources)} of {total} sources selected\n")
+
+    if args.dry_run:
+        for source in sources:
+            key = source_key(source)
+            at = last_ingested.get(key)
+            fields = {k: v for k, v in source.items() if k not in ("type", "url", "path")}
+            print(f"  {source['type']:<5} {key}  {fields}  last written: {at.isoformat() if at else 'never'}")
+        return
+
+    if args.enqueue:
+        from app.lib.rag.ingestion.jobs import enqueue as enqueue_job
+
+        job_id, created = await enqueue_job(sources, requested_by="cli")
+        print(f" {'Queued' if created else 'A job is already unfinished:'} ingestion job {job_id}")
+        return
 
-async def main():
     print(" Starting document ingestion...\n")
-    print(f" Total sources to process: {len(SOURCES)}\n")
-    await ingest_documents_batch(SOURCES)
+    report = await ingest_documents_batch(sources, rebuild=args.rebuild, fetch_workers=args.concurrency)
+    _print_summary(sources, report["sources"])
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n Report written to {args.report}")
+    if report["failed_sources"]:
+        print(f"\n Ingestion finished, {len(report['failed_sources'])} sources failed")
+        raise SystemExit(1)
     print("\n Ingestion complete!")
 
 
+def _argument(parse):
+    """argparse type that turns the parser's ValueError message into a usage error"""
+    def convert(value):
+        try:
+            return parse(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return convert
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", help="source manifest (default: INGEST_MANIFEST)")
+    parser.add_argument("--shard", help="only shard i of n, as i/n")
+    parser.add_argument("--only", action="append", default=[], metavar="FIELD=VALUE[,VALUE...]",
+                        help="only sources with one of the values; repeatable")
+    parser.add_argument("--since", help="skip sources written since (ISO time or age like 6h, 2d)")
+    parser.add_argument("--concurrency", type=int, default=8, help="sources fetched at once")
+    parser.add_argument("--dry-run", action="store_true", help="list the selected sources and stop")
+    parser.add_argument("--report", help="write the run's report, per source included, as JSON")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rebuild", action="store_true", help="replace the whole collection")
+    mode.add_argument("--enqueue", action="store_true", help="queue a job for the ingestion workers")
+    args = parser.parse_args()
+
+    from app.lib.rag.ingestion.manifest import parse_only, parse_shard, parse_since
+
+    try:
+        args.shard = parse_shard(args.shard) if args.shard else None
+        args.only = parse_only(args.only)
+        args.since = parse_since(args.since) if args.since else None
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rebuild and (args.shard or args.only or args.since):
+        parser.error("--rebuild replaces the whole collection; it can't be combined with --shard, --only or --since")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    asyncio.run(main(args))
@@ -0,0 +1,36 @@
+"""
+Run an ingestion worker outside the API.
+
+    uv run python -m scripts.ingest_worker [--once] [--batch-size 8]
+
+Claims sources of queued ingestion jobs (POST /admin/ingest, or
+scripts.ingest_documents --enqueue) and ingests them, alongside any other
+workers. Run the API with INGEST_WORKER_POLL_SECONDS=0 to leave ingestion
+to dedicated workers. --once exits when nothing is left to claim.
+"""
+
+import argparse
+import asyncio
+
+
+async def main(once: bool = False, batch_size: int | None = None):
+    # Imported here: ingestion's process pool workers re-import this module on
+    # spawn, and must not build the vector store
+    from app.lib.rag.ingestion.jobs import IngestWorker
+    from app.lib.workers import shutdown_executor
+
+    worker = IngestWorker(batch_size=batch_size)
+    print(f"Ingestion worker {worker.name} started")
+    try:
+        processed = await worker.run(once=once)
+    finally:
+        shutdown_executor()
+    print(f"Ingestion worker {worker.name}: no sources left to claim after {processed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="exit when there is nothing to claim")
+    parser.add_argument("--batch-size", type=int, help="sources claimed at a time")
+    args = parser.parse_args()
+    asyncio.run(main(once=args.once, batch_size=args.batch_size))
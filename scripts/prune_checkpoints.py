@@ -0,0 +1,36 @@
+"""
+Run one checkpoint retention sweep by hand.
+
+    uv run python -m scripts.prune_checkpoints [--keep 3] [--anon-ttl-hours 24]
+                                               [--batch-size 200] [--batch-pause 0.5]
+
+Defaults come from the RETENTION_* settings, same as the background sweep the
+API runs every RETENTION_INTERVAL_SECONDS.
+"""
+
+import argparse
+import asyncio
+
+from app.lib.retention import sweep
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", type=int, help="checkpoints to keep per thread")
+    parser.add_argument("--anon-ttl-hours", type=float, help="age after which anonymous threads are deleted")
+    parser.add_argument("--batch-size", type=int, help="threads per page / checkpoints per delete")
+    parser.add_argument("--batch-pause", type=float, help="seconds to sleep between pages")
+    args = parser.parse_args()
+
+    asyncio.run(
+        sweep(
+            keep=args.keep,
+            anon_ttl_hours=args.anon_ttl_hours,
+            batch_size=args.batch_size,
+            batch_pause=args.batch_pause,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()